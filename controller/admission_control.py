@@ -8,8 +8,10 @@ Description: Admission 控制模块
 Copyright (c) 2025 by ${git_name_email}, All Rights Reserved. 
 '''
 # controller/admission_control.py
-from typing import Dict, Tuple, List
-from models import PortState, Flow
+from typing import Callable, Dict, Tuple, List, Optional
+from collections import Counter
+from models import PortState, Flow, TableState
+from exp_logger import get_run_context
 import os
 import time
 
@@ -18,20 +20,38 @@ class AdmissionControl:
     控制器侧的带宽预留账本 + Admission 判断。
     """
 
-    def __init__(self, port_capacity: Dict[Tuple[int, int], int],log_root: str):
+    # per-flow 规则所在的表（与 FlowInstaller.install_flow 保持一致）
+    FLOW_TABLE_ID = 1
+
+    def __init__(self, port_capacity: Dict[Tuple[int, int], int],log_root: str,
+                 table_capacity: Optional[Dict[Tuple[int, int], int]] = None):
         """
-        port_capacity: (dpid, port_no) -> capacity_bps
+        port_capacity : (dpid, port_no) -> capacity_bps
+        table_capacity: (dpid, table_id) -> max_entries，未配置的表不限制
         """
         self.ports: Dict[Tuple[int, int], PortState] = {}
         for (dpid, port), cap in port_capacity.items():
             self.ports[(dpid, port)] = PortState(dpid=dpid, port_no=port, capacity_bps=cap)
+
+        # 端口预留变化回调（预留 / 释放 / 调速后调用，参数是变化后的 PortState），
+        # 目的 host 选择用它维护各 host 入向接入端口的负载和剩余带宽
+        self.port_listeners: List[Callable[[PortState], None]] = []
+
+        # 流表占用账本：(dpid, table_id) -> TableState
+        self.table_capacity: Dict[Tuple[int, int], int] = dict(table_capacity or {})
+        self.tables: Dict[Tuple[int, int], TableState] = {}
+        for (dpid, table_id), max_entries in self.table_capacity.items():
+            self.tables[(dpid, table_id)] = TableState(
+                dpid=dpid, table_id=table_id, max_entries=max_entries)
             
         # --- 日志目录 ---
         self.log_root = log_root or "/home/yc/sdn_qos/logs"
         
-        # 1) 每条流的 PortState 变更日志：Flow_PortState/<flow_id>.log
+        # 1) 每条流的 PortState 变更日志：Flow_PortState/<flow_id>.log，
+        #    run_log_format=segmented 时写进 RunLog/portstate（见 RunContext）
         self.port_log_root = os.path.join(self.log_root, "Flow_PortState")
-        os.makedirs(self.port_log_root, exist_ok=True)
+        self.run_ctx = get_run_context(os.path.dirname(self.log_root),
+                                       os.path.basename(self.log_root))
 
         # 2) 全局端口快照日志：PortSnapshot/port_snapshot.log
         self.port_snapshot_dir = os.path.join(self.log_root, "PortSnapshot")
@@ -50,19 +70,14 @@ class AdmissionControl:
     # ----------------------------------------------------
     # Flow 级的 PortState 日志（Flow_PortState）
     # ----------------------------------------------------
-    def _flow_log_path(self, flow_id: int) -> str:
-        """每个 flow 单独一个日志文件"""
-        return os.path.join(self.port_log_root, f"{flow_id}.log")
-
     def _log_reserve_path(self, flow: Flow, path: List[Tuple[int, int]]):
         """记录某条流在哪条路径上预留了多少带宽"""
-        ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
         path_str = " -> ".join(f"s{dpid}:{port}" for dpid, port in path)
         msg = (
-            f"{ts} [ReservePath] flow={flow.id} class={flow.priority} "
-            f"rate={flow.send_rate_bps} path={path_str}\n"
+            f"[ReservePath] flow={flow.id} class={flow.priority} "
+            f"rate={flow.send_rate_bps} path={path_str}"
         )
-        self._write(self._flow_log_path(flow.id), msg)
+        self.run_ctx.append_port_state(flow.id, [msg])
 
     def _log_port_change(self, flow: Flow, ps: PortState,
                          action: str, delta: int, before: int):
@@ -71,15 +86,14 @@ class AdmissionControl:
         delta : 这次变动的带宽
         before: 操作前 reserved_total_bps
         """
-        ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
         msg = (
-            f"{ts} [{action}] flow={flow.id} class={flow.priority} "
+            f"[{action}] flow={flow.id} class={flow.priority} "
             f"dpid={ps.dpid} port={ps.port_no} delta_bps={delta} "
             f"total_before={before} total_after={ps.reserved_total_bps} "
             f"gold={ps.reserved_gold_bps} silver={ps.reserved_silver_bps} "
-            f"best={ps.reserved_best_bps}\n"
+            f"best={ps.reserved_best_bps}"
         )
-        self._write(self._flow_log_path(flow.id), msg)
+        self.run_ctx.append_port_state(flow.id, [msg])
 
     # ----------------------------------------------------
     # 全局端口快照日志（PortSnapshot）
@@ -109,6 +123,13 @@ class AdmissionControl:
             )
             self._write(self.port_snapshot_log_path, line)
 
+        for dpid, table_id, active, max_entries in self.dump_tables():
+            line = (
+                f"  table s{dpid}:{table_id} active={active} "
+                f"max={max_entries}\n"
+            )
+            self._write(self.port_snapshot_log_path, line)
+
     # ----------------------------------------------------
     # Admission 判断
     # ----------------------------------------------------
@@ -143,31 +164,133 @@ class AdmissionControl:
                 return False, 0,"no_path"
             if not ps.can_reserve(req):
                 return False, 0 ,"no_capacity"
+
+        # 第二个维度：路径上每台交换机 Table 1 是否还有规则空位
+        for dpid, n in Counter(dpid for dpid, _ in path).items():
+            ts = self.tables.get((dpid, self.FLOW_TABLE_ID))
+            if ts is not None and not ts.can_install(n):
+                return False, 0, "no_table_space"
         return True, req ,"ok"
 
+    def path_residual(self, path: List[Tuple[int, int]]) -> int:
+        """路径上各端口剩余可预留带宽的最小值；空路径或有未配置端口时为 0"""
+        if not path:
+            return 0
+        residual = None
+        for dpid, port in path:
+            ps = self.ports.get((dpid, port))
+            if ps is None:
+                return 0
+            free = ps.capacity_bps - ps.reserved_total_bps
+            if residual is None or free < residual:
+                residual = free
+        return max(0, residual)
+
+    def _notify(self, ps: PortState):
+        for fn in self.port_listeners:
+            fn(ps)
+
     def reserve(self, flow: Flow, path: List[Tuple[int, int]]):
         """在路径上的每个端口预留带宽"""
         for dpid, port in path:
             ps = self.ports[(dpid, port)]
             ps.reserve(flow.send_rate_bps, flow.priority)
+            self._notify(ps)
 
     def release(self, flow: Flow):
-        """释放整条路径上的预留（适用于流结束）"""
+        """释放整条路径上的预留（适用于流结束），已逐跳释放过的端口跳过"""
         if not flow.path:
             return
-        for dpid, port in flow.path:
+        for k, (dpid, port) in enumerate(flow.path):
+            # released_hops 里记的是尾部已经经过的 hop，它的前一跳已经 release_single_port 过
+            if k + 1 < len(flow.path) and flow.path[k + 1][0] in flow.released_hops:
+                continue
             ps = self.ports.get((dpid, port))
             if not ps:
                 continue
             ps.release(flow.send_rate_bps, flow.priority)
+            self._notify(ps)
+
+    def _held_ports(self, flow: Flow) -> List[PortState]:
+        """flow 还占着预留的端口（跳过已经逐跳释放的，规则同 release）"""
+        held = []
+        for k, (dpid, port) in enumerate(flow.path):
+            if k + 1 < len(flow.path) and flow.path[k + 1][0] in flow.released_hops:
+                continue
+            ps = self.ports.get((dpid, port))
+            if ps is not None:
+                held.append(ps)
+        return held
+
+    def headroom(self, flow: Flow) -> int:
+        """flow 还占着的端口上最多还能再给它加多少带宽"""
+        held = self._held_ports(flow)
+        if not held:
+            return 0
+        return max(0, min(ps.capacity_bps - ps.reserved_total_bps for ps in held))
+
+    def resize(self, flow: Flow, new_rate_bps: int):
+        """
+        RATE_UPDATE：把 flow 在各端口上的预留从 send_rate_bps 改成 new_rate_bps，
+        并更新 flow.send_rate_bps（之后的 release / release_single_port 按新值还）。
+        提速前调用方先用 headroom() 确认容量。
+        """
+        old = flow.send_rate_bps
+        delta = new_rate_bps - old
+        for ps in self._held_ports(flow):
+            before = ps.reserved_total_bps
+            ps.release(old, flow.priority)
+            ps.reserve(new_rate_bps, flow.priority)
+            self._log_port_change(flow, ps, "PortResize", delta, before)
+            self._notify(ps)
+        flow.send_rate_bps = new_rate_bps
 
     def release_single_port(self, dpid: int, port_no: int, flow: Flow):
         """逐跳释放：只释放一个端口的预留"""
         ps = self.ports.get((dpid, port_no))
         if ps:
             ps.release(flow.send_rate_bps, flow.priority)
+            self._notify(ps)
             
- # ----------------------------------------------------
+    # ----------------------------------------------------
+    # 流表占用账本：FlowInstaller 安装/删除时更新，TableStats 回复时校准
+    # ----------------------------------------------------
+    def _get_table(self, dpid: int, table_id: int) -> TableState:
+        ts = self.tables.get((dpid, table_id))
+        if ts is None:
+            ts = TableState(dpid=dpid, table_id=table_id,
+                            max_entries=self.table_capacity.get((dpid, table_id), 0))
+            self.tables[(dpid, table_id)] = ts
+        return ts
+
+    def table_add(self, dpid: int, table_id: int, n: int = 1):
+        self._get_table(dpid, table_id).add(n)
+
+    def table_remove(self, dpid: int, table_id: int, n: int = 1):
+        self._get_table(dpid, table_id).remove(n)
+
+    def reset_tables(self, dpid: int):
+        """交换机重连并清空流表后，把该 dpid 的计数归零"""
+        for (d, _table_id), ts in self.tables.items():
+            if d == dpid:
+                ts.active_count = 0
+
+    def reconcile_table(self, dpid: int, table_id: int, active_count: int):
+        """以交换机 OFPTableStats 上报的 active_count 为准校准本地计数"""
+        ts = self._get_table(dpid, table_id)
+        if ts.active_count != active_count:
+            ts.active_count = active_count
+            return True
+        return False
+
+    def dump_tables(self) -> List[Tuple[int, int, int, int]]:
+        """返回所有流表的占用信息 (dpid, table_id, active_count, max_entries)"""
+        return [
+            (dpid, table_id, ts.active_count, ts.max_entries)
+            for (dpid, table_id), ts in sorted(self.tables.items())
+        ]
+
+    # ----------------------------------------------------
     # dump_book（给 StatsCollector 原来的 _print_port_book 用）
     # ----------------------------------------------------
     def dump_book(self) -> List[Tuple[int, int, int, int, int]]:
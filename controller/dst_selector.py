@@ -0,0 +1,198 @@
+'''
+Author: yc && qq747339545@163.com
+Date: 2025-12-04 10:18:33
+LastEditTime: 2025-12-04 10:18:33
+FilePath: /sdn_qos/controller/dst_selector.py
+Description: 目的 host 选择（按入向预留带宽 / 接入端口剩余带宽）
+
+Copyright (c) 2025 by ${git_name_email}, All Rights Reserved.
+'''
+# controller/dst_selector.py
+import heapq
+import random
+from typing import Dict, List, Optional, Tuple
+
+
+class DstSelector:
+    """
+    维护已注册 host 的索引和每个 host 的入向负载，挑目的 host 时不拷贝 host 表、不临时查路径：
+      - _ips / _pos  : 数组 + 下标表，O(1) 均匀随机采样、O(1) 交换删除
+      - _load        : host -> 入向已预留带宽 (bps)，admission 真正预留时才计入
+      - _residual    : host -> 入向接入端口（路径最后一跳）剩余可预留带宽 (bps)
+      - _pending     : host -> 选了它当目的、还在 pending 的 flow 请求带宽 (bps)
+      - _heap        : (load, pending, ver, ip) 小根堆，变化时压入新条目，旧条目惰性丢弃
+
+    _load / _residual 由 set_port_state() 从带宽账本推过来（预留 / 释放 / 调速都会更新），
+    pending 的 flow 不占 _load，只在负载相同时作为次要比较项，避免长时间排队的 flow 把 host 一直压着。
+
+    模式：
+      - random       : 均匀随机（原来的行为）
+      - p2c          : 随机抽两个，选更好的那个（power of two choices）
+      - least_loaded : 入向负载最小的 host
+
+    入向剩余带宽已知时优先选剩余 >= need_bps 的 host，都不满足再按负载选。
+    """
+
+    MODES = ("random", "p2c", "least_loaded")
+    # least_loaded 最多看堆顶这么多个有效候选去找满足剩余带宽的
+    PROBE = 8
+
+    def __init__(self, mode: str = "p2c", rng: Optional[random.Random] = None):
+        if mode not in self.MODES:
+            raise ValueError(f"unknown dst_select mode: {mode}")
+        self.mode = mode
+        self._rng = rng or random.Random()
+
+        self._ips: List[str] = []
+        self._pos: Dict[str, int] = {}
+        self._load: Dict[str, int] = {}
+        self._residual: Dict[str, int] = {}
+        self._pending: Dict[str, int] = {}
+        self._heap: List[Tuple[int, int, int, str]] = []
+        self._ver: Dict[str, int] = {}
+        self._seq = 0
+
+    def __len__(self) -> int:
+        return len(self._ips)
+
+    def __contains__(self, ip: str) -> bool:
+        return ip in self._pos
+
+    # ---------------- host 增删 ----------------
+
+    def add(self, ip: str):
+        if ip in self._pos:
+            return
+        self._pos[ip] = len(self._ips)
+        self._ips.append(ip)
+        self._load.setdefault(ip, 0)
+        self._push(ip)
+
+    def remove(self, ip: str):
+        idx = self._pos.pop(ip, None)
+        if idx is None:
+            return
+        last = self._ips.pop()
+        if idx < len(self._ips):
+            self._ips[idx] = last
+            self._pos[last] = idx
+        # 负载保留：host 重新注册时还没结束的流仍然算在它头上；堆条目惰性丢弃
+        self._ver.pop(ip, None)
+
+    # ---------------- 入向负载 ----------------
+
+    def load(self, ip: str) -> int:
+        return self._load.get(ip, 0)
+
+    def pending(self, ip: str) -> int:
+        return self._pending.get(ip, 0)
+
+    def residual(self, ip: str) -> Optional[int]:
+        return self._residual.get(ip)
+
+    def set_port_state(self, ip: str, reserved_bps: int, residual_bps: int):
+        """带宽账本里 ip 的入向接入端口变了：已预留 / 剩余带宽直接覆盖"""
+        self._load[ip] = reserved_bps
+        self._residual[ip] = residual_bps
+        if ip in self._pos:
+            self._push(ip)
+
+    def add_load(self, ip: str, bps: int):
+        """没有接入端口信息时手动记入向负载（基准 / 拓扑里没配置路径的 host）"""
+        self._load[ip] = self._load.get(ip, 0) + bps
+        if ip in self._pos:
+            self._push(ip)
+
+    def release_load(self, ip: str, bps: int):
+        if ip not in self._load:
+            return
+        self._load[ip] = max(0, self._load[ip] - bps)
+        if ip in self._pos:
+            self._push(ip)
+
+    def add_pending(self, ip: str, bps: int):
+        self._pending[ip] = self._pending.get(ip, 0) + bps
+        if ip in self._pos:
+            self._push(ip)
+
+    def release_pending(self, ip: str, bps: int):
+        left = self._pending.get(ip, 0) - bps
+        if left > 0:
+            self._pending[ip] = left
+        else:
+            self._pending.pop(ip, None)
+        if ip in self._pos:
+            self._push(ip)
+
+    def _push(self, ip: str):
+        self._seq += 1
+        self._ver[ip] = self._seq
+        heapq.heappush(self._heap, (self._load.get(ip, 0), self._pending.get(ip, 0), self._seq, ip))
+        # 过期条目太多时整体重建，摊还 O(1)
+        if len(self._heap) > 2 * len(self._ips) + 64:
+            self._heap = [(self._load.get(h, 0), self._pending.get(h, 0), self._ver[h], h)
+                          for h in self._ips]
+            heapq.heapify(self._heap)
+
+    def _valid(self, entry) -> bool:
+        ver, ip = entry[2], entry[3]
+        return self._ver.get(ip) == ver
+
+    # ---------------- 选择 ----------------
+
+    def _sample(self, src_ip: str, k: int) -> List[str]:
+        """从除 src_ip 外的 host 里不放回地均匀抽 k 个（k 很小）"""
+        n = len(self._ips)
+        skip = self._pos.get(src_ip)
+        m = n - 1 if skip is not None else n
+        if m <= 0:
+            return []
+        picked: List[str] = []
+        seen = set()
+        for _ in range(min(k, m)):
+            while True:
+                idx = self._rng.randrange(m)
+                if skip is not None and idx >= skip:
+                    idx += 1
+                if idx not in seen:
+                    break
+            seen.add(idx)
+            picked.append(self._ips[idx])
+        return picked
+
+    def _key(self, ip: str, need_bps: int):
+        residual = self._residual.get(ip)
+        short = residual is not None and residual < need_bps
+        return short, self._load.get(ip, 0), self._pending.get(ip, 0)
+
+    def pick(self, src_ip: str, need_bps: int = 0) -> Optional[str]:
+        if self.mode == "random":
+            picked = self._sample(src_ip, 1)
+            return picked[0] if picked else None
+        if self.mode == "p2c":
+            picked = self._sample(src_ip, 2)
+            if not picked:
+                return None
+            return min(picked, key=lambda ip: self._key(ip, need_bps))
+        return self._pick_least_loaded(src_ip, need_bps)
+
+    def _pick_least_loaded(self, src_ip: str, need_bps: int) -> Optional[str]:
+        heap = self._heap
+        taken = []
+        best = None
+        while heap and len(taken) < self.PROBE:
+            entry = heapq.heappop(heap)
+            if not self._valid(entry):
+                continue
+            taken.append(entry)
+            ip = entry[3]
+            if ip == src_ip:
+                continue
+            if best is None:
+                best = ip
+            if not self._key(ip, need_bps)[0]:
+                best = ip
+                break
+        for entry in taken:
+            heapq.heappush(heap, entry)
+        return best
@@ -0,0 +1,170 @@
+'''
+Author: yc && qq747339545@163.com
+Date: 2025-12-05 16:03:18
+LastEditTime: 2025-12-05 16:03:18
+FilePath: /sdn_qos/controller/events.py
+Description: 结构化事件日志（QueueHandler / QueueListener，按类别采样和限速）
+
+Copyright (c) 2025 by ${git_name_email}, All Rights Reserved.
+'''
+# controller/events.py
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+from exp_logger import JSONFormatter
+
+# 事件类别：
+#   flow      : flow 生命周期（created / allowed / finished / failed）
+#   admission : 调度循环里每个 pending flow 的准入判断（热路径，默认要采样 / 限速）
+#   install   : per-flow 规则下发 / 删除
+#   release   : 带宽 / 端口释放（整条路径、逐跳尾部释放）
+#   host      : 发给 agent 的 PERMIT / FLOW_PREPARE / STOP / RATE_UPDATE
+#   rate      : 活跃 flow 的速率调整
+CATEGORIES = ("flow", "admission", "install", "release", "host", "rate")
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    标准 QueueHandler.prepare() 会在调用方线程里先 format 一遍（为了能 pickle）；
+    这里队列只在进程内用，原样把 record 放进去，格式化全部留给 listener 线程。
+    """
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        # 队列满了丢弃计数，不阻塞调用方，也不走 handleError 打 traceback
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Bucket:
+    """每类事件一个令牌桶：rate 个/秒，最多攒 burst 个"""
+
+    __slots__ = ("rate", "burst", "tokens", "last", "suppressed")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.suppressed = 0
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        self.suppressed += 1
+        return False
+
+
+class EventLog:
+    """
+    结构化事件：emit(category, event, **fields)。
+
+    调用方线程只做采样 / 限速判断和构造一个 LogRecord 放进队列，
+    JSON 序列化和写文件都在 QueueListener 的线程里做（ryu-manager 打了 eventlet 补丁时
+    它是一个 green thread，也不占调度循环）。事件写到 <log_root>/Events/events.jsonl，
+    每行 {"ts", "level", "name", "message"=event, "category", 各字段...}。
+
+    sample    : {category: 0~1}，按比例随机保留，WARNING 及以上不采样
+    rate_limit: {category: 每秒上限}，超出的丢弃并计数，下一条放行的事件带上 suppressed=n
+    """
+
+    def __init__(self, log_root: str, sample: Optional[Dict[str, float]] = None,
+                 rate_limit: Optional[Dict[str, float]] = None, queue_size: int = 100000,
+                 enabled: bool = True):
+        self.enabled = enabled
+        self.sample = {k: float(v) for k, v in (sample or {}).items()}
+        self._buckets = {k: _Bucket(float(v), max(1.0, float(v)))
+                         for k, v in (rate_limit or {}).items() if v}
+        self._bucket_lock = threading.Lock()
+        self.sampled_out: Dict[str, int] = {}
+
+        self.logger = logging.getLogger("sdn_qos.events")
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+        self._listener = None
+        if not enabled:
+            return
+
+        events_dir = os.path.join(log_root, "Events")
+        os.makedirs(events_dir, exist_ok=True)
+        self.path = os.path.join(events_dir, "events.jsonl")
+        file_handler = logging.FileHandler(self.path, encoding="utf-8")
+        file_handler.setFormatter(JSONFormatter())
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._handler = _DeferredQueueHandler(self._queue)
+        self.logger.handlers = [self._handler]
+        self._listener = logging.handlers.QueueListener(
+            self._queue, file_handler, respect_handler_level=False)
+        self._listener.start()
+
+    @classmethod
+    def from_config(cls, log_root: str, cfg: Optional[dict]) -> "EventLog":
+        cfg = cfg or {}
+        return cls(log_root,
+                   sample=cfg.get("sample"),
+                   rate_limit=cfg.get("rate_limit"),
+                   queue_size=int(cfg.get("queue_size", 100000)),
+                   enabled=bool(cfg.get("enabled", True)))
+
+    def _admit(self, category: str, level: int) -> Optional[int]:
+        """决定这条事件要不要记；要记的话返回附带的 suppressed 数（可能为 0）"""
+        if level < logging.WARNING:
+            p = self.sample.get(category)
+            if p is not None and p < 1.0 and random.random() >= p:
+                self.sampled_out[category] = self.sampled_out.get(category, 0) + 1
+                return None
+        bucket = self._buckets.get(category)
+        if bucket is None:
+            return 0
+        with self._bucket_lock:
+            if not bucket.take():
+                return None
+            n, bucket.suppressed = bucket.suppressed, 0
+        return n
+
+    def emit(self, category: str, event: str, level: int = logging.INFO, **fields):
+        if not self.enabled:
+            return
+        suppressed = self._admit(category, level)
+        if suppressed is None:
+            return
+        fields["category"] = category
+        if suppressed:
+            fields["suppressed"] = suppressed
+        record = self.logger.makeRecord(self.logger.name, level, "(event)", 0,
+                                        event, None, None, extra={"extra": fields})
+        self._handler.handle(record)
+
+    def warning(self, category: str, event: str, **fields):
+        self.emit(category, event, level=logging.WARNING, **fields)
+
+    def stats(self) -> dict:
+        with self._bucket_lock:
+            suppressed = {k: b.suppressed for k, b in self._buckets.items() if b.suppressed}
+        return {"sampled_out": dict(self.sampled_out), "suppressed": suppressed,
+                "dropped_full": self._handler.dropped if self.enabled else 0}
+
+    def stop(self):
+        """把队列里剩下的事件写完再停"""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
@@ -12,30 +12,39 @@ import logging
 import logging.handlers
 import json
 import time
-from typing import Optional, Dict,Union
+from typing import Optional, Dict,Union, Tuple
 import os
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
-from datetime import datetime
-import os
-1
+
+
+# LogRecord 自带的属性，其余的都是调用方通过 extra={...} 塞进来的字段
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
 
 
 class JSONFormatter(logging.Formatter):
     def format(self, record):
         base = {
             "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)),
+            "t": round(record.created, 6),
             "level": record.levelname,
             "name": record.name,
             "message": record.getMessage(),
         }
-        # allow extra fields passed via logger.bind(...)
-        if hasattr(record, "extra") and isinstance(record.extra, dict):
-            base.update(record.extra)
+        # logger.info(msg, extra={"k": v}) 的字段直接展开；
+        # extra={"extra": {...}} 的写法（字段名可能和 LogRecord 属性冲突时用）也展开
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key != "extra":
+                base[key] = value
+        extra = getattr(record, "extra", None)
+        if isinstance(extra, dict):
+            base.update(extra)
         # include exception info if exists
         if record.exc_info:
             base["exc_info"] = self.formatException(record.exc_info)
-        return json.dumps(base, ensure_ascii=False)
+        return json.dumps(base, ensure_ascii=False, default=str)
 
 
 def alloc_run_id(base_dir: str = "/home/yc/sdn_qos/logs"):
@@ -68,45 +77,215 @@ def alloc_run_id(base_dir: str = "/home/yc/sdn_qos/logs"):
     run_id = f"{today}_{next_idx}"
     run_dir = os.path.join(base_dir, run_id)
     os.makedirs(run_dir, exist_ok=True)
+    # 新 run 成为“最新”，get_run_context(base_dir) 不用再扫目录
+    _LATEST_RUN[str(base_dir)] = run_id
     return run_id, run_dir
 
+def _latest_run_id(base_dir: Path) -> str:
+    """base_dir 下最新的 YYYYMMDD_N 目录名；没有就按当前时间生成一个"""
+    valid_dirs = []
+    for d in os.listdir(base_dir):
+        if '_' in d and os.path.isdir(base_dir / d):
+            date_part, _, idx = d.partition('_')
+            if len(date_part) == 8 and date_part.isdigit() and idx.isdigit():
+                valid_dirs.append(d)
+    if valid_dirs:
+        # 先按日期，再按序号
+        valid_dirs.sort(key=lambda x: (x[:8], int(x.split('_')[1])))
+        return valid_dirs[-1]
+    return datetime.now().strftime("%Y%m%d-%H%M%S")
+
+
+class RunWriter:
+    """
+    一个 run 共用的追加写：按路径缓存打开的文件句柄（LRU，最多 max_open 个），
+    每次写完 flush，画图脚本 tail 日志时能马上看到。多线程并发写同一个 run 共用这一把锁。
+    """
+
+    def __init__(self, max_open: int = 128):
+        self.max_open = max_open
+        self._lock = threading.Lock()
+        self._files: "OrderedDict[str, object]" = OrderedDict()
+
+    def append(self, path: Union[str, Path], text: str):
+        key = str(path)
+        with self._lock:
+            f = self._files.get(key)
+            if f is None:
+                f = open(key, "a", encoding="utf-8")
+                self._files[key] = f
+                if len(self._files) > self.max_open:
+                    _old, old_f = self._files.popitem(last=False)
+                    old_f.close()
+            else:
+                self._files.move_to_end(key)
+            f.write(text)
+            f.flush()
+
+    def close(self):
+        with self._lock:
+            for f in self._files.values():
+                f.close()
+            self._files.clear()
+
+
+class RunContext:
+    """
+    一个实验 run 的目录上下文：run_dir 只解析一次，子目录第一次用到时才 mkdir，之后走缓存。
+    用 get_run_context() 取，同一进程内相同 (base_dir, run_id) 拿到的是同一个对象。
+
+    log_format:
+      dirs      : 每条 flow 一个 FlowProgress/<id>/progress.log、Flow_PortState/<id>.log（原来的布局）
+      segmented : 所有 flow 追加进 RunLog/<stream>/ 下的段文件 + 索引（run_log.RunLog），
+                  文件数和 flow 数无关，用 run_log.RunLogReader 按 flow_id 读
+    """
+
+    LOG_FORMATS = ("dirs", "segmented")
+    # 已 mkdir 目录的缓存上限：每条 flow 都有自己的子目录，满了整体清空，之后重新 mkdir(exist_ok) 一次
+    MAX_CACHED_DIRS = 4096
+
+    def __init__(self, base_dir: Union[str, Path], run_id: str, log_format: str = "dirs"):
+        if log_format not in self.LOG_FORMATS:
+            raise ValueError(f"unknown run_log_format {log_format}")
+        self.base_dir = Path(base_dir)
+        self.run_id = run_id
+        self.run_dir = self.base_dir / run_id
+        self.log_format = log_format
+        self.writer = RunWriter()
+        self._dirs_lock = threading.Lock()
+        self._dirs = set()
+        self._streams: Dict[str, object] = {}
+        self._streams_lock = threading.Lock()
+        self.ensure_dir()
+
+    def stream(self, name: str):
+        """segmented 模式下的日志流 RunLog/<name>/，第一次用到时打开"""
+        log = self._streams.get(name)
+        if log is None:
+            from run_log import RunLog
+            with self._streams_lock:
+                log = self._streams.get(name)
+                if log is None:
+                    log = RunLog(str(self.ensure_dir("RunLog", name)))
+                    self._streams[name] = log
+        return log
+
+    def _append_flow_lines(self, stream: str, path_fn, flow_id: Union[int, str], lines,
+                           ts: Optional[str] = None):
+        if self.log_format == "segmented":
+            self.stream(stream).append_lines(int(flow_id), list(lines))
+            return
+        ts = ts or time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        self.append(path_fn(flow_id), "".join(f"{ts} {line}\n" for line in lines))
+
+    def ensure_dir(self, *parts) -> Path:
+        """run_dir/<parts...>，保证目录存在；同一路径只 mkdir 一次"""
+        d = self.run_dir.joinpath(*parts) if parts else self.run_dir
+        if d not in self._dirs:
+            d.mkdir(parents=True, exist_ok=True)
+            with self._dirs_lock:
+                if len(self._dirs) >= self.MAX_CACHED_DIRS:
+                    self._dirs.clear()
+                self._dirs.add(d)
+        return d
+
+    def append(self, path: Union[str, Path], text: str):
+        self.writer.append(path, text)
+
+    def close(self):
+        """关掉缓存的文件句柄和日志流、清空目录缓存；之后再写会按需重新打开"""
+        self.writer.close()
+        with self._streams_lock:
+            streams, self._streams = self._streams, {}
+        for log in streams.values():
+            log.close()
+        with self._dirs_lock:
+            self._dirs.clear()
+
+    # ---------- FlowProgress 日志 ----------
+
+    def flow_progress_log_path(self, flow_id: Union[int, str]) -> Path:
+        """<run_dir>/FlowProgress/<flow_id>/progress.log"""
+        return self.ensure_dir("FlowProgress", str(flow_id)) / "progress.log"
+
+    def append_flow_progress(self, flow_id: Union[int, str], lines, ts: Optional[str] = None):
+        """给 flow 的 progress 日志追加若干行，每行前面带同一个时间戳"""
+        self._append_flow_lines("progress", self.flow_progress_log_path, flow_id, lines, ts)
+
+    # ---------- Flow_PortState 日志 ----------
+
+    def port_state_log_path(self, flow_id: Union[int, str]) -> Path:
+        """<run_dir>/Flow_PortState/<flow_id>.log"""
+        return self.ensure_dir("Flow_PortState") / f"{flow_id}.log"
+
+    def append_port_state(self, flow_id: Union[int, str], lines, ts: Optional[str] = None):
+        self._append_flow_lines("portstate", self.port_state_log_path, flow_id, lines, ts)
+
+    # ---------- iperf 日志 ----------
+
+    def iperf_flow_dir(self, flow_id: Union[int, str], src_ip: str, dst_ip: str) -> Path:
+        """<run_dir>/iperf/<flow_id>:<src>_to_<dst>/"""
+        return self.ensure_dir("iperf", f"{flow_id}:{src_ip}_to_{dst_ip}")
+
+    def iperf_client_log_path(self, flow_id: Union[int, str], src_ip: str, dst_ip: str) -> Path:
+        return self.iperf_flow_dir(flow_id, src_ip, dst_ip) / "client.log"
+
+    def iperf_server_log_path(self, flow_id: Union[int, str], src_ip: str, dst_ip: str) -> Path:
+        return self.iperf_flow_dir(flow_id, src_ip, dst_ip) / "server.log"
+
+
+# 按创建顺序排列；agent 进程跨很多个 run 常驻，只留最近 MAX_RUN_CONTEXTS 个，更早的关掉句柄后丢弃
+_RUN_CONTEXTS: "OrderedDict[Tuple[str, str], RunContext]" = OrderedDict()
+_LATEST_RUN: Dict[str, str] = {}
+_RUN_CONTEXTS_LOCK = threading.Lock()
+MAX_RUN_CONTEXTS = 4
+
+
+def get_run_context(base_dir: Union[str, Path] = "/home/yc/sdn_qos/logs",
+                    run_id: Optional[str] = None,
+                    log_format: Optional[str] = None) -> RunContext:
+    """
+    进程级缓存：(base_dir, run_id) -> RunContext。
+    run_id=None 时取 base_dir 下最新的 run，目录只扫描一次。
+    log_format 只在第一次创建时生效（控制器启动时按 run_log_format 配置创建），之后的调用不用传。
+    缓存超过 MAX_RUN_CONTEXTS 个 run 时关掉最早创建的那个；还拿着它的调用方继续写会重新打开文件。
+    """
+    base = str(base_dir)
+    ctx = _RUN_CONTEXTS.get((base, run_id)) if run_id is not None else None
+    if ctx is not None:
+        return ctx
+    evicted = []
+    with _RUN_CONTEXTS_LOCK:
+        if run_id is None:
+            run_id = _LATEST_RUN.get(base)
+            if run_id is None:
+                Path(base).mkdir(parents=True, exist_ok=True)
+                run_id = _latest_run_id(Path(base))
+                _LATEST_RUN[base] = run_id
+        ctx = _RUN_CONTEXTS.get((base, run_id))
+        if ctx is None:
+            ctx = RunContext(base, run_id, log_format or "dirs")
+            _RUN_CONTEXTS[(base, run_id)] = ctx
+            while len(_RUN_CONTEXTS) > MAX_RUN_CONTEXTS:
+                evicted.append(_RUN_CONTEXTS.popitem(last=False)[1])
+    for old in evicted:
+        old.close()
+    return ctx
+
+
 class ExperimentLogger:
     def __init__(self,
                  base_dir: str = "/home/yc/sdn_qos/logs",
                  run_id:  Optional[str] = None):
         """
         base_dir: 日志根目录
-        run_id  : 实验ID，不传的话用当前时间戳生成
+        run_id  : 实验ID，不传的话取 base_dir 下最新的 run
+        目录解析和 mkdir 都走 get_run_context() 的缓存，反复构造不再扫描 / 建目录。
         """
-        self.base_dir = Path(base_dir)
-        self.base_dir.mkdir(parents=True, exist_ok=True)  # 确保目录存在
-
-        if run_id is None:
-             # 获取所有子目录
-            subdirs = [d for d in os.listdir(self.base_dir) 
-                      if os.path.isdir(self.base_dir / d)]
-            
-            # 按目录名排序（按时间顺序，最新在最后）
-            # 1. 过滤出符合格式的目录（格式：YYYYMMDD-数字）
-            # 2. 按日期和序号排序
-            valid_dirs = []
-            for d in subdirs:
-                if '_' in d:
-                    date_part = d.split('_')[0]
-                    if len(date_part) == 8 and date_part.isdigit():
-                        valid_dirs.append(d)
-            
-            if valid_dirs:
-                # 按日期和序号排序（先按日期，再按序号）
-                valid_dirs.sort(key=lambda x: (x[:8], int(x.split('_')[1])))
-                run_id = valid_dirs[-1]  # 最后一个就是最新
-            else:
-                # 生成新的run_id（格式：YYYYMMDD-HHMMSS）
-                run_id = datetime.now().strftime("%Y%m%d-%H%M%S")
-
-        self.run_id = run_id
-        self.run_dir = self.base_dir / self.run_id
-        self.run_dir.mkdir(parents=True, exist_ok=True)
+        self.ctx = get_run_context(base_dir, run_id)
+        self.base_dir = self.ctx.base_dir
+        self.run_id = self.ctx.run_id
+        self.run_dir = self.ctx.run_dir
 
     # ---------- FlowProgress 日志 ----------
 
@@ -114,9 +293,7 @@ class ExperimentLogger:
         """
         /home/yc/sdn_qos/logs/<run_id>/FlowProgress/<flow_id>/progress.log
         """
-        flow_dir = self.run_dir / "FlowProgress" / str(flow_id)
-        flow_dir.mkdir(parents=True, exist_ok=True)
-        return flow_dir / "progress.log"
+        return self.ctx.flow_progress_log_path(flow_id)
 
     # ---------- iperf 日志 ----------
 
@@ -126,10 +303,7 @@ class ExperimentLogger:
         """
         /home/yc/sdn_qos/logs/<run_id>/iperf/<flow_id>:<src>_to_<dst>/
         """
-        dir_name = f"{flow_id}:{src_ip}_to_{dst_ip}"
-        flow_dir = self.run_dir / "iperf" / dir_name
-        flow_dir.mkdir(parents=True, exist_ok=True)
-        return flow_dir
+        return self.ctx.iperf_flow_dir(flow_id, src_ip, dst_ip)
 
     def iperf_client_log_path(self, flow_id: Union[int, str],
                               src_ip: str,
@@ -137,8 +311,7 @@ class ExperimentLogger:
         """
         client.log 路径
         """
-        flow_dir = self._iperf_flow_dir(flow_id, src_ip, dst_ip)
-        return flow_dir / "client.log"
+        return self.ctx.iperf_client_log_path(flow_id, src_ip, dst_ip)
 
     def iperf_server_log_path(self, flow_id: Union[int, str],
                               src_ip: str,
@@ -146,6 +319,4 @@ class ExperimentLogger:
         """
         server.log 路径（如果你在 server 端也按流切日志）
         """
-        flow_dir = self._iperf_flow_dir(flow_id, src_ip, dst_ip)
-        return flow_dir / "server.log"
-
+        return self.ctx.iperf_server_log_path(flow_id, src_ip, dst_ip)
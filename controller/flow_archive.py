@@ -0,0 +1,315 @@
+'''
+Author: yc && qq747339545@163.com
+Date: 2025-12-03 10:26:51
+LastEditTime: 2025-12-03 10:26:51
+FilePath: /sdn_qos/controller/flow_archive.py
+Description: 已结束 flow 的列式归档（追加写二进制文件 + 索引）
+
+Copyright (c) 2025 by ${git_name_email}, All Rights Reserved.
+'''
+# controller/flow_archive.py
+import bisect
+import json
+import os
+import socket
+import struct
+import sys
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from models import Flow
+
+
+# 列：(列名, array typecode)，每列一个定长小端文件 <列名>.col，第 i 行就是第 i 条归档 flow
+COLUMNS = (
+    ("id", "Q"),
+    ("src_ip", "I"),
+    ("dst_ip", "I"),
+    ("priority", "B"),
+    ("status", "B"),
+    ("size_bytes", "Q"),
+    ("request_rate_bps", "Q"),
+    ("send_rate_bps", "Q"),
+    ("created_at", "d"),
+    ("allowed_at", "d"),
+    ("finished_at", "d"),
+    ("path_id", "I"),
+)
+COLUMN_NAMES = tuple(name for name, _ in COLUMNS)
+
+STATUS_CODES = {"pending": 0, "allowed": 1, "active": 2, "finished": 3, "failed": 4}
+STATUS_NAMES = {v: k for k, v in STATUS_CODES.items()}
+
+# 尾部未排序索引攒到这么多条再合并进有序数组
+_TAIL_MERGE = 4096
+# 写缓冲攒到这么多行再落盘（flush() 也会落盘）
+_WRITE_ROWS = 4096
+
+_BIG_ENDIAN = sys.byteorder == "big"
+
+
+def _ip_to_u32(ip: str) -> int:
+    try:
+        return struct.unpack("!I", socket.inet_aton(ip))[0]
+    except (OSError, TypeError):
+        return 0
+
+
+def _u32_to_ip(v: int) -> str:
+    return socket.inet_ntoa(struct.pack("!I", v))
+
+
+class FlowArchive:
+    """
+    <log_root>/FlowArchive/
+      <列名>.col   : 每列一个只追加的定长数组文件（COLUMNS），按行号对齐
+      paths.jsonl  : path_id -> [[dpid, port], ...]，每个不同的路径只写一次
+
+    按列存：重建索引只读 id 列，离线统计（完成时间、各类速率）也只读用到的列。
+    新归档的行先进内存写缓冲，攒够 _WRITE_ROWS 行按列追加到文件；
+    查询时还在缓冲里的行直接从内存取，落盘的行用常开的只读句柄按 行号 * 列宽 seek。
+
+    索引：flow_id -> 行号，存成若干个有序 run（每个 run 两个 array('Q')，每条 16 字节）。
+    新归档的先进一个小的尾部 dict，攒够 _TAIL_MERGE 条排序成一个 run；
+    相邻 run 大小相当时合并（类似 LSM），查询在每个 run 上 bisect。
+    """
+
+    def __init__(self, log_root: str):
+        self.root = os.path.join(log_root, "FlowArchive")
+        os.makedirs(self.root, exist_ok=True)
+        self.paths_path = os.path.join(self.root, "paths.jsonl")
+
+        self._path_ids: Dict[tuple, int] = {}
+        self._paths: List[tuple] = []
+        self._load_paths()
+
+        # 各列落盘行数取最小值；崩溃时各列可能没写齐，多出来的截掉保持对齐；
+        # path_id 指向 paths.jsonl 里没有的路径的行（路径没落盘）也截掉
+        self._flushed = min(self._disk_rows(name, code) for name, code in COLUMNS)
+        self._flushed = self._valid_path_rows(self._flushed)
+        for name, code in COLUMNS:
+            path = self.col_path(name)
+            if os.path.exists(path) and self._disk_rows(name, code) > self._flushed:
+                os.truncate(path, self._flushed * array(code).itemsize)
+
+        self._writers = {name: open(self.col_path(name), "ab") for name in COLUMN_NAMES}
+        self._readers: Dict[str, object] = {}
+        self._buf: Dict[str, array] = {name: array(code) for name, code in COLUMNS}
+        self._paths_f = open(self.paths_path, "a", encoding="utf-8")
+        self._count = self._flushed
+
+        self._runs: List[Tuple[array, array]] = []
+        self._tail: Dict[int, int] = {}
+        if self._count:
+            self._rebuild_index()
+
+    def col_path(self, name: str) -> str:
+        return os.path.join(self.root, f"{name}.col")
+
+    def _disk_rows(self, name: str, code: str) -> int:
+        path = self.col_path(name)
+        if not os.path.exists(path):
+            return 0
+        return os.path.getsize(path) // array(code).itemsize
+
+    def disk_bytes(self) -> int:
+        return sum(os.path.getsize(self.col_path(name)) for name in COLUMN_NAMES
+                   if os.path.exists(self.col_path(name)))
+
+    def _load_paths(self):
+        """读 paths.jsonl；崩溃时写了一半的最后一行截掉，之后的追加从整行边界开始"""
+        if not os.path.exists(self.paths_path):
+            return
+        good = 0
+        with open(self.paths_path, "rb") as f:
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                line = raw.strip()
+                if line:
+                    try:
+                        hops = json.loads(line)["path"]
+                    except (ValueError, KeyError):
+                        break
+                    path = tuple((int(d), int(p)) for d, p in hops)
+                    self._path_ids[path] = len(self._paths)
+                    self._paths.append(path)
+                good += len(raw)
+        if good < os.path.getsize(self.paths_path):
+            os.truncate(self.paths_path, good)
+
+    def _valid_path_rows(self, rows: int) -> int:
+        """前 rows 行里第一条 path_id 越界的行号（都有效就是 rows）"""
+        if not rows:
+            return 0
+        col = array(dict(COLUMNS)["path_id"])
+        with open(self.col_path("path_id"), "rb") as f:
+            col.frombytes(f.read(rows * col.itemsize))
+        if _BIG_ENDIAN:
+            col.byteswap()
+        n_paths = len(self._paths)
+        for i, pid in enumerate(col):
+            if pid >= n_paths:
+                return i
+        return rows
+
+    def _rebuild_index(self):
+        """进程重启后只读 id 列恢复索引"""
+        ids = self.column("id")
+        self._runs = [self._make_run(sorted(zip(ids, range(len(ids)))))]
+
+    @staticmethod
+    def _make_run(pairs) -> Tuple[array, array]:
+        return array("Q", (fid for fid, _ in pairs)), array("Q", (rec for _, rec in pairs))
+
+    def _merge_tail(self):
+        self._runs.append(self._make_run(sorted(self._tail.items())))
+        self._tail.clear()
+        # 最后两个 run 大小相当就合并，保证 run 个数 O(log n)
+        while len(self._runs) >= 2 and len(self._runs[-1][0]) >= len(self._runs[-2][0]):
+            ids_b, recs_b = self._runs.pop()
+            ids_a, recs_a = self._runs.pop()
+            # 两段各自有序，timsort 合并是线性的
+            pairs = sorted(list(zip(ids_a, recs_a)) + list(zip(ids_b, recs_b)))
+            self._runs.append(self._make_run(pairs))
+
+    def _path_id(self, path) -> int:
+        key = tuple((int(d), int(p)) for d, p in path)
+        pid = self._path_ids.get(key)
+        if pid is None:
+            pid = len(self._paths)
+            self._path_ids[key] = pid
+            self._paths.append(key)
+            self._paths_f.write(json.dumps({"path_id": pid, "path": key}) + "\n")
+        return pid
+
+    # ---------------- 写入 ----------------
+
+    def append(self, flow: Flow) -> int:
+        """归档一条 flow，返回行号"""
+        row = (
+            flow.id,
+            _ip_to_u32(flow.src_ip),
+            _ip_to_u32(flow.dst_ip),
+            flow.priority,
+            STATUS_CODES.get(flow.status, 0),
+            flow.size_bytes,
+            flow.request_rate_bps,
+            flow.send_rate_bps,
+            flow.created_at or 0.0,
+            flow.allowed_at or 0.0,
+            flow.finished_at or 0.0,
+            self._path_id(flow.path),
+        )
+        buf = self._buf
+        for name, v in zip(COLUMN_NAMES, row):
+            buf[name].append(v)
+        rec_no = self._count
+        self._count += 1
+        self._tail[flow.id] = rec_no
+        if len(self._tail) >= _TAIL_MERGE:
+            self._merge_tail()
+        if self._count - self._flushed >= _WRITE_ROWS:
+            self._write_buffer()
+        return rec_no
+
+    def _write_buffer(self):
+        n = self._count - self._flushed
+        if not n:
+            return
+        # 行里引用的新路径先落盘，列文件里永远不会出现 paths.jsonl 还没有的 path_id
+        self._paths_f.flush()
+        for name, code in COLUMNS:
+            col = self._buf[name]
+            if _BIG_ENDIAN:
+                col.byteswap()
+            col.tofile(self._writers[name])
+            self._writers[name].flush()
+            self._buf[name] = array(code)
+        self._flushed = self._count
+
+    def flush(self):
+        self._write_buffer()
+        self._paths_f.flush()
+
+    def close(self):
+        self.flush()
+        for f in list(self._writers.values()) + list(self._readers.values()):
+            f.close()
+        self._readers.clear()
+        self._paths_f.close()
+
+    # ---------------- 查询 ----------------
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _find(self, flow_id: int) -> Optional[int]:
+        rec_no = self._tail.get(flow_id)
+        if rec_no is not None:
+            return rec_no
+        for ids, recs in self._runs:
+            i = bisect.bisect_left(ids, flow_id)
+            if i < len(ids) and ids[i] == flow_id:
+                return recs[i]
+        return None
+
+    def __contains__(self, flow_id: int) -> bool:
+        return self._find(flow_id) is not None
+
+    def _reader(self, name: str):
+        f = self._readers.get(name)
+        if f is None:
+            f = open(self.col_path(name), "rb")
+            self._readers[name] = f
+        return f
+
+    def _read_row(self, rec_no: int) -> tuple:
+        if rec_no >= self._flushed:
+            i = rec_no - self._flushed
+            return tuple(self._buf[name][i] for name in COLUMN_NAMES)
+        out = []
+        for name, code in COLUMNS:
+            cell = array(code)
+            f = self._reader(name)
+            f.seek(rec_no * cell.itemsize)
+            cell.frombytes(f.read(cell.itemsize))
+            if _BIG_ENDIAN:
+                cell.byteswap()
+            out.append(cell[0])
+        return tuple(out)
+
+    def column(self, name: str) -> array:
+        """整列读出来（落盘部分 + 写缓冲），离线分析用"""
+        code = dict(COLUMNS)[name]
+        col = array(code)
+        if self._flushed:
+            f = self._reader(name)
+            f.seek(0)
+            col.frombytes(f.read(self._flushed * col.itemsize))
+            if _BIG_ENDIAN:
+                col.byteswap()
+        col.extend(self._buf[name])
+        return col
+
+    def lookup(self, flow_id: int) -> Optional[dict]:
+        rec_no = self._find(flow_id)
+        if rec_no is None:
+            return None
+        (fid, src, dst, priority, status, size_bytes, req_rate, send_rate,
+         created_at, allowed_at, finished_at, path_id) = self._read_row(rec_no)
+        return {
+            "id": fid,
+            "src_ip": _u32_to_ip(src),
+            "dst_ip": _u32_to_ip(dst),
+            "priority": priority,
+            "status": STATUS_NAMES.get(status, "unknown"),
+            "size_bytes": size_bytes,
+            "request_rate_bps": req_rate,
+            "send_rate_bps": send_rate,
+            "created_at": created_at,
+            "allowed_at": allowed_at or None,
+            "finished_at": finished_at or None,
+            "path_id": path_id,
+            "path": [list(hop) for hop in self._paths[path_id]],
+        }
@@ -0,0 +1,83 @@
+'''
+Author: yc && qq747339545@163.com
+Date: 2025-12-05 09:42:17
+LastEditTime: 2025-12-05 09:42:17
+FilePath: /sdn_qos/controller/flow_id.py
+Description: 全局 flow_id 分配（跨 run 唯一，按块持久化高水位）
+
+Copyright (c) 2025 by ${git_name_email}, All Rights Reserved.
+'''
+# controller/flow_id.py
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+# cookie 布局：高 48 位 flow_id，低 16 位 sub_id（hop 序号）
+FLOW_ID_BITS = 48
+SUB_ID_BITS = 16
+FLOW_ID_MAX = (1 << FLOW_ID_BITS) - 1
+
+
+class FlowIdAllocator:
+    """
+    单调递增的全局 flow_id：
+      - <base_dir>/flow_id.state 记录已经预留到的高水位 next_free
+      - 每次预留 block 个 id，先把新高水位落盘（tmp + rename）再发号，
+        进程崩溃最多浪费一个块，重启后从高水位继续，不会和之前任何 run 的 id 重复
+      - <base_dir>/flow_id_runs.jsonl 每个 run 追加一行 {run_ts, first_id}，
+        拿到一个 flow_id 可以反查它属于哪个 run 的日志目录
+    """
+
+    STATE_FILE = "flow_id.state"
+    RUNS_FILE = "flow_id_runs.jsonl"
+
+    def __init__(self, base_dir: str, run_ts: Optional[str] = None, block: int = 65536):
+        self.base_dir = base_dir
+        self.block = block
+        os.makedirs(base_dir, exist_ok=True)
+        self.state_path = os.path.join(base_dir, self.STATE_FILE)
+        self.runs_path = os.path.join(base_dir, self.RUNS_FILE)
+        self._lock = threading.Lock()
+
+        self._next = self._load_state()   # 下一个要发的 id
+        self._limit = self._next          # 当前块的上界（不含）
+        self.first_id = self._next
+        if run_ts is not None:
+            with open(self.runs_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"run_ts": run_ts, "first_id": self.first_id,
+                                    "ts": time.time()}) + "\n")
+
+    def _load_state(self) -> int:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return max(1, int(json.load(f)["next_free"]))
+        except (OSError, ValueError, KeyError):
+            # 第一次运行；flow_id 0 留给系统规则（cookie=0）
+            return 1
+
+    def _persist(self, next_free: int):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"next_free": next_free}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.state_path)
+
+    def alloc(self) -> int:
+        with self._lock:
+            if self._next >= self._limit:
+                limit = self._next + self.block
+                if limit - 1 > FLOW_ID_MAX:
+                    raise RuntimeError("flow_id space exhausted")
+                self._persist(limit)
+                self._limit = limit
+            fid = self._next
+            self._next += 1
+            return fid
+
+    @property
+    def allocated(self) -> int:
+        """本 run 已经发出的 id 数"""
+        return self._next - self.first_id
@@ -1,18 +1,36 @@
 # controller/flow_installer.py
-from typing import Dict, Tuple
+from typing import Dict, Tuple, Set
 from ryu.ofproto import ofproto_v1_3
 from ryu.lib import ofctl_v1_3
 from ryu.base.app_manager import RyuApp
 from models import Flow
+from flow_id import FLOW_ID_BITS, FLOW_ID_MAX, SUB_ID_BITS
+
+SUB_ID_MASK = (1 << SUB_ID_BITS) - 1
 
 
 def make_cookie(flow_id: int, sub_id: int) -> int:
-    """64bit: 高32位 flow_id，低32位 sub_id"""
-    return (flow_id << 32) | (sub_id & 0xffffffff)
+    """64bit: 高48位 flow_id，低16位 sub_id"""
+    return ((flow_id & FLOW_ID_MAX) << SUB_ID_BITS) | (sub_id & SUB_ID_MASK)
 
 
 def flow_id_from_cookie(cookie):
-    return (cookie >> 32) & 0xffffffff
+    return (cookie >> SUB_ID_BITS) & FLOW_ID_MAX
+
+
+def cookie_range(flow_ids) -> Tuple[int, int]:
+    """
+    给一组 flow_id 计算 (cookie, cookie_mask)，用于 FlowStats/FlowMod 过滤：
+    取所有 flow_id 的公共高位前缀，mask 只覆盖这段前缀，低 16 位 sub_id 不参与匹配。
+    flow_id 全部相同时等价于精确匹配这一条流。
+    """
+    ids = list(flow_ids)
+    if not ids:
+        return 0, 0
+    lo, hi = min(ids), max(ids)
+    nbits = (lo ^ hi).bit_length()
+    id_mask = (FLOW_ID_MAX >> nbits) << nbits if nbits < FLOW_ID_BITS else 0
+    return (lo & id_mask) << SUB_ID_BITS, id_mask << SUB_ID_BITS
 
 
 class FlowInstaller:
@@ -24,9 +42,27 @@ class FlowInstaller:
     def __init__(self, app: RyuApp):
         self.app = app  # GlobalScheduler 实例，用来 access self.datapaths
         self.logger = app.logger
+        # flow_id -> 已下发 per-flow 规则的 dpid 集合，避免重复删除时计数被多减
+        self._installed: Dict[int, Set[int]] = {}
+
+    def _table_add(self, dpid: int, table_id: int):
+        admission = getattr(self.app, "admission", None)
+        if admission is not None:
+            admission.table_add(dpid, table_id)
+
+    def _table_remove(self, dpid: int, table_id: int):
+        admission = getattr(self.app, "admission", None)
+        if admission is not None:
+            admission.table_remove(dpid, table_id)
+
     def _get_dp(self, dpid: int):
         return self.app.datapaths.get(dpid)
 
+    def _emit(self, event: str, **fields):
+        events = getattr(self.app, "events", None)
+        if events is not None:
+            events.emit("install", event, **fields)
+
     def install_flow(self, flow: Flow):
         """
         在 flow.path 上每个交换机的 Table 1 安装 per-flow 规则：
@@ -73,10 +109,20 @@ class FlowInstaller:
             )
             dp.send_msg(mod)
 
+            installed = self._installed.setdefault(flow.id, set())
+            if dpid not in installed:
+                installed.add(dpid)
+                self._table_add(dpid, 1)
+
+        self._emit("installed", flow_id=flow.id, dscp=flow.dscp, queue_id=flow.queue_id,
+                   dpids=[dpid for dpid, _ in flow.path])
+
     def delete_flow(self, flow: Flow):
         """按 cookie 高位 flow_id 删除该流在所有 switch 的规则"""
-        for dpid in {dpid for dpid, _ in flow.path}:
+        dpids = {dpid for dpid, _ in flow.path}
+        for dpid in dpids:
             self._delete_flow_in_switch(dpid, flow.id)
+        self._emit("deleted", flow_id=flow.id, dpids=sorted(dpids))
 
     def _delete_flow_in_switch(self, dpid: int, flow_id: int):
         dp = self._get_dp(dpid)
@@ -85,8 +131,7 @@ class FlowInstaller:
         ofp = dp.ofproto
         parser = dp.ofproto_parser
 
-        cookie = flow_id << 32
-        cookie_mask = 0xffffffff00000000
+        cookie, cookie_mask = cookie_range([flow_id])
 
         match = parser.OFPMatch()  # 匹配所有
         mod = parser.OFPFlowMod(
@@ -101,6 +146,13 @@ class FlowInstaller:
         )
         dp.send_msg(mod)
 
+        installed = self._installed.get(flow_id)
+        if installed is not None and dpid in installed:
+            installed.discard(dpid)
+            self._table_remove(dpid, 1)
+            if not installed:
+                del self._installed[flow_id]
+
     def delete_prev_hop_flow(self, flow: Flow, dpid: int):
         """只删除指定 dpid 上此 flow 的规则（逐跳释放用）"""
         self._delete_flow_in_switch(dpid, flow.id)
@@ -117,6 +169,15 @@ class FlowInstaller:
             instructions=inst
         )
         datapath.send_msg(mod)
+        self._table_add(datapath.id, table_id)
+
+    def forget_switch(self, dpid: int):
+        """交换机流表被整体清空时，丢弃该 dpid 上的 per-flow 安装记录"""
+        for flow_id in list(self._installed.keys()):
+            installed = self._installed[flow_id]
+            installed.discard(dpid)
+            if not installed:
+                del self._installed[flow_id]
 
     
     
@@ -2,24 +2,43 @@
 import socket
 import threading
 import json
-from typing import Dict, Tuple , Optional
-import random
+from collections import OrderedDict, deque
+from typing import Dict, List, Tuple , Optional
 import logging
-import os 
 import time
 
+from dst_selector import DstSelector
+from exp_logger import get_run_context
+from events import EventLog
+from models import HostState
 
 
 LOG = logging.getLogger('host_channel')
+
+
+class _CtrlConn:
+    """到某个 agent 控制端口的长连接：发送加锁，ACK 由单独的读线程处理"""
+
+    __slots__ = ("host_ip", "port", "sock", "send_lock")
+
+    def __init__(self, host_ip: str, port: int, sock: socket.socket):
+        self.host_ip = host_ip
+        self.port = port
+        self.sock = sock
+        self.send_lock = threading.Lock()
+
+
 class HostChannel:
     """
     Host 通信模块（REST + 主动 TCP）：
 
-    - register_host(host_ip, permit_port, recv_port)
-      由 REST /scheduler/register_host 调用，把 Host 的信息记录下来。
+    - register_host(host_ip, permit_port, recv_port, rate_update)
+      由 REST /scheduler/register_host 调用，把 Host 的信息记录下来；
+      rate_update 表示它的发送端能否运行中改速率（engine 后端能，iperf3 不能）。
 
-    - pick_dst_for_flow(src_ip)
-      调度器在创建 Flow 时，调用它随机挑一个目的 Host（返回 dst_ip, dst_recv_port）。
+    - pick_dst_for_flow(src_ip, need_bps, dst_ip)
+      调度器在创建 Flow 时，调用它挑一个目的 Host（返回 dst_ip, dst_recv_port），
+      按 dst_select 模式参考各 host 的入向预留带宽 / 接入端口剩余带宽；也可以指定 dst_ip。
 
     - send_permit(flow)
       调度器 admission 通过后，调用它主动连到 src_ip 对应的 Host 的 permit_port，
@@ -29,15 +48,54 @@ class HostChannel:
         - 发送速率 send_rate_bps、总大小 size_bytes、dscp 等
     """
 
-    def __init__(self, host: str, port: int,run_ts: str,port_mgr=None):
+    def __init__(self, host: str, port: int,run_ts: str,port_mgr=None,
+                 dst_select: str = "p2c", heartbeat_cfg: dict = None,
+                 backpressure_cfg: dict = None, events: Optional[EventLog] = None):
         self.host = host
         self.port = port
         self.run_ts = run_ts 
         self.port_mgr = port_mgr
+        # 没传就用一个关掉的 EventLog，调用处不用判空
+        self.events = events if events is not None else EventLog("", enabled=False)
         
         # key: host_ip, value: (permit_port, recv_port)
         self._hosts: Dict[str, Tuple[int, int]] = {}
         self._lock = threading.Lock()
+        # 目的 host 选择：host 索引 + 每个 host 的入向预留 / 剩余带宽 + pending 请求
+        self._selector = DstSelector(dst_select)
+
+        # 存活检测：agent 每 heartbeat_interval 秒 POST /scheduler/heartbeat，
+        # 超过 suspect_after 没消息 -> suspect（不再被选为目的），超过 dead_after -> dead（摘掉）
+        hb = heartbeat_cfg or {}
+        self.heartbeat_interval = float(hb.get("interval", 2.0))
+        self.suspect_after = float(hb.get("suspect_after", 3 * self.heartbeat_interval))
+        self.dead_after = float(hb.get("dead_after", 8 * self.heartbeat_interval))
+        # host_ip -> HostState，按 last_seen 从旧到新排列，检查时只看头部
+        self._liveness: "OrderedDict[str, HostState]" = OrderedDict()
+
+        # 背压：agent 对每条控制消息回一行 ACK，线程池排队时带 busy=true，
+        # 控制器在 busy_backoff 秒内不再把它选为目的，也不给它作为 src 的 flow 放行；
+        # agent 队列满了直接拒绝（rejected=true），PERMIT / FLOW_PREPARE 过 busy_backoff 秒重发，
+        # 重发 max_resend 次还被拒就交给调度循环判 flow 失败
+        bp = backpressure_cfg or {}
+        self.ack_timeout = float(bp.get("ack_timeout", 5.0))
+        self.busy_backoff = float(bp.get("busy_backoff", 1.0))
+        self.connect_timeout = float(bp.get("connect_timeout", 1.0))
+        self.max_resend = int(bp.get("max_resend", 3))
+        # host_ip -> busy 截止时间
+        self._busy_until: Dict[str, float] = {}
+
+        # 每个 host 一条控制长连接，发送不等 ACK；ACK 在每条连接自己的读线程里处理
+        self._conns: Dict[str, _CtrlConn] = {}
+        self._conn_lock = threading.Lock()
+        # 等 ACK 的 PERMIT / FLOW_PREPARE：(msg_type, flow_id) -> [host_ip, data, 发送时间, 已重发次数]
+        self._unacked: Dict[Tuple[str, int], list] = {}
+        # 被 agent 拒绝且重发用完的消息，调度循环 take_rejected() 取走后判 flow 失败
+        self._rejected = deque()
+        # 能处理 RATE_UPDATE 的 host；RATE_UPDATE 的 ACK（applied + 发送端实际速率）放进 _rate_acks，
+        # 调度循环 take_rate_acks() 取走后把预留对齐到发送端实际速率
+        self._rate_capable = set()
+        self._rate_acks = deque()
         
         # key: src_ip, value: (host_ip, listen_port)
         # self.host_addrs: Dict[str, Tuple[str, int]] = {}
@@ -47,56 +105,309 @@ class HostChannel:
     
     def _append_flow_progress(self, flow_id: int, line: str):
         """
-        直接往 FlowProgress/<flow_id>/progress.log 追加一行，带时间戳。
-        依赖 run_ts + 固定 base_dir=/home/yc/sdn_qos/logs。
+        往 FlowProgress/<flow_id>/progress.log 追加一行，带时间戳。
+        依赖 run_ts + 固定 base_dir=/home/yc/sdn_qos/logs，目录和文件句柄走 run 级缓存。
         """
         if not self.run_ts:
             return
-
-        base_dir = "/home/yc/sdn_qos/logs"
-        ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-        flow_dir = os.path.join(base_dir, self.run_ts, "FlowProgress", str(flow_id))
-        os.makedirs(flow_dir, exist_ok=True)
-        log_path = os.path.join(flow_dir, "progress.log")
         try:
-            with open(log_path, "a", encoding="utf-8") as f:
-                f.write(f"{ts} {line}\n")
+            get_run_context("/home/yc/sdn_qos/logs", self.run_ts).append_flow_progress(flow_id, [line])
         except Exception as e:
             LOG.warning("[HostChannel] _append_flow_progress failed: %s", e)
 
 
     # ---------- 注册部分：由 REST 调用 ----------
 
-    def register_host(self, host_ip: str, permit_port: int, recv_port: int):
+    def register_host(self, host_ip: str, permit_port: int, recv_port: int,
+                      rate_update: bool = False):
         with self._lock:
             # 希望recv_port随机分配
             
             self._hosts[host_ip] = (permit_port, recv_port)
+            if rate_update:
+                self._rate_capable.add(host_ip)
+            else:
+                self._rate_capable.discard(host_ip)
+            self._selector.add(host_ip)
+            self._touch(host_ip, time.time())
+            n_hosts = len(self._hosts)
         LOG.info(
-            "[HostChannel] register_host: ip=%s permit_port=%d recv_port=%d, all_hosts=%s",
-            host_ip, permit_port, recv_port, self._hosts
+            "[HostChannel] register_host: ip=%s permit_port=%d recv_port=%d rate_update=%s, n_hosts=%d",
+            host_ip, permit_port, recv_port, rate_update, n_hosts
         )
 
-    def pick_dst_for_flow(self, src_ip: str) -> Optional[Tuple[str, int]]:
+    def pick_dst_for_flow(self, src_ip: str, need_bps: int = 0,
+                          dst_ip: Optional[str] = None) -> Optional[Tuple[str, int]]:
         """
-        为某个 src_ip 挑一个目的 host（目前简单随机，排除掉自己）
+        为某个 src_ip 挑一个目的 host（排除掉自己），need_bps 先记在该 host 的 pending 上，
+        admission 预留后由 release_dst() 还掉（入向负载跟着带宽账本走）。
+        dst_ip 给定时只校验它已注册且不是 src 自己（busy / suspect 的 host 不在候选里，但可以被指定）。
         返回: (dst_ip, dst_recv_port)，如果没有可用目的 host 则返回 None
         """
         with self._lock:
-            candidates = [
-                (ip, info[1])   # info[1] = recv_port
-                for ip, info in self._hosts.items()
-                if ip != src_ip
-            ]
-            LOG.info("[HostChannel] pick_dst_for_flow src_ip=%s candidates=%s",
-                 src_ip, candidates)
-        if not candidates:
-            return None
-        dst = random.choice(candidates)
-        LOG.info("[HostChannel] picked dst for src=%s -> %s", src_ip, dst)
-        return dst
+            if dst_ip is not None:
+                dst = dst_ip if (dst_ip != src_ip and dst_ip in self._hosts) else None
+            else:
+                dst = self._selector.pick(src_ip, need_bps)
+            if dst is None:
+                return None
+            self._selector.add_pending(dst, need_bps)
+            recv_port = self._hosts[dst][1]
+            load = self._selector.load(dst)
+        LOG.info("[HostChannel] picked dst for src=%s -> %s (mode=%s in_load=%d)",
+                 src_ip, dst, self._selector.mode, load)
+        return dst, recv_port
+
+    # ---------- 存活检测 ----------
+
+    def _touch(self, host_ip: str, now: float, rtt_ms: Optional[float] = None):
+        st = self._liveness.pop(host_ip, None) or HostState(host_ip)
+        if st.state != "alive":
+            LOG.info("[HostChannel] host %s back alive (was %s)", host_ip, st.state)
+        st.on_heartbeat(now, rtt_ms)
+        self._liveness[host_ip] = st
+        if host_ip not in self._busy_until:
+            self._selector.add(host_ip)
+
+    def heartbeat(self, host_ip: str, rtt_ms: Optional[float] = None) -> bool:
+        """
+        处理一次心跳，返回 host 是否仍在注册表里；
+        False 表示已被摘掉（或控制器重启过），agent 应重新 register。
+        """
+        with self._lock:
+            if host_ip not in self._hosts:
+                return False
+            self._touch(host_ip, time.time(), rtt_ms)
+            return True
+
+    def mark_unreachable(self, host_ip: str):
+        """主动连接失败：直接置为 suspect，不再被选为目的，等心跳恢复或超时变 dead"""
+        with self._lock:
+            st = self._liveness.get(host_ip)
+            if st is None or st.state != "alive":
+                return
+            st.state = "suspect"
+            self._selector.remove(host_ip)
+        LOG.warning("[HostChannel] host %s unreachable, marked suspect", host_ip)
+
+    def is_registered(self, host_ip: str) -> bool:
+        return host_ip in self._hosts
+
+    def is_alive(self, host_ip: str) -> bool:
+        st = self._liveness.get(host_ip)
+        return st is not None and st.state == "alive"
+
+    def mark_busy(self, host_ip: str, queued: int = 0):
+        """agent ACK 报 busy：busy_backoff 秒内不再选它当目的，也不给它派 PERMIT"""
+        with self._lock:
+            first = host_ip not in self._busy_until
+            self._busy_until[host_ip] = time.time() + self.busy_backoff
+            self._selector.remove(host_ip)
+        if first:
+            LOG.warning("[HostChannel] host %s busy (queued=%s), back off %.1fs",
+                        host_ip, queued, self.busy_backoff)
+
+    def is_busy(self, host_ip: str) -> bool:
+        until = self._busy_until.get(host_ip)
+        return until is not None and time.time() < until
+
+    def check_liveness(self, now: Optional[float] = None) -> List[str]:
+        """
+        推进状态机，返回本次判定为 dead 并已摘除的 host 列表。
+        _liveness 按 last_seen 有序，只扫超时的头部；顺带把 busy 到期的 host 放回候选。
+        """
+        now = time.time() if now is None else now
+        dead: List[str] = []
+        with self._lock:
+            for host_ip in [ip for ip, until in self._busy_until.items() if until <= now]:
+                del self._busy_until[host_ip]
+                if self.is_alive(host_ip):
+                    self._selector.add(host_ip)
+            for host_ip, st in self._liveness.items():
+                idle = now - st.last_seen
+                if idle < self.suspect_after:
+                    break
+                if idle >= self.dead_after:
+                    dead.append(host_ip)
+                elif st.state == "alive":
+                    st.state = "suspect"
+                    self._selector.remove(host_ip)
+                    LOG.warning("[HostChannel] host %s suspect: no heartbeat for %.1fs",
+                                host_ip, idle)
+            for host_ip in dead:
+                del self._liveness[host_ip]
+                self._hosts.pop(host_ip, None)
+                self._rate_capable.discard(host_ip)
+                self._busy_until.pop(host_ip, None)
+                self._selector.remove(host_ip)
+        for host_ip in dead:
+            with self._conn_lock:
+                conn = self._conns.get(host_ip)
+            if conn is not None:
+                self._close_conn(conn)
+            LOG.warning("[HostChannel] host %s dead: evicted", host_ip)
+        return dead
+
+    def liveness_snapshot(self) -> List[dict]:
+        with self._lock:
+            return [{"host_ip": st.host_ip, "state": st.state,
+                     "last_seen": st.last_seen, "rtt_ms": st.rtt_ms}
+                    for st in self._liveness.values()]
+
+    def release_dst(self, dst_ip: str, bps: int):
+        """
+        pending 的 flow 离开队列（被 admission 放行 / 失败 / 换目的）时，
+        把它在目的 host 上记的 pending 请求还回去
+        """
+        with self._lock:
+            self._selector.release_pending(dst_ip, bps)
+
+    def update_dst_port(self, dst_ip: str, reserved_bps: int, residual_bps: int):
+        """带宽账本里 dst_ip 的入向接入端口预留变化（预留 / 释放 / 调速）"""
+        with self._lock:
+            self._selector.set_port_state(dst_ip, reserved_bps, residual_bps)
+
+    # ---------- 控制长连接 + 异步 ACK ----------
+
+    def _get_conn(self, host_ip: str, port: int) -> _CtrlConn:
+        with self._conn_lock:
+            conn = self._conns.get(host_ip)
+        if conn is not None and conn.port == port:
+            return conn
+        sock = socket.create_connection((host_ip, port), timeout=self.connect_timeout)
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = _CtrlConn(host_ip, port, sock)
+        with self._conn_lock:
+            old = self._conns.get(host_ip)
+            self._conns[host_ip] = conn
+        if old is not None:
+            self._close_conn(old)
+        threading.Thread(target=self._ack_loop, args=(conn,), daemon=True,
+                         name=f"ctrl-ack-{host_ip}").start()
+        return conn
+
+    def _close_conn(self, conn: _CtrlConn):
+        with self._conn_lock:
+            if self._conns.get(conn.host_ip) is conn:
+                del self._conns[conn.host_ip]
+        try:
+            conn.sock.close()
+        except OSError:
+            pass
+
+    def _ack_loop(self, conn: _CtrlConn):
+        """读这条连接上 agent 回的 ACK 行，直到对端关闭 / 出错"""
+        try:
+            f = conn.sock.makefile("rb")
+            for line in f:
+                try:
+                    ack = json.loads(line)
+                except ValueError:
+                    continue
+                self._on_ack(conn.host_ip, ack)
+        except (OSError, ValueError):
+            pass
+        finally:
+            self._close_conn(conn)
+
+    def _on_ack(self, host_ip: str, ack: dict):
+        if ack.get("busy"):
+            self.mark_busy(host_ip, ack.get("queued", 0))
+        if ack.get("msg_type") == "RATE_UPDATE":
+            applied = bool(ack.get("applied"))
+            with self._lock:
+                self._rate_acks.append((ack.get("flow_id"), applied, ack.get("rate_bps")))
+            if not applied:
+                self.events.warning("rate", "not_applied", flow_id=ack.get("flow_id"),
+                                    host=host_ip, rate_bps=ack.get("rate_bps"),
+                                    error=ack.get("error"))
+            return
+        key = (str(ack.get("msg_type", "")), ack.get("flow_id"))
+        with self._lock:
+            entry = self._unacked.get(key)
+            if entry is None or entry[0] != host_ip:
+                return
+            if not ack.get("rejected"):
+                del self._unacked[key]
+                return
+            entry[3] += 1
+            give_up = entry[3] > self.max_resend
+            if give_up:
+                del self._unacked[key]
+                self._rejected.append((key[0], key[1], host_ip))
+        if give_up:
+            self.events.warning("host", "ctrl_rejected", flow_id=key[1], host=host_ip,
+                                msg_type=key[0], resends=self.max_resend)
+            return
+        timer = threading.Timer(self.busy_backoff, self._resend, args=(key,))
+        timer.daemon = True
+        timer.start()
+
+    def _resend(self, key: Tuple[str, int]):
+        with self._lock:
+            entry = self._unacked.get(key)
+            info = self._hosts.get(entry[0]) if entry is not None else None
+        if entry is None or info is None:
+            return
+        host_ip, data = entry[0], entry[1]
+        entry[2] = time.time()
+        try:
+            self._send_ctrl(host_ip, info[0], data)
+            self.events.emit("host", "ctrl_resent", flow_id=key[1], host=host_ip,
+                             msg_type=key[0], attempt=entry[3])
+        except OSError as e:
+            self.events.warning("host", "ctrl_resend_failed", flow_id=key[1], host=host_ip,
+                                msg_type=key[0], error=str(e))
+            self.mark_unreachable(host_ip)
+
+    def _track_ack(self, msg_type: str, flow_id: int, host_ip: str, data: bytes):
+        with self._lock:
+            self._unacked[(msg_type, flow_id)] = [host_ip, data, time.time(), 0]
+
+    def take_rejected(self) -> List[Tuple[str, int, str]]:
+        """
+        调度循环调用：取走被 agent 拒绝且重发用完的 (msg_type, flow_id, host_ip)，
+        顺带丢掉 ack_timeout 内没等到 ACK 的记录（连接断了 / 老版本 agent 不回 ACK）
+        """
+        now = time.time()
+        with self._lock:
+            for key in [k for k, e in self._unacked.items() if now - e[2] > self.ack_timeout]:
+                del self._unacked[key]
+            out = list(self._rejected)
+            self._rejected.clear()
+        return out
+
+    def can_update_rate(self, host_ip: str) -> bool:
+        return host_ip in self._rate_capable
+
+    def take_rate_acks(self) -> List[Tuple[int, bool, Optional[int]]]:
+        """
+        调度循环调用：取走 RATE_UPDATE 的 ACK，(flow_id, applied, 发送端实际速率)，
+        flow 已经不在发送时速率为 None
+        """
+        with self._lock:
+            out = list(self._rate_acks)
+            self._rate_acks.clear()
+        return out
 
     # ---------- PERMIT 推送部分：由 GlobalScheduler 调用 ----------
+    def _send_ctrl(self, host_ip: str, port: int, data: bytes):
+        """
+        在到 host 的控制长连接上发一条消息，不等 ACK（ACK 由 _ack_loop 异步处理）。
+        复用的连接已被对端关掉时重连一次；连不上抛 OSError。
+        """
+        for attempt in (0, 1):
+            conn = self._get_conn(host_ip, port)
+            try:
+                with conn.send_lock:
+                    conn.sock.sendall(data)
+                return
+            except OSError:
+                self._close_conn(conn)
+                if attempt:
+                    raise
+
     def send_flow_prepare(self, flow):
         """
         主动连到 dst_ip 所在的 host 的 permit_port，发送 FLOW_PREPARE 消息。
@@ -133,16 +444,15 @@ class HostChannel:
             msg["run_ts"] = self.run_ts
 
         data = (json.dumps(msg) + "\n").encode("utf-8")
-        LOG.info(
-            "[HostChannel] send_flow_prepare: flow_id=%s %s:%s -> %s:%s",
-            flow.id, flow.src_ip, flow.src_port, flow.dst_ip,flow.dst_port
-        )
         try:
-            with socket.create_connection((dst_ip, permit_port), timeout=3.0) as s:
-                s.sendall(data)
+            self._track_ack("FLOW_PREPARE", flow.id, dst_ip, data)
+            self._send_ctrl(dst_ip, permit_port, data)
+            self.events.emit("host", "flow_prepare_sent", flow_id=flow.id, host=dst_ip,
+                             port=permit_port, src_port=flow.src_port, dst_port=flow.dst_port)
         except OSError as e:
-            LOG.warning("[HostChannel] failed to send FLOW_PREPARE to %s:%s: %s",
-                        dst_ip, permit_port, e)
+            self.events.warning("host", "flow_prepare_failed", flow_id=flow.id, host=dst_ip,
+                                port=permit_port, error=str(e))
+            self.mark_unreachable(dst_ip)
             
     def send_permit(self, flow):
         """
@@ -182,33 +492,61 @@ class HostChannel:
             msg["run_ts"] = self.run_ts
 
         data = (json.dumps(msg) + "\n").encode("utf-8")
-        LOG.info(
-            "[HostChannel] send_permit: flow_id=%s src=%s dst=%s:%s "
-            "rate=%s size=%s dscp=%s",
-            flow.id, flow.src_ip, flow.dst_ip, dst_port,
-            flow.send_rate_bps, flow.size_bytes, getattr(flow, "dscp", 0),
-        )
         try:
-            with socket.create_connection((src_ip, permit_port), timeout=3.0) as s:
-                s.sendall(data)
-
-            log_line = (f"[HostChannel] sent PERMIT to {src_ip}:{permit_port} "
-                        f"for flow_id={flow.id}")
-            print(log_line)
-            # ➕ 写入对应 flow 的 FlowProgress
-            self._append_flow_progress(flow.id, log_line)
+            self._track_ack("PERMIT", flow.id, src_ip, data)
+            self._send_ctrl(src_ip, permit_port, data)
+            self.events.emit("host", "permit_sent", flow_id=flow.id, host=src_ip, port=permit_port,
+                             dst_ip=flow.dst_ip, dst_port=dst_port, send_rate_bps=flow.send_rate_bps,
+                             size_bytes=flow.size_bytes, dscp=flow.dscp)
+            # 写入对应 flow 的 FlowProgress（画图脚本靠这一行）
+            self._append_flow_progress(
+                flow.id, f"[HostChannel] sent PERMIT to {src_ip}:{permit_port} for flow_id={flow.id}")
 
         except OSError as e:
-            err_line = (f"[HostChannel] failed to send PERMIT to {src_ip}:{permit_port}: {e}")
-            print(err_line)
-            # 失败也可以记录一下（可选）
-            self._append_flow_progress(flow.id, err_line)
+            self.events.warning("host", "permit_failed", flow_id=flow.id, host=src_ip,
+                                port=permit_port, error=str(e))
+            self.mark_unreachable(src_ip)
+            self._append_flow_progress(
+                flow.id, f"[HostChannel] failed to send PERMIT to {src_ip}:{permit_port}: {e}")
 
 
 
 
 
 
+    def _send_flow_ctrl(self, host_ip: str, msg: dict) -> bool:
+        """给某个 host 发一条针对单条 flow 的控制消息（STOP / RATE_UPDATE）"""
+        with self._lock:
+            info = self._hosts.get(host_ip)
+        if not info:
+            LOG.warning("[HostChannel] no host info for %s, skip %s for flow_id=%s",
+                        host_ip, msg.get("type"), msg.get("flow_id"))
+            return False
+        permit_port, _recv_port = info
+        data = (json.dumps(msg) + "\n").encode("utf-8")
+        try:
+            self._send_ctrl(host_ip, permit_port, data)
+        except OSError as e:
+            self.events.warning("host", msg.get("type", "").lower() + "_failed",
+                                flow_id=msg.get("flow_id"), host=host_ip, port=permit_port,
+                                error=str(e))
+            self.mark_unreachable(host_ip)
+            return False
+        self.events.emit("host", msg.get("type", "").lower() + "_sent", **dict(msg, host=host_ip))
+        return True
+
+    def send_stop(self, flow, host_ip: str) -> bool:
+        """让 host_ip 上这条 flow 的发送端 / 接收端停下来"""
+        return self._send_flow_ctrl(host_ip, {"type": "STOP", "flow_id": flow.id})
+
+    def send_rate_update(self, flow, rate_bps: int) -> bool:
+        """
+        让 src host 把这条 flow 的发送速率改成 rate_bps（不重启发送端）。
+        返回 True 只说明消息发出去了；生没生效由 ACK 报回来，见 take_rate_acks()
+        """
+        return self._send_flow_ctrl(flow.src_ip, {"type": "RATE_UPDATE", "flow_id": flow.id,
+                                                  "send_rate_bps": rate_bps})
+
     # ------------ 注册 Server 部分 ------------
 
     # def start(self):
@@ -1,42 +1,445 @@
 # controller/models.py
 from dataclasses import dataclass, field
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Optional
+from array import array
 import time
 
 
-@dataclass
+# ---------------- 路径驻留 ----------------
+class Path(tuple):
+    """
+    驻留的路径 ((dpid, out_port), ...)。Flow.path 以前是 list，
+    这里和 list 比较时按元素比（flow.path == [(1, 2), (3, 3)] 仍然成立），hash 和 tuple 一致。
+    """
+    __slots__ = ()
+
+    def __eq__(self, other):
+        if isinstance(other, list):
+            return len(self) == len(other) and all(a == tuple(b) for a, b in zip(self, other))
+        return tuple.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = tuple.__hash__
+
+
+# 同一条路径的所有 Flow 共享同一个 Path 对象，dpid 序列也只存一份
+_PATH_INTERN: Dict[tuple, Path] = {}
+_PATH_DPIDS: Dict[tuple, tuple] = {}
+_PATH_POS: Dict[tuple, Dict[int, int]] = {}  # path -> {dpid: hop 下标}
+_EMPTY_PATH = Path()
+_PATH_DPIDS[_EMPTY_PATH] = ()
+_PATH_POS[_EMPTY_PATH] = {}
+
+
+def intern_path(path) -> Path:
+    """把 [(dpid, out_port), ...] 转成驻留的 Path((dpid, out_port), ...)"""
+    key = tuple((int(dpid), int(port)) for dpid, port in path)
+    cached = _PATH_INTERN.get(key)
+    if cached is None:
+        _PATH_INTERN[key] = cached = key = Path(key)
+        _PATH_DPIDS[key] = tuple(dpid for dpid, _ in key)
+        # 同一 dpid 出现多次时取第一次出现的下标，和 list.index 一致
+        pos: Dict[int, int] = {}
+        for idx, (dpid, _) in enumerate(key):
+            pos.setdefault(dpid, idx)
+        _PATH_POS[key] = pos
+    return cached
+
+
+# 每个 hop 在 Flow._hops 里占 3 个 float64：bytes, last_time, rate_bps
+_HOP_FIELDS = 3
+_F_BYTES, _F_TIME, _F_RATE = 0, 1, 2
+
+
+class _HopView:
+    """
+    dict 风格的 hop 视图（dpid -> 值），底层是 Flow._hops 里按 hop 下标存的定长数组，
+    只有被写过的 hop 才算“在字典里”（用 Flow._hop_set 的位记录）。
+    不在路径上的 dpid 落到 Flow._extra 里，保证和原来的 dict 行为一致。
+    """
+    __slots__ = ("_flow", "_field", "_cast")
+
+    def __init__(self, flow: "Flow", field_idx: int, cast):
+        self._flow = flow
+        self._field = field_idx
+        self._cast = cast
+
+    def _extra(self, create: bool = False):
+        flow = self._flow
+        if flow._extra is None:
+            if not create:
+                return None
+            flow._extra = {}
+        d = flow._extra.get(self._field)
+        if d is None and create:
+            d = flow._extra[self._field] = {}
+        return d
+
+    def get(self, dpid, default=None):
+        flow = self._flow
+        idx = flow._pos.get(dpid)
+        if idx is None:
+            extra = self._extra()
+            return default if extra is None else extra.get(dpid, default)
+        slot = idx * _HOP_FIELDS + self._field
+        if not flow._hop_set >> slot & 1:
+            return default
+        return self._cast(flow._hops[slot])
+
+    def __getitem__(self, dpid):
+        value = self.get(dpid, _MISSING)
+        if value is _MISSING:
+            raise KeyError(dpid)
+        return value
+
+    def __setitem__(self, dpid, value):
+        flow = self._flow
+        idx = flow._pos.get(dpid)
+        if idx is None:
+            self._extra(create=True)[dpid] = value
+            return
+        slot = idx * _HOP_FIELDS + self._field
+        flow._hops[slot] = value
+        flow._hop_set |= 1 << slot
+
+    def __contains__(self, dpid) -> bool:
+        return self.get(dpid, _MISSING) is not _MISSING
+
+    def keys(self):
+        flow = self._flow
+        for idx, dpid in enumerate(flow._dpids):
+            if flow._hop_set >> (idx * _HOP_FIELDS + self._field) & 1:
+                yield dpid
+        extra = self._extra()
+        if extra:
+            yield from extra.keys()
+
+    def __iter__(self):
+        return self.keys()
+
+    def items(self):
+        for dpid in self.keys():
+            yield dpid, self[dpid]
+
+    def values(self):
+        for dpid in self.keys():
+            yield self[dpid]
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.keys())
+
+    def clear(self):
+        flow = self._flow
+        for idx in range(len(flow._dpids)):
+            flow._hop_set &= ~(1 << (idx * _HOP_FIELDS + self._field))
+        if flow._extra:
+            flow._extra.pop(self._field, None)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class _ReleasedHops:
+    """set 风格的 released_hops 视图，底层是按 hop 下标的位图 Flow._released"""
+    __slots__ = ("_flow",)
+
+    def __init__(self, flow: "Flow"):
+        self._flow = flow
+
+    def _extra(self, create: bool = False):
+        flow = self._flow
+        if flow._extra is None:
+            if not create:
+                return None
+            flow._extra = {}
+        s = flow._extra.get("released")
+        if s is None and create:
+            s = flow._extra["released"] = set()
+        return s
+
+    def add(self, dpid):
+        flow = self._flow
+        idx = flow._pos.get(dpid)
+        if idx is None:
+            self._extra(create=True).add(dpid)
+        else:
+            flow._released |= 1 << idx
+
+    def discard(self, dpid):
+        flow = self._flow
+        idx = flow._pos.get(dpid)
+        if idx is not None:
+            flow._released &= ~(1 << idx)
+            return
+        extra = self._extra()
+        if extra:
+            extra.discard(dpid)
+
+    def __contains__(self, dpid) -> bool:
+        flow = self._flow
+        idx = flow._pos.get(dpid)
+        if idx is not None:
+            return bool(flow._released >> idx & 1)
+        extra = self._extra()
+        return bool(extra) and dpid in extra
+
+    def __iter__(self):
+        flow = self._flow
+        for idx, dpid in enumerate(flow._dpids):
+            if flow._released >> idx & 1:
+                yield dpid
+        extra = self._extra()
+        if extra:
+            yield from extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def clear(self):
+        flow = self._flow
+        flow._released = 0
+        if flow._extra:
+            flow._extra.pop("released", None)
+
+    def __repr__(self):
+        return repr(set(self))
+
+
+_MISSING = object()
+
+
 class Flow:
-    """业务流模型：控制器视角的一条流"""
-    id: int
-    src_ip: str
-    dst_ip: str
-    src_port: int 
-    dst_port: int 
-    request_rate_bps: int
-    size_bytes: int
-    priority: int  # 0=best, 1=silver, 2=gold
-    reason : str
-    
-    # 调度结果
-    send_rate_bps: int = 0
-    dscp: Optional[int] = None
-    queue_id: Optional[int] = None
-    path: List[Tuple[int, int]] = field(default_factory=list)  # [(dpid, out_port), ...]
-
-    # 状态
-    
-    status: str = "pending"  # pending/allowed/active/finished/failed
-    created_at: float = field(default_factory=time.time)
-    allowed_at: Optional[float] = None
-    finished_at: Optional[float] = None
-    
-    # 统计信息：每个 hop 的字节数/速率
-    hop_bytes: Dict[int, int] = field(default_factory=dict)      # dpid -> bytes
-    hop_last_time: Dict[int, float] = field(default_factory=dict)
-    hop_rate_bps: Dict[int, int] = field(default_factory=dict)
+    """
+    业务流模型：控制器视角的一条流。
+
+    用 __slots__ 省掉每个实例的 __dict__；每跳统计（bytes / last_time / rate）
+    存在一个按 hop 下标排列的 array('d') 里，released_hops 是位图，path 是驻留的 Path（tuple 子类，
+    和 list 比较相等）。对外仍然暴露 hop_bytes / hop_last_time / hop_rate_bps（dict 风格）和
+    released_hops（set 风格），视图对象第一次访问时创建并缓存在实例上，现有模块不用改。
+    和原来的 dataclass 一样按字段比较相等，不可 hash。
+    """
+    __slots__ = (
+        "id", "src_ip", "dst_ip", "src_port", "dst_port",
+        "request_rate_bps", "size_bytes", "priority", "reason",
+        "send_rate_bps", "max_rate_bps", "dscp", "queue_id", "dst_pinned",
+        "status", "created_at", "allowed_at", "finished_at",
+        "_path", "_dpids", "_pos", "_hops", "_hop_set", "_released", "_extra",
+        "_v_bytes", "_v_time", "_v_rate", "_v_released",
+    )
+
+    def __init__(self, id: int, src_ip: str, dst_ip: str,
+                 src_port: int, dst_port: int,
+                 request_rate_bps: int, size_bytes: int,
+                 priority: int,  # 0=best, 1=silver, 2=gold
+                 reason: str,
+                 send_rate_bps: int = 0,
+                 max_rate_bps: int = 0,  # 允许提速到的上限，0 表示不提速（只按 request_rate_bps 发）
+                 dscp: Optional[int] = None,
+                 queue_id: Optional[int] = None,
+                 path=None,  # [(dpid, out_port), ...]
+                 status: str = "pending",  # pending/allowed/active/finished/failed
+                 created_at: Optional[float] = None,
+                 allowed_at: Optional[float] = None,
+                 finished_at: Optional[float] = None,
+                 dst_pinned: bool = False,  # 客户端指定了 dst_ip：目的 host 挂了不换目的
+                 hop_bytes: Optional[Dict[int, int]] = None,
+                 hop_last_time: Optional[Dict[int, float]] = None,
+                 hop_rate_bps: Optional[Dict[int, int]] = None,
+                 released_hops=None):
+        self.id = id
+        self.src_ip = src_ip
+        self.dst_ip = dst_ip
+        self.src_port = src_port
+        self.dst_port = dst_port
+        self.request_rate_bps = request_rate_bps
+        self.size_bytes = size_bytes
+        self.priority = priority
+        self.reason = reason
+
+        # 调度结果
+        self.send_rate_bps = send_rate_bps
+        self.max_rate_bps = max_rate_bps
+        self.dscp = dscp
+        self.queue_id = queue_id
+        self.dst_pinned = dst_pinned
+
+        # 状态
+        self.status = status
+        self.created_at = time.time() if created_at is None else created_at
+        self.allowed_at = allowed_at
+        self.finished_at = finished_at
+
+        self._path = _EMPTY_PATH
+        self._dpids = ()
+        self._pos = _PATH_POS[_EMPTY_PATH]
+        self._hops = _EMPTY_HOPS
+        self._hop_set = 0
+        self._released = 0
+        self._extra = None
+        self._v_bytes = self._v_time = self._v_rate = self._v_released = None
+        if path:
+            self.path = path
+
+        if hop_bytes:
+            self.hop_bytes = hop_bytes
+        if hop_last_time:
+            self.hop_last_time = hop_last_time
+        if hop_rate_bps:
+            self.hop_rate_bps = hop_rate_bps
+        if released_hops:
+            self.released_hops = released_hops
+
+    # ---------------- path ----------------
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    @path.setter
+    def path(self, value):
+        old = None
+        if self._hop_set or self._released or self._extra:
+            old = (dict(self.hop_bytes.items()), dict(self.hop_last_time.items()),
+                   dict(self.hop_rate_bps.items()), set(self.released_hops))
+        self._path = intern_path(value or ())
+        self._dpids = _PATH_DPIDS[self._path]
+        self._pos = _PATH_POS[self._path]
+        self._hops = array("d", bytes(8 * _HOP_FIELDS * len(self._path)))
+        self._hop_set = 0
+        self._released = 0
+        self._extra = None
+        if old is not None:
+            self.hop_bytes, self.hop_last_time, self.hop_rate_bps, self.released_hops = old
+
+    # ---------------- 每跳统计 ----------------
+
+    # 视图只持有 flow 和字段下标，path 变了也不用重建，第一次访问后缓存在实例上
+
+    @property
+    def hop_bytes(self) -> _HopView:  # dpid -> bytes
+        view = self._v_bytes
+        if view is None:
+            view = self._v_bytes = _HopView(self, _F_BYTES, int)
+        return view
+
+    @hop_bytes.setter
+    def hop_bytes(self, value):
+        self._assign(self.hop_bytes, value)
+
+    @property
+    def hop_last_time(self) -> _HopView:
+        view = self._v_time
+        if view is None:
+            view = self._v_time = _HopView(self, _F_TIME, float)
+        return view
+
+    @hop_last_time.setter
+    def hop_last_time(self, value):
+        self._assign(self.hop_last_time, value)
+
+    @property
+    def hop_rate_bps(self) -> _HopView:
+        view = self._v_rate
+        if view is None:
+            view = self._v_rate = _HopView(self, _F_RATE, int)
+        return view
+
+    @hop_rate_bps.setter
+    def hop_rate_bps(self, value):
+        self._assign(self.hop_rate_bps, value)
 
     # 逐跳释放相关
-    released_hops: set = field(default_factory=set)
+    @property
+    def released_hops(self) -> _ReleasedHops:
+        view = self._v_released
+        if view is None:
+            view = self._v_released = _ReleasedHops(self)
+        return view
+
+    @released_hops.setter
+    def released_hops(self, value):
+        value = list(value)  # value 可能就是自己的视图，先拷出来再清
+        view = self.released_hops
+        view.clear()
+        for dpid in value:
+            view.add(dpid)
+
+    # ---------------- 热路径直接访问（不创建视图对象） ----------------
+
+    def hop_index(self, dpid: int) -> int:
+        """dpid 在路径上的下标，不在路径上返回 -1"""
+        return self._pos.get(dpid, -1)
+
+    def get_hop_bytes(self, dpid: int, default: int = 0) -> int:
+        idx = self._pos.get(dpid)
+        if idx is None:
+            return self.hop_bytes.get(dpid, default)
+        slot = idx * _HOP_FIELDS + _F_BYTES
+        return int(self._hops[slot]) if self._hop_set >> slot & 1 else default
+
+    def get_hop_rate(self, dpid: int, default: int = 0) -> int:
+        idx = self._pos.get(dpid)
+        if idx is None:
+            return self.hop_rate_bps.get(dpid, default)
+        slot = idx * _HOP_FIELDS + _F_RATE
+        return int(self._hops[slot]) if self._hop_set >> slot & 1 else default
+
+    def set_hop_stats(self, dpid: int, byte_count: int, last_time: float, rate_bps: int):
+        """一次写入某跳的 bytes / last_time / rate，等价于分别写三个 dict"""
+        idx = self._pos.get(dpid)
+        if idx is None:
+            self.hop_bytes[dpid] = byte_count
+            self.hop_last_time[dpid] = last_time
+            self.hop_rate_bps[dpid] = rate_bps
+            return
+        base = idx * _HOP_FIELDS
+        hops = self._hops
+        hops[base + _F_BYTES] = byte_count
+        hops[base + _F_TIME] = last_time
+        hops[base + _F_RATE] = rate_bps
+        self._hop_set |= 0b111 << base
+
+    def is_hop_released(self, dpid: int) -> bool:
+        idx = self._pos.get(dpid)
+        if idx is None:
+            return dpid in self.released_hops
+        return bool(self._released >> idx & 1)
+
+    @staticmethod
+    def _assign(view: _HopView, value: dict):
+        items = list(value.items())  # value 可能就是 view 本身
+        view.clear()
+        for dpid, v in items:
+            view[dpid] = v
+
+    def _eq_key(self) -> tuple:
+        return (self.id, self.src_ip, self.dst_ip, self.src_port, self.dst_port,
+                self.request_rate_bps, self.size_bytes, self.priority, self.reason,
+                self.send_rate_bps, self.max_rate_bps, self.dscp, self.queue_id,
+                self.dst_pinned, tuple(self._path), self.status, self.created_at, self.allowed_at,
+                self.finished_at, dict(self.hop_bytes.items()), dict(self.hop_last_time.items()),
+                dict(self.hop_rate_bps.items()), set(self.released_hops))
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._eq_key() == other._eq_key()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return (f"Flow(id={self.id!r}, src_ip={self.src_ip!r}, dst_ip={self.dst_ip!r}, "
+                f"src_port={self.src_port!r}, dst_port={self.dst_port!r}, "
+                f"request_rate_bps={self.request_rate_bps!r}, size_bytes={self.size_bytes!r}, "
+                f"priority={self.priority!r}, send_rate_bps={self.send_rate_bps!r}, "
+                f"max_rate_bps={self.max_rate_bps!r}, "
+                f"dscp={self.dscp!r}, queue_id={self.queue_id!r}, path={list(self._path)!r}, "
+                f"status={self.status!r})")
+
+
+_EMPTY_HOPS = array("d")
 
 
 @dataclass
@@ -70,3 +473,38 @@ class PortState:
             self.reserved_silver_bps = max(0, self.reserved_silver_bps - bps)
         else:
             self.reserved_best_bps = max(0, self.reserved_best_bps - bps)
+
+
+@dataclass
+class TableState:
+    """交换机流表占用状态（按 dpid + table_id 计数）"""
+    dpid: int
+    table_id: int
+    max_entries: int = 0  # 0 表示不限制
+    active_count: int = 0
+
+    def can_install(self, n: int = 1) -> bool:
+        if self.max_entries <= 0:
+            return True
+        return self.active_count + n <= self.max_entries
+
+    def add(self, n: int = 1):
+        self.active_count += n
+
+    def remove(self, n: int = 1):
+        self.active_count = max(0, self.active_count - n)
+
+
+@dataclass
+class HostState:
+    """已注册 host 的存活状态（心跳驱动）：alive -> suspect -> dead"""
+    host_ip: str
+    last_seen: float = field(default_factory=time.time)
+    rtt_ms: Optional[float] = None  # agent 上报的 REST 往返时延，EWMA 平滑
+    state: str = "alive"            # alive / suspect / dead
+
+    def on_heartbeat(self, now: float, rtt_ms: Optional[float] = None):
+        self.last_seen = now
+        self.state = "alive"
+        if rtt_ms is not None:
+            self.rtt_ms = rtt_ms if self.rtt_ms is None else 0.8 * self.rtt_ms + 0.2 * rtt_ms
@@ -66,22 +66,99 @@ class DSCPManager:
     #     self.used.discard(dscp)
 # controller/port_manager.py
 from dataclasses import dataclass, field
-from typing import Dict, Tuple, Set, Optional
+from typing import Dict, List, Tuple, Set, Optional
 
 FlowKey = Tuple[str, int, str, int]  # (src_ip, src_port, dst_ip, dst_port)
 
 
+class PortBitmap:
+    """
+    [lo, hi] 端口段的两级位图（1 = 空闲）：
+      - _words[i]  : 第 i 个 64 位字，对应端口 lo + 64*i ... lo + 64*i + 63
+      - _summary   : 第 i 位为 1 表示 _words[i] 里还有空闲端口
+    alloc / free 都是常数次位运算；alloc 从上次分配的位置往后找（轮转），
+    刚释放的端口不会马上被复用，减少和对端残留连接撞 4 元组。
+    """
+    __slots__ = ("lo", "hi", "_words", "_summary", "_cursor", "free_count")
+
+    def __init__(self, lo: int, hi: int, reserved=()):
+        if hi < lo:
+            raise ValueError(f"invalid port range {lo}-{hi}")
+        self.lo = lo
+        self.hi = hi
+        n = hi - lo + 1
+        n_words = (n + 63) // 64
+        self._words: List[int] = [(1 << 64) - 1] * n_words
+        tail = n - 64 * (n_words - 1)
+        self._words[-1] = (1 << tail) - 1
+        self._summary = (1 << n_words) - 1
+        self._cursor = 0  # 下一次从这个偏移开始找
+        self.free_count = n
+        for port in reserved:
+            self.take(port)
+
+    def __contains__(self, port: int) -> bool:
+        return self.lo <= port <= self.hi
+
+    def is_free(self, port: int) -> bool:
+        off = port - self.lo
+        return port in self and bool(self._words[off >> 6] >> (off & 63) & 1)
+
+    def _clear(self, off: int):
+        w = off >> 6
+        self._words[w] &= ~(1 << (off & 63))
+        if not self._words[w]:
+            self._summary &= ~(1 << w)
+        self.free_count -= 1
+
+    def take(self, port: int) -> bool:
+        """把指定端口标记为占用（保留端口 / 外部指定的端口），已占用返回 False"""
+        if not self.is_free(port):
+            return False
+        self._clear(port - self.lo)
+        return True
+
+    def alloc(self) -> Optional[int]:
+        if not self._summary:
+            return None
+        cur = self._cursor
+        w = cur >> 6
+        # 1) 游标所在字里、游标之后的位
+        bits = self._words[w] >> (cur & 63) << (cur & 63) if w < len(self._words) else 0
+        if not bits:
+            # 2) 游标之后第一个有空位的字；3) 都没有就从头绕回来
+            later = self._summary >> (w + 1) << (w + 1)
+            w = ((later or self._summary) & -(later or self._summary)).bit_length() - 1
+            bits = self._words[w]
+        off = (w << 6) + (bits & -bits).bit_length() - 1
+        self._clear(off)
+        self._cursor = off + 1 if off + 1 <= self.hi - self.lo else 0
+        return self.lo + off
+
+    def free(self, port: int) -> bool:
+        if port not in self or self.is_free(port):
+            return False
+        off = port - self.lo
+        w = off >> 6
+        self._words[w] |= 1 << (off & 63)
+        self._summary |= 1 << w
+        self.free_count += 1
+        return True
+
+
 @dataclass
 class PortManager:
     """
     负责给发流分配 src_port / dst_port，并维护 4 元组到 flow_id 的映射。
 
     约定：
-    - 发流使用的端口范围：[base_port, max_port]
+    - 每个 (host_ip, role) 一个独立的端口池（PortBitmap），role 为 "src" / "dst"
+    - src / dst 用不相交的端口段，同一台 host 既发又收时不会撞端口
     - 会自动跳过 reserved_ports（例如 Ryu 内部 TCP server、REST、host permit 口）
+    - flow 结束时 release_flow 归还端口并删掉 4 元组映射
     """
-    base_port: int = 20000
-    max_port: int = 40000
+    src_range: Tuple[int, int] = (20000, 29999)
+    dst_range: Tuple[int, int] = (30000, 40000)
 
     # Ryu 相关的已知端口，不参与发流端口分配，避免冲突
     # tcp_server_host: 172.17.0.1
@@ -89,59 +166,75 @@ class PortManager:
     rest_port: int = 8080
     host_permit_port: int = 10000
 
-    _next_port: int = field(default=20000, init=False)
     reserved_ports: Set[int] = field(default_factory=set, init=False)
 
+    # (host_ip, role) -> 端口池
+    _pools: Dict[Tuple[str, str], PortBitmap] = field(default_factory=dict, init=False)
+
     # 只在 controller 内部保存完整映射，方便调试/查表
     flow_by_4tuple: Dict[FlowKey, int] = field(default_factory=dict, init=False)
 
     def __post_init__(self) -> None:
+        lo_s, hi_s = self.src_range
+        lo_d, hi_d = self.dst_range
+        if not (hi_s < lo_d or hi_d < lo_s):
+            raise ValueError(f"src_range {self.src_range} overlaps dst_range {self.dst_range}")
         # 把 Ryu 用到的端口配置为保留端口
         self.reserved_ports.update(
             {self.tcp_server_port, self.rest_port, self.host_permit_port}
         )
 
-    # ----------------- 端口分配内部函数 -----------------
-
-    def _alloc_port(self) -> int:
-        """
-        简单轮询的端口分配器：
-        - 从 [base_port, max_port] 中轮询
-        - 自动跳过 reserved_ports
-        - 不做“是否已被系统占用”的检查（实验环境够用）
-        """
-        start = self._next_port
-
-        while True:
-            port = self._next_port
-            self._next_port += 1
-            if self._next_port > self.max_port:
-                self._next_port = self.base_port
+    @classmethod
+    def from_config(cls, cfg: Optional[dict]) -> "PortManager":
+        """controller_config.yml 的 ports 段：src_range / dst_range: [lo, hi]"""
+        cfg = cfg or {}
+        kwargs = {}
+        for key in ("src_range", "dst_range"):
+            if key in cfg:
+                lo, hi = cfg[key]
+                kwargs[key] = (int(lo), int(hi))
+        return cls(**kwargs)
 
-            # 跳过保留端口
-            if port in self.reserved_ports:
-                # 如果绕了一圈还没找到，说明可用端口已经耗尽
-                if self._next_port == start:
-                    raise RuntimeError("No available ports in the configured range")
-                continue
+    # ----------------- 端口分配内部函数 -----------------
 
-            return port
+    def _pool(self, host_ip: str, role: str) -> PortBitmap:
+        key = (host_ip, role)
+        pool = self._pools.get(key)
+        if pool is None:
+            lo, hi = self.src_range if role == "src" else self.dst_range
+            pool = PortBitmap(lo, hi, reserved=(p for p in self.reserved_ports if lo <= p <= hi))
+            self._pools[key] = pool
+        return pool
+
+    def _alloc_port(self, host_ip: str, role: str) -> int:
+        port = self._pool(host_ip, role).alloc()
+        if port is None:
+            raise RuntimeError(f"No available {role} ports for {host_ip}")
+        return port
 
     # ----------------- 对外 API：分配 src / dst 端口 -----------------
 
     def alloc_src_port(self, src_ip: str) -> int:
-        """
-        为某个 src_ip 分配一个 src_port。
-        当前实现对 src_ip 不做区分，如果以后要做到 per-host 池，可以扩展。
-        """
-        return self._alloc_port()
+        """为某个 src_ip 从它自己的 src 池里分配一个 src_port，耗尽时抛 RuntimeError"""
+        return self._alloc_port(src_ip, "src")
 
     def alloc_dst_port(self, dst_ip: str) -> int:
+        """为某个 dst_ip 从它自己的 dst 池里分配一个 dst_port，耗尽时抛 RuntimeError"""
+        return self._alloc_port(dst_ip, "dst")
+
+    def try_alloc_pair(self, src_ip: str, dst_ip: str) -> Optional[Tuple[int, int]]:
         """
-        为某个 dst_ip 分配一个 dst_port。
-        同样只做简单轮询，避免和 reserved_ports 冲突。
+        一次分配 (src_port, dst_port)，任一侧耗尽时回滚并返回 None，
+        调度器据此让 flow 留在 pending。
         """
-        return self._alloc_port()
+        src_port = self._pool(src_ip, "src").alloc()
+        if src_port is None:
+            return None
+        dst_port = self._pool(dst_ip, "dst").alloc()
+        if dst_port is None:
+            self._pool(src_ip, "src").free(src_port)
+            return None
+        return src_port, dst_port
 
     def alloc_flow_ports(
         self,
@@ -181,6 +274,33 @@ class PortManager:
 
         return src_port, dst_port
 
+    def free_port(self, host_ip: str, role: str, port: int) -> bool:
+        pool = self._pools.get((host_ip, role))
+        return pool.free(port) if pool is not None else False
+
+    def release_flow(
+        self,
+        flow_id: int,
+        src_ip: str, src_port: int,
+        dst_ip: str, dst_port: int,
+    ) -> bool:
+        """
+        flow 结束时归还端口并删掉 4 元组映射。
+        只有 4 元组确实绑定在这个 flow_id 上才释放，避免 pending 时的请求端口被误还。
+        """
+        key = (src_ip, src_port, dst_ip, dst_port)
+        if self.flow_by_4tuple.get(key) != flow_id:
+            return False
+        del self.flow_by_4tuple[key]
+        self.free_port(src_ip, "src", src_port)
+        self.free_port(dst_ip, "dst", dst_port)
+        return True
+
+    def pool_usage(self) -> List[Tuple[str, str, int, int]]:
+        """[(host_ip, role, used, total), ...]，调试 / 日志用"""
+        return [(ip, role, (p.hi - p.lo + 1) - p.free_count, p.hi - p.lo + 1)
+                for (ip, role), p in self._pools.items()]
+
     # ----------------- 流绑定 / 查询 -----------------
 
     def bind_flow(
@@ -196,6 +316,16 @@ class PortManager:
         self.flow_by_4tuple[key] = flow_id
         return key
 
+    def unbind_flow(
+        self,
+        src_ip: str, src_port: int,
+        dst_ip: str, dst_port: int,
+    ) -> Optional[int]:
+        """
+        只解除 4 元组绑定、不归还端口，返回原来的 flow_id。
+        """
+        return self.flow_by_4tuple.pop((src_ip, src_port, dst_ip, dst_port), None)
+
     def get_flow_id(
         self,
         src_ip: str, src_port: int,
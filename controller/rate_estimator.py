@@ -0,0 +1,124 @@
+'''
+Author: yc && qq747339545@163.com
+Date: 2025-12-02 15:40:18
+LastEditTime: 2025-12-02 15:40:18
+FilePath: /sdn_qos/controller/rate_estimator.py
+Description: 基于交换机侧 duration 的每跳速率估计
+
+Copyright (c) 2025 by ${git_name_email}, All Rights Reserved.
+'''
+# controller/rate_estimator.py
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+
+class EwmaRate:
+    """指数加权平均：rate = alpha * 本次样本 + (1 - alpha) * 上次估计"""
+    __slots__ = ("alpha", "rate")
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.rate: Optional[float] = None
+
+    def seed(self, t: float, byte_count: int, rate: float):
+        self.rate = rate
+
+    def update(self, t: float, byte_count: int, dt: float, db: int) -> float:
+        sample = db * 8 / dt
+        if self.rate is None:
+            self.rate = sample
+        else:
+            self.rate = self.alpha * sample + (1 - self.alpha) * self.rate
+        return self.rate
+
+
+class RegressionRate:
+    """滑动窗口最小二乘：对最近 window 个 (t, bytes) 样本拟合斜率"""
+    __slots__ = ("samples", "rate")
+
+    def __init__(self, window: int):
+        self.samples = deque(maxlen=max(2, window))
+        self.rate: Optional[float] = None
+
+    def seed(self, t: float, byte_count: int, rate: float):
+        self.samples.append((t, byte_count))
+        self.rate = rate
+
+    def update(self, t: float, byte_count: int, dt: float, db: int) -> float:
+        self.samples.append((t, byte_count))
+        n = len(self.samples)
+        if n < 2:
+            self.rate = db * 8 / dt
+            return self.rate
+        mean_t = sum(s[0] for s in self.samples) / n
+        mean_b = sum(s[1] for s in self.samples) / n
+        var_t = sum((s[0] - mean_t) ** 2 for s in self.samples)
+        if var_t <= 0:
+            return self.rate or 0.0
+        cov = sum((s[0] - mean_t) * (s[1] - mean_b) for s in self.samples)
+        self.rate = max(0.0, cov / var_t * 8)
+        return self.rate
+
+
+class HopRateEstimator:
+    """
+    每个 (flow_id, dpid) 一个估计器，时间轴用 OFPFlowStats 的 duration_sec/nsec，
+    不受控制器收包排队抖动影响。
+
+    - 第一个样本：用 byte_count / duration 作为初值（规则从安装起的平均速率）
+    - duration 回退（规则被重装）时重置该 hop 的状态
+    """
+
+    def __init__(self, method: str = "ewma", ewma_alpha: float = 0.3, window: int = 5):
+        if method not in ("ewma", "regression"):
+            raise ValueError(f"unknown rate estimator method: {method}")
+        self.method = method
+        self.ewma_alpha = ewma_alpha
+        self.window = window
+        # (flow_id, dpid) -> (last_switch_t, last_bytes, estimator)
+        self._state: Dict[Tuple[int, int], tuple] = {}
+
+    @classmethod
+    def from_config(cls, cfg: Optional[dict]) -> "HopRateEstimator":
+        cfg = cfg or {}
+        return cls(
+            method=str(cfg.get("method", "ewma")),
+            ewma_alpha=float(cfg.get("ewma_alpha", 0.3)),
+            window=int(cfg.get("window", 5)),
+        )
+
+    def _new(self):
+        if self.method == "regression":
+            return RegressionRate(self.window)
+        return EwmaRate(self.ewma_alpha)
+
+    def update(self, flow_id: int, dpid: int, switch_t: float, byte_count: int) -> int:
+        """喂一个样本，返回平滑后的速率 (bps)"""
+        key = (flow_id, dpid)
+        state = self._state.get(key)
+
+        if state is None or switch_t < state[0]:
+            est = self._new()
+            rate = byte_count * 8 / switch_t if switch_t > 0 else 0.0
+            est.seed(switch_t, byte_count, rate)
+            self._state[key] = (switch_t, byte_count, est)
+            return int(rate)
+
+        last_t, last_bytes, est = state
+        dt = switch_t - last_t
+        if dt <= 0:
+            # 同一个样本重复上报，不更新
+            return int(est.rate or 0)
+        rate = est.update(switch_t, byte_count, dt, max(0, byte_count - last_bytes))
+        self._state[key] = (switch_t, byte_count, est)
+        return int(rate)
+
+    def drop_flow(self, flow_id: int, dpids):
+        for dpid in dpids:
+            self._state.pop((flow_id, dpid), None)
+
+
+def predict_completion(size_bytes: int, hop_bytes: int, rate_bps: int) -> float:
+    """剩余字节 / 当前速率，速率未知时返回 -1"""
+    rem = max(0, size_bytes - hop_bytes)
+    return (rem * 8 / rate_bps) if rate_bps > 0 else -1
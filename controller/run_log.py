@@ -0,0 +1,203 @@
+'''
+Author: yc && qq747339545@163.com
+Date: 2025-12-05 10:12:40
+LastEditTime: 2025-12-05 10:12:40
+FilePath: /sdn_qos/controller/run_log.py
+Description: 分段追加的 run 日志（JSONL 段文件 + key -> offset 二进制索引）
+
+Copyright (c) 2025 by ${git_name_email}, All Rights Reserved.
+'''
+# controller/run_log.py
+import json
+import os
+import sys
+import threading
+import time
+from array import array
+from typing import Dict, Iterator, List, Optional, Set
+
+# 索引行：key, (seg_no << 40) | offset, length，三个 u64，小端
+INDEX_WORDS = 3
+SEG_SHIFT = 40
+OFFSET_MASK = (1 << SEG_SHIFT) - 1
+
+TS_FMT = "%Y-%m-%d %H:%M:%S"
+
+
+def _seg_name(seg_no: int) -> str:
+    return f"seg-{seg_no:06d}.jsonl"
+
+
+def _to_le(arr: array) -> array:
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr
+
+
+class RunLog:
+    """
+    一个日志流（比如 progress / portstate）：
+      <root>/seg-000000.jsonl, seg-000001.jsonl ...  每行一条记录 {"t": ts, "k": key, "line": ...}
+      <root>/index.bin                               每条记录一行 INDEX_WORDS 个 u64
+
+    所有 flow 共用几个段文件，目录里的文件数和 flow 数无关；
+    段写满 segment_bytes 换下一个。先写数据再写索引，崩溃时最多丢索引尾部；
+    重新打开时把半行和越界的索引尾部截掉，读端也会跳过越界的索引行。
+    """
+
+    def __init__(self, root: str, segment_bytes: int = 64 << 20, flush: bool = True):
+        self.root = root
+        self.segment_bytes = segment_bytes
+        self.flush_each = flush
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+
+        segs = sorted(n for n in os.listdir(root) if n.startswith("seg-") and n.endswith(".jsonl"))
+        self._seg_no = int(segs[-1][4:10]) if segs else 0
+        self._open_segment()
+        self._repair_index()
+        self._index_f = open(os.path.join(root, "index.bin"), "ab")
+
+    def _repair_index(self):
+        """
+        重新打开时修索引尾部：崩溃可能留下半行（之后追加的行全部错位），
+        也可能留下指向段文件末尾之外的行（索引落盘了、数据没落盘）；都截掉
+        """
+        path = os.path.join(self.root, "index.bin")
+        if not os.path.exists(path):
+            return
+        row = array("Q")
+        row_bytes = INDEX_WORDS * row.itemsize
+        size = os.path.getsize(path)
+        good = size - size % row_bytes
+        seg_sizes: Dict[int, int] = {}
+        with open(path, "rb") as f:
+            while good:
+                f.seek(good - row_bytes)
+                row = array("Q")
+                row.frombytes(f.read(row_bytes))
+                _key, loc, length = _to_le(row)
+                seg_no, off = loc >> SEG_SHIFT, loc & OFFSET_MASK
+                if seg_no not in seg_sizes:
+                    seg_path = os.path.join(self.root, _seg_name(seg_no))
+                    seg_sizes[seg_no] = os.path.getsize(seg_path) if os.path.exists(seg_path) else -1
+                if off + length <= seg_sizes[seg_no]:
+                    break
+                good -= row_bytes
+        if good < size:
+            os.truncate(path, good)
+
+    def _open_segment(self):
+        path = os.path.join(self.root, _seg_name(self._seg_no))
+        self._seg_f = open(path, "ab")
+        self._offset = self._seg_f.tell()
+
+    def append(self, key: int, line: str, t: Optional[float] = None, **fields):
+        rec = {"t": time.time() if t is None else t, "k": key, "line": line}
+        if fields:
+            rec.update(fields)
+        data = (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            if self._offset and self._offset + len(data) > self.segment_bytes:
+                self._seg_f.close()
+                self._seg_no += 1
+                self._open_segment()
+            off = self._offset
+            self._seg_f.write(data)
+            self._offset += len(data)
+            row = _to_le(array("Q", (key, (self._seg_no << SEG_SHIFT) | off, len(data))))
+            self._index_f.write(row.tobytes())
+            if self.flush_each:
+                self._seg_f.flush()
+                self._index_f.flush()
+
+    def append_lines(self, key: int, lines: List[str], t: Optional[float] = None):
+        t = time.time() if t is None else t
+        for line in lines:
+            self.append(key, line, t)
+
+    def flush(self):
+        with self._lock:
+            self._seg_f.flush()
+            self._index_f.flush()
+
+    def close(self):
+        with self._lock:
+            self._seg_f.close()
+            self._index_f.close()
+
+
+class RunLogReader:
+    """
+    读 RunLog：打开时把 index.bin 整个读进一个 array('Q')，按 key 查询用 array.index
+    （C 里顺序扫描）找到所有行，再按 (段, 偏移) seek 读记录，不遍历目录、不读无关 flow 的数据。
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        idx = array("Q")
+        with open(os.path.join(root, "index.bin"), "rb") as f:
+            buf = f.read()
+        row_bytes = INDEX_WORDS * idx.itemsize
+        idx.frombytes(buf[:len(buf) - len(buf) % row_bytes])
+        self._idx = _to_le(idx)
+        self._keys = self._idx[0::INDEX_WORDS]
+        self._seg_sizes: Dict[int, int] = {}
+        self._files: Dict[int, object] = {}
+
+    @staticmethod
+    def exists(root: str) -> bool:
+        return os.path.isfile(os.path.join(root, "index.bin"))
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def keys(self) -> Set[int]:
+        return set(self._keys)
+
+    def _rows(self, key: int) -> Iterator[int]:
+        keys = self._keys
+        i = 0
+        while True:
+            try:
+                i = keys.index(key, i)
+            except ValueError:
+                return
+            yield i
+            i += 1
+
+    def _seg_file(self, seg_no: int):
+        f = self._files.get(seg_no)
+        if f is None:
+            path = os.path.join(self.root, _seg_name(seg_no))
+            f = open(path, "rb")
+            self._files[seg_no] = f
+            self._seg_sizes[seg_no] = os.path.getsize(path)
+        return f
+
+    def records(self, key: int) -> List[dict]:
+        out = []
+        idx = self._idx
+        for row in self._rows(key):
+            loc = idx[row * INDEX_WORDS + 1]
+            length = idx[row * INDEX_WORDS + 2]
+            seg_no, off = loc >> SEG_SHIFT, loc & OFFSET_MASK
+            try:
+                f = self._seg_file(seg_no)
+            except OSError:
+                continue
+            if off + length > self._seg_sizes[seg_no]:
+                continue
+            f.seek(off)
+            out.append(json.loads(f.read(length)))
+        return out
+
+    def lines(self, key: int) -> List[str]:
+        """还原成文本日志的样子："<YYYY-mm-dd HH:MM:SS> <line>"，现有的正则解析可以直接用"""
+        return [f"{time.strftime(TS_FMT, time.localtime(r['t']))} {r['line']}"
+                for r in self.records(key)]
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
@@ -2,7 +2,7 @@
 import json
 import threading
 import time
-from typing import Dict
+from typing import Dict, List, Set, Tuple
 
 from ryu.base import app_manager
 from ryu.controller import ofp_event
@@ -18,10 +18,15 @@ from port_manager import DSCPManager,PortManager
 from flow_installer import FlowInstaller
 from stats_collector import StatsCollector
 from host_channel import HostChannel
-from exp_logger import alloc_run_id
+from exp_logger import alloc_run_id, get_run_context
+from events import EventLog
+from telemetry_store import TelemetryStore
+from flow_archive import FlowArchive
+from flow_id import FlowIdAllocator
 
 import datetime
 import os
+from collections import deque
 # REST 配置
 SCHEDULER_INSTANCE_NAME = 'scheduler_api_app'
 BASE_URL = '/scheduler'
@@ -61,9 +66,18 @@ class GlobalScheduler(app_manager.RyuApp):
         self.flows: Dict[int, Flow] = {}
         self.pending_flows: Dict[int, Flow] = {}
         self.active_flows: Dict[int, Flow] = {}
-
-        # 每个源 host 单独维护计数器
-        self._flow_seq_per_host: Dict[int, int] = {}   # host_no -> local seq
+        # 已结束的 flow 在 flows 里保留 archive_after 秒，之后写进 FlowArchive 并移出内存
+        self.archive = FlowArchive(self.log_root)
+        self.archive_after = 30.0
+        self._finished_queue = deque()  # (finished_at, flow_id)，按结束时间先后
+        # 已发 RATE_UPDATE 降速、还没等到 ACK 的 flow：flow_id -> 目标速率（预留等 ACK 后再缩）
+        self._rate_shrinking: Dict[int, int] = {}
+        # dpid -> 经过该交换机、规则仍在的活跃 flow_id（StatsCollector 只处理受影响的 flow）
+        self.flows_by_dpid: Dict[int, Set[int]] = {}
+
+        # 全局 flow_id：跨 run 单调递增，高水位持久化在 logs 根目录，编码进 cookie 高 48 位
+        self.flow_ids = FlowIdAllocator(os.path.dirname(self.log_root), run_ts=self.run_ts)
+        self.logger.info(f"flow_id allocator: first_id={self.flow_ids.first_id}")
 
         
 
@@ -88,26 +102,64 @@ class GlobalScheduler(app_manager.RyuApp):
             for port_no_str, cap in port_map.get('capacity_bps', {}).items():
                 port_capacity[(dpid, int(port_no_str))] = int(cap)
 
-        self.admission = AdmissionControl(port_capacity=port_capacity,log_root=self.log_root)
+        # 从 topo_config.yml 读取每台交换机各流表的规则上限（可选）
+        table_capacity = {} # (dpid, table_id) -> max_entries
+        tables_cfg = topo_cfg.get('tables', {}) or {}
+        for dpid_str, table_map in tables_cfg.items():
+            dpid = int(dpid_str, 0) if dpid_str.startswith('0x') else int(dpid_str)
+            for table_id_str, max_entries in table_map.get('max_entries', {}).items():
+                table_capacity[(dpid, int(table_id_str))] = int(max_entries)
+
+        with open(ctrl_cfg_file, 'r') as f:
+            ctrl_cfg = yaml.safe_load(f) or {}
+
+        # 本 run 的日志上下文：per-flow 日志按 run_log_format 写目录或分段文件，
+        # 后面的 AdmissionControl / HostChannel / StatsCollector 拿到的都是这一个
+        self.run_ctx = get_run_context(os.path.dirname(self.log_root), self.run_ts,
+                                       log_format=str(ctrl_cfg.get('run_log_format', 'dirs')))
+        self.logger.info(f"run_log_format={self.run_ctx.log_format}")
+        # 结构化事件（flow 生命周期 / admission / install / release / host / rate），
+        # 格式化和写盘在 QueueListener 线程里做，热路径按类别采样 / 限速
+        self.events = EventLog.from_config(self.log_root, ctrl_cfg.get('events'))
+
+        self.admission = AdmissionControl(port_capacity=port_capacity,log_root=self.log_root,
+                                          table_capacity=table_capacity)
+
         self.dscp_mgr = DSCPManager()
-        self.port_mgr = PortManager()
+        # 每个 (host, src/dst) 一个端口池，端口段见 controller_config.yml 的 ports
+        self.port_mgr = PortManager.from_config(ctrl_cfg.get('ports'))
         # FlowInstaller 需要访问 self.datapaths
         self.flow_installer = FlowInstaller(self)
 
         # host TCP 通道
-        with open(ctrl_cfg_file, 'r') as f:
-            ctrl_cfg = yaml.safe_load(f) or {}
         tcp_host = ctrl_cfg.get('tcp_server_host', '0.0.0.0') # TCP服务器监听地址
         tcp_port = int(ctrl_cfg.get('tcp_server_port', 9000)) # TCP服务器监听端口
         self.logger.info(f"tcp_host:{tcp_host} tcp_port:{tcp_port}s")
-        self.host_channel = HostChannel(tcp_host, tcp_port,run_ts=self.run_ts,port_mgr=self.port_mgr)
+        self.host_channel = HostChannel(tcp_host, tcp_port,run_ts=self.run_ts,port_mgr=self.port_mgr,
+                                        dst_select=str(ctrl_cfg.get('dst_select', 'p2c')),
+                                        heartbeat_cfg=ctrl_cfg.get('heartbeat'),
+                                        backpressure_cfg=ctrl_cfg.get('backpressure'),
+                                        events=self.events)
         # self.host_channel.start()
+        # 目的 host 选择的入向负载跟着带宽账本走：host 的接入端口（到它的路径最后一跳）预留一变就推给 HostChannel
+        self._ingress_hosts = self._build_ingress_ports()
+        self.admission.port_listeners.append(self._on_port_change)
+        for (dpid, port_no) in self._ingress_hosts:
+            ps = self.admission.ports.get((dpid, port_no))
+            if ps is not None:
+                self._on_port_change(ps)
+
+        # 内存时序存储：per-flow per-hop 字节/速率、per-port 利用率
+        self.telemetry = TelemetryStore.from_config(ctrl_cfg.get('telemetry'))
 
         # StatsCollector
-        self.stats_collector = StatsCollector(self,self.logger, interval=1.0)
+        self.stats_collector = StatsCollector(self,self.logger, interval=1.0,
+                                              rate_cfg=ctrl_cfg.get('rate_estimator'),
+                                              poll_cfg=ctrl_cfg.get('stats_poll'))
         self.stats_collector.start()
 
         # 调度线程
+        self._wake = hub.Event()
         self._scheduler_thread = hub.spawn(self._scheduler_loop)
 
         # REST API Controller
@@ -149,6 +201,8 @@ class GlobalScheduler(app_manager.RyuApp):
         self.datapaths[dpid] = datapath
         # 先删除所有现有流表规则
         self._delete_all_flows(datapath)
+        self.admission.reset_tables(dpid)
+        self.flow_installer.forget_switch(dpid)
         # 安装默认 pipeline
         self.logger.info(">>> install_table0_1_2_default CALLED, installing DSCP rules ...")
         self.flow_installer.install_table0_1_2_default(datapath)
@@ -166,12 +220,19 @@ class GlobalScheduler(app_manager.RyuApp):
             "OFPErrorMsg received: type=0x%02x code=0x%02x data=%s",
             msg.type, msg.code, utils.hex_array(msg.data)
     )
+        ofp = msg.datapath.ofproto
+        if msg.type == ofp.OFPET_FLOW_MOD_FAILED and msg.code == ofp.OFPFMFC_TABLE_FULL:
+            # 本地计数与交换机不一致，立即拉一次 TableStats 校准
+            self.stats_collector.request_table_stats(msg.datapath)
     
     
     
     @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
     def on_flow_stats_reply(self, ev):
-        self.stats_collector.on_flow_stats(ev.msg.datapath.id, ev.msg.body)
+        msg = ev.msg
+        more = bool(msg.flags & msg.datapath.ofproto.OFPMPF_REPLY_MORE)
+        self.stats_collector.on_flow_stats(msg.datapath.id, msg.body,
+                                           msg_len=msg.msg_len or 0, more=more)
 
     @set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
     def on_port_stats_reply(self, ev):
@@ -180,6 +241,10 @@ class GlobalScheduler(app_manager.RyuApp):
     def on_queue_stats_reply(self, ev):
         self.stats_collector.on_queue_stats(ev.msg.datapath.id, ev.msg.body)
 
+    @set_ev_cls(ofp_event.EventOFPTableStatsReply, MAIN_DISPATCHER)
+    def on_table_stats_reply(self, ev):
+        self.stats_collector.on_table_stats(ev.msg.datapath.id, ev.msg.body)
+
 
 
     @set_ev_cls(ofp_event.EventOFPStateChange, [MAIN_DISPATCHER, CONFIG_DISPATCHER])
@@ -197,8 +262,9 @@ class GlobalScheduler(app_manager.RyuApp):
 
     def new_flow(self, src_ip: str, dst_ip: str, request_rate_bps: int,
              size_bytes: int, priority: int,
-             src_port: int = 0, dst_port: int = 0) -> Flow:
-        flow_id = self._alloc_flow_id(src_ip)
+             src_port: int = 0, dst_port: int = 0, max_rate_bps: int = 0,
+             dst_pinned: bool = False) -> Flow:
+        flow_id = self.flow_ids.alloc()
 
         flow = Flow(
             id=flow_id,
@@ -209,30 +275,147 @@ class GlobalScheduler(app_manager.RyuApp):
             priority=priority,
             src_port=src_port,
             dst_port=dst_port,
+            max_rate_bps=max_rate_bps,
+            dst_pinned=dst_pinned,
             reason="",   # 你 Flow dataclass 里有 reason 字段，记得给默认值
         )
         self.flows[flow_id] = flow
         self.pending_flows[flow_id] = flow
 
-        self.logger.info(
-            "[scheduler] new_flow id=%d %s:%s -> %s:%s size=%d req_rate=%d priority=%d",
-            flow_id, src_ip, src_port, dst_ip, dst_port, size_bytes, request_rate_bps, priority
-        )
+        self.events.emit("flow", "created", flow_id=flow_id, src_ip=src_ip, src_port=src_port,
+                         dst_ip=dst_ip, dst_port=dst_port, size_bytes=size_bytes,
+                         request_rate_bps=request_rate_bps, priority=priority,
+                         max_rate_bps=max_rate_bps, dst_pinned=dst_pinned)
         return flow
 
 
+    def submit_flows(self, specs) -> list:
+        """
+        批量提交 flow 请求（/request 和 /request_batch 共用）：
+        逐条解析、挑目的、建 Flow，单条出错只记在这一条的结果里；
+        全部入队后唤醒一次调度循环，让这一批在同一轮 admission 里处理。
+        返回与 specs 一一对应的结果 dict。
+        """
+        results = []
+        queued = 0
+        for i, msg in enumerate(specs):
+            try:
+                spec = _parse_flow_spec(msg)
+            except ValueError as e:
+                results.append({"index": i, "decision": "rejected", "error": str(e), "code": 400})
+                continue
+
+            # 让 HostChannel 帮忙挑一个目的 host（已注册且 != src_ip，按入向负载/路径剩余带宽选）；
+            # 指定的 dst 只是 busy 照样排队（pending 循环会等 backoff），suspect 的先拒掉让客户端重试
+            want_dst = spec.pop("dst_ip")
+            if want_dst and want_dst != spec["src_ip"] and self.host_channel.is_registered(want_dst) \
+                    and not self.host_channel.is_alive(want_dst):
+                results.append({"index": i, "decision": "rejected",
+                                "error": f"dst_ip {want_dst} not reachable (no recent heartbeat)",
+                                "code": 503})
+                continue
+            dst_info = self.host_channel.pick_dst_for_flow(
+                spec["src_ip"], need_bps=spec["request_rate_bps"], dst_ip=want_dst)
+            if not dst_info:
+                if want_dst:
+                    err = {"error": f"dst_ip {want_dst} not registered or same as src", "code": 400}
+                else:
+                    err = {"error": "no dst host available", "code": 503}
+                results.append(dict(index=i, decision="rejected", **err))
+                continue
+
+            dst_ip, dst_port = dst_info
+            flow = self.new_flow(dst_ip=dst_ip, dst_port=dst_port,
+                                 dst_pinned=bool(want_dst), **spec)
+            queued += 1
+            results.append({
+                "index": i,
+                "decision": "queued",
+                "flow_id": flow.id,
+                "status": flow.status,
+                "dst_ip": flow.dst_ip,
+                "dst_port": flow.dst_port,
+            })
+        if queued:
+            self._wake.set()
+        return results
+
+    def host_report(self, reports) -> list:
+        """
+        agent 接收端上报 flow 完成（/host_report 单条和批量共用）：
+        收到就删全路径规则、释放预留 / DSCP / 端口，不再等轮询的字节或空闲判定；
+        有资源释放就唤醒调度循环，让 pending 的 flow 立刻用上。
+        上报字段：flow_id, status, complete, bytes_received, lost, first_ts, last_ts, jitter_ms ...
+        complete=false（没收满 size_bytes）一律按 failed 结束。
+        last_ts 是接收端看到最后一个字节的时间（Mininet 里和控制器同一时钟），用来算释放延迟。
+        """
+        now = time.time()
+        results = []
+        released = 0
+        for i, report in enumerate(reports):
+            try:
+                flow_id = int(report.get("flow_id"))
+            except (AttributeError, TypeError, ValueError):
+                results.append({"index": i, "ok": False, "error": "invalid flow_id"})
+                continue
+            flow = self.active_flows.get(flow_id)
+            if flow is None:
+                # 已经被轮询判定结束，或者还没放行
+                results.append({"index": i, "flow_id": flow_id, "ok": False, "error": "not active"})
+                continue
+
+            status = "finished" if report.get("status", "finished") == "finished" else "failed"
+            if report.get("complete") is False:
+                status = "failed"
+            try:
+                last_ts = float(report.get("last_ts") or now)
+            except (TypeError, ValueError):
+                last_ts = now
+            lag = max(0.0, now - last_ts)
+
+            self.stats_collector.log_flow_progress(flow, [
+                f"[HostReport] flow={flow.id} status={status} complete={report.get('complete')} "
+                f"bytes_received={report.get('bytes_received')}/{flow.size_bytes} "
+                f"lost={report.get('lost')} reordered={report.get('reordered')} "
+                f"jitter_ms={report.get('jitter_ms')} first_ts={report.get('first_ts')} "
+                f"last_ts={report.get('last_ts')} release_lag={lag * 1000:.0f}ms",
+            ])
+            self.finish_flow(flow, status)
+            self.stats_collector.note_release_lag("host_report", lag)
+            released += 1
+            self.events.emit("release", "host_report", flow_id=flow.id, status=status,
+                             release_lag_ms=round(lag * 1000, 1))
+            results.append({"index": i, "flow_id": flow_id, "ok": True,
+                            "release_lag_ms": round(lag * 1000, 1)})
+        if released:
+            # pending 的 flow 马上用上释放出来的预留；没有 pending 就分给能提速的 active flow
+            self._wake.set()
+        return results
+
     def _scheduler_loop(self):
         while True:
             try:
+                dead = self.host_channel.check_liveness()
+                if dead:
+                    self._evict_hosts(dead)
+                for msg_type, flow_id, host_ip in self.host_channel.take_rejected():
+                    self._on_ctrl_rejected(msg_type, flow_id, host_ip)
+                for flow_id, applied, rate_bps in self.host_channel.take_rate_acks():
+                    self._on_rate_ack(flow_id, applied, rate_bps)
                 self._run_scheduler_once()
+                self._archive_finished_flows()
             except Exception:
                 self.logger.exception("scheduler_loop error")
-            time.sleep(1.0)
+            # 最多等 1s；有新 flow 提交时 submit_flows 会提前唤醒
+            self._wake.wait(timeout=1.0)
+            self._wake.clear()
 
     def _run_scheduler_once(self):
         # 遍历 pending flows 尝试调度
 
         # self.logger.info("[scheduler] _run_scheduler_once: pending=%d active=%d hosts=%s",len(self.pending_flows), len(self.active_flows), hosts_snapshot)
+        # 因为带宽不够被挡住的 pending flow 的路径端口，给 _rebalance_rates 用
+        blocked_ports = set()
         for flow_id in list(self.pending_flows.keys()):
             flow = self.pending_flows.get(flow_id)
             if not flow:
@@ -246,21 +429,36 @@ class GlobalScheduler(app_manager.RyuApp):
         #     getattr(flow, "priority", 0)
         # )
 
+            # agent 报 busy：留在 pending，等 backoff 过去再放行
+            if self.host_channel.is_busy(flow.src_ip) or self.host_channel.is_busy(flow.dst_ip):
+                continue
+
             path = self.path_manager.get_path(flow.src_ip, flow.dst_ip)
             if not path:
                 # 找不到路径，暂时跳过
-                self.logger.warning(
-                "[scheduler_path] flow %d: NO PATH (%s -> %s)",
-                flow.id, flow.src_ip, flow.dst_ip
-                )
+                self.events.warning("admission", "no_path", flow_id=flow.id,
+                                    src_ip=flow.src_ip, dst_ip=flow.dst_ip)
                 continue
             # self.logger.info("[scheduler] flow %d: path=%s", flow.id, path)    
             
             ok, send_rate ,reason= self.admission.can_admit(flow, path)
-            self.logger.info("[scheduler_admission] flow %d: can_admit=%s send_rate=%s reason%s",flow.id, ok, send_rate,reason)
+            self.events.emit("admission", "admit" if ok else "reject", flow_id=flow.id,
+                             send_rate_bps=send_rate, reason=reason)
             
             if not ok:
+                if reason == "no_capacity":
+                    blocked_ports.update(path)
+                continue
+
+            # 先分配端口：src / dst 任一侧端口池耗尽就留在 pending，什么都不装
+            ports = self.port_mgr.try_alloc_pair(flow.src_ip, flow.dst_ip)
+            if ports is None:
+                self.events.warning("admission", "no_ports", flow_id=flow.id,
+                                    src_ip=flow.src_ip, dst_ip=flow.dst_ip)
                 continue
+            flow.src_port, flow.dst_port = ports
+            self.port_mgr.bind_flow(flow.id, flow.src_ip, flow.src_port,
+                                    flow.dst_ip, flow.dst_port)
 
             # 填写调度结果
             flow.path = path
@@ -268,34 +466,265 @@ class GlobalScheduler(app_manager.RyuApp):
             flow.dscp = self.dscp_mgr.alloc_dscp(flow.priority)
             # 简单映射：0->queue0, 1->queue1, 2->queue2
             flow.queue_id = flow.priority
-            self.logger.info("[scheduler_dscp] flow %d: allowed, send_rate=%d dscp=%d queue_id=%d",flow.id, flow.send_rate_bps, flow.dscp, flow.queue_id
-            )
             # 安装流表
             self.flow_installer.install_flow(flow)
 
-            # 预留带宽
+            # 预留带宽（目的 host 的入向负载由账本回调更新），pending 请求还掉
             self.admission.reserve(flow, path)
+            self.host_channel.release_dst(flow.dst_ip, flow.request_rate_bps)
 
             # 更新状态
             flow.status = "allowed"
             flow.allowed_at = time.time()
             self.active_flows[flow.id] = flow
+            self._index_flow(flow)
             del self.pending_flows[flow.id]
-            self.logger.info(
-            "[scheduler] flow %d: status=%s, pending=%d active=%d",
-            flow.id, flow.status,
-            len(self.pending_flows), len(self.active_flows)
-            )
-            
-            flow.dst_port =self.port_mgr.alloc_dst_port(flow.dst_ip)
-            flow.src_port =self.port_mgr.alloc_src_port(flow.src_ip)
-            
+            self.events.emit("flow", "allowed", flow_id=flow.id, send_rate_bps=flow.send_rate_bps,
+                             dscp=flow.dscp, queue_id=flow.queue_id, path=flow.path,
+                             src_port=flow.src_port, dst_port=flow.dst_port,
+                             pending=len(self.pending_flows), active=len(self.active_flows))
+
             # 通知 host
-            self.logger.info("[scheduler] flow %d: sending FLOW_PREPARE", flow.id)
             self.host_channel.send_flow_prepare(flow)  # 先通知 dst
-            self.logger.info("[scheduler] flow %d: sending PERMIT", flow.id)
             self.host_channel.send_permit(flow)
 
+        self._rebalance_rates(blocked_ports)
+
+    # =============== 活跃 flow 的速率调整（RATE_UPDATE） ===============
+
+    # 速率变化小于这个值不发 RATE_UPDATE，避免来回抖
+    RATE_STEP_MIN = 1_000_000
+
+    def _rebalance_rates(self, blocked_ports):
+        """
+        运行中调整 active flow 的发送速率（预留和 host 速率一起改）：
+          - 有 pending flow 因为带宽不够被挡：把挡路端口上提过速的 flow 降回 request_rate_bps，
+            先发 RATE_UPDATE，预留等 agent ACK 报了实际速率再缩（_on_rate_ack），之后让 pending 的 flow 进来
+          - 路径不经过挡路端口的：按优先级（gold 先）把占用端口上的剩余容量分给 max_rate_bps > send_rate_bps 的 flow，
+            先扩预留再发 RATE_UPDATE，发不出去就退回；agent 回 applied=false 的由 _on_rate_ack 退回
+        只给注册时报了 rate_update 的 host（engine 后端）上的 flow 调速；
+        尾部已经开始逐跳释放的 flow 快结束了，不再提速。
+        """
+        can_update = self.host_channel.can_update_rate
+        shrinking = self._rate_shrinking
+        blocked = set()
+        if blocked_ports:
+            for flow in self.active_flows.values():
+                if any(hop in blocked_ports for hop in flow.path):
+                    blocked.add(flow.id)
+            for flow_id in blocked:
+                flow = self.active_flows[flow_id]
+                if flow.send_rate_bps <= flow.request_rate_bps or flow_id in shrinking:
+                    continue
+                if not can_update(flow.src_ip):
+                    continue
+                if self.host_channel.send_rate_update(flow, flow.request_rate_bps):
+                    shrinking[flow_id] = flow.request_rate_bps
+                    self.events.emit("rate", "shrink", flow_id=flow.id, old_bps=flow.send_rate_bps,
+                                     new_bps=flow.request_rate_bps)
+
+        boostable = [f for f in self.active_flows.values()
+                     if f.max_rate_bps > f.send_rate_bps and not f.released_hops
+                     and f.id not in blocked and f.id not in shrinking and can_update(f.src_ip)]
+        for flow in sorted(boostable, key=lambda f: -f.priority):
+            target = min(flow.max_rate_bps, flow.send_rate_bps + self.admission.headroom(flow))
+            if target - flow.send_rate_bps < self.RATE_STEP_MIN:
+                continue
+            old = flow.send_rate_bps
+            self.admission.resize(flow, target)
+            if not self.host_channel.send_rate_update(flow, target):
+                self.admission.resize(flow, old)
+                continue
+            self.events.emit("rate", "boost", flow_id=flow.id, old_bps=old, new_bps=target,
+                             max_rate_bps=flow.max_rate_bps)
+
+    def _on_rate_ack(self, flow_id: int, applied: bool, rate_bps):
+        """
+        agent 回了 RATE_UPDATE 的 ACK，rate_bps 是发送端现在实际用的速率：预留对齐到它。
+          - 降速生效：这时才缩预留，挡住的 pending flow 下一轮进来
+          - 提速没生效：扩过的预留退回去
+          - 降速没生效：预留本来就没缩，不用动
+        预留比实际速率低（并发的调速交错）时在 headroom 内往上补。
+        flow 已经不在发送（rate_bps 为 None）就等它结束释放。
+        """
+        self._rate_shrinking.pop(flow_id, None)
+        flow = self.active_flows.get(flow_id)
+        if flow is None or rate_bps is None:
+            return
+        rate_bps = int(rate_bps)
+        old = flow.send_rate_bps
+        if rate_bps < old:
+            self.admission.resize(flow, rate_bps)
+            self._wake.set()
+        elif rate_bps > old:
+            self.admission.resize(flow, min(rate_bps, old + self.admission.headroom(flow)))
+        else:
+            return
+        if applied:
+            self.events.emit("rate", "resized", flow_id=flow.id, old_bps=old,
+                             new_bps=flow.send_rate_bps)
+        else:
+            self.events.warning("rate", "rollback", flow_id=flow.id, old_bps=old,
+                                new_bps=flow.send_rate_bps, sender_bps=rate_bps)
+
+    # =============== 活跃 flow 的 dpid 索引 & 结束处理 ===============
+
+    def _index_flow(self, flow: Flow):
+        dpids = [dpid for dpid, _ in flow.path]
+        for dpid in dpids:
+            self.flows_by_dpid.setdefault(dpid, set()).add(flow.id)
+        self.stats_collector.expedite(dpids)
+
+    def unindex_flow(self, flow: Flow, dpids=None):
+        """从 dpid 索引里摘掉 flow；dpids 为空表示整条路径"""
+        if dpids is None:
+            dpids = [dpid for dpid, _ in flow.path]
+        for dpid in dpids:
+            ids = self.flows_by_dpid.get(dpid)
+            if ids is None:
+                continue
+            ids.discard(flow.id)
+            if not ids:
+                del self.flows_by_dpid[dpid]
+
+    def finish_flow(self, flow: Flow, status: str = "finished"):
+        """
+        结束一条活跃流：删除全路径规则、释放预留带宽、DSCP 和端口、移出 active/索引。
+        调用方负责写 FlowProgress 日志。
+        """
+        flow.status = status
+        if flow.finished_at is None:
+            flow.finished_at = time.time()
+
+        self.flow_installer.delete_flow(flow)
+        self.admission.release(flow)
+        if flow.dscp is not None:
+            self.dscp_mgr.free_dscp(flow.dscp)
+
+        self.active_flows.pop(flow.id, None)
+        self._rate_shrinking.pop(flow.id, None)
+        self.unindex_flow(flow)
+        self.port_mgr.release_flow(flow.id, flow.src_ip, flow.src_port,
+                                   flow.dst_ip, flow.dst_port)
+        self.stats_collector.forget_flow(flow)
+        self._finished_queue.append((flow.finished_at, flow.id))
+        self.events.emit("release", "path_released", flow_id=flow.id, hops=len(flow.path or ()),
+                         dscp=flow.dscp, send_rate_bps=flow.send_rate_bps)
+        self.events.emit("flow", status, flow_id=flow.id,
+                         duration_s=flow.finished_at - (flow.allowed_at or flow.finished_at))
+
+    def fail_pending_flow(self, flow: Flow, reason: str, dst_released: bool = False):
+        """
+        pending 的 flow 直接判失败：没装过规则、没预留过带宽，只需还掉目的 host 的 pending 负载；
+        调用方已经还过的传 dst_released=True
+        """
+        self.pending_flows.pop(flow.id, None)
+        flow.status = "failed"
+        flow.reason = reason
+        flow.finished_at = time.time()
+        if not dst_released:
+            self.host_channel.release_dst(flow.dst_ip, flow.request_rate_bps)
+        self._finished_queue.append((flow.finished_at, flow.id))
+        self.events.emit("flow", "failed", flow_id=flow.id, reason=reason, pending=True)
+
+    def _on_ctrl_rejected(self, msg_type: str, flow_id: int, host_ip: str):
+        """agent 队列满，PERMIT / FLOW_PREPARE 重发几次都被拒：flow 判失败，另一端停掉"""
+        flow = self.active_flows.get(flow_id)
+        if flow is None:
+            return
+        self.finish_flow(flow, "failed")
+        peer = flow.dst_ip if host_ip == flow.src_ip else flow.src_ip
+        self.host_channel.send_stop(flow, peer)
+        self.logger.warning("[scheduler] flow %d failed: %s rejected by busy host %s",
+                            flow_id, msg_type, host_ip)
+
+    def _evict_hosts(self, host_ips):
+        """
+        host 被判 dead 后：
+          - 经过它的活跃 flow（src 或 dst）：删规则、释放预留，状态 failed，通知另一端 STOP
+          - pending flow：src 死了直接失败；只是 dst 死了就重新挑一个目的，挑不到再失败；
+            客户端指定了 dst_ip 的（dst_pinned）不换目的，直接 dst_host_down 失败
+        """
+        dead = set(host_ips)
+        for flow in list(self.active_flows.values()):
+            if flow.src_ip in dead or flow.dst_ip in dead:
+                self.finish_flow(flow, "failed")
+                # 还活着的那一端停掉这条 flow，别继续往没有规则的路径上发 / 空等
+                peer = flow.dst_ip if flow.src_ip in dead else flow.src_ip
+                if peer not in dead:
+                    self.host_channel.send_stop(flow, peer)
+                self.logger.warning("[scheduler] flow %d failed: host down (%s -> %s)",
+                                    flow.id, flow.src_ip, flow.dst_ip)
+
+        for flow in list(self.pending_flows.values()):
+            if flow.src_ip in dead:
+                self.fail_pending_flow(flow, "src_host_down")
+            elif flow.dst_ip in dead:
+                if flow.dst_pinned:
+                    self.fail_pending_flow(flow, "dst_host_down")
+                    continue
+                self.host_channel.release_dst(flow.dst_ip, flow.request_rate_bps)
+                dst_info = self.host_channel.pick_dst_for_flow(flow.src_ip, flow.request_rate_bps)
+                if dst_info is None:
+                    self.fail_pending_flow(flow, "dst_host_down", dst_released=True)
+                    continue
+                old_dst = flow.dst_ip
+                flow.dst_ip, flow.dst_port = dst_info
+                self.logger.info("[scheduler] flow %d: dst %s down, re-picked %s",
+                                 flow.id, old_dst, flow.dst_ip)
+
+    def _build_ingress_ports(self) -> Dict[Tuple[int, int], List[str]]:
+        """
+        从静态路径里找每个 host 的接入端口：路径 "src-dst" 的最后一跳 (dpid, out_port) 就是通向 dst 的端口。
+        返回 (dpid, port_no) -> [host_ip, ...]
+        """
+        ingress: Dict[Tuple[int, int], List[str]] = {}
+        for key, hops in self.path_manager.paths.items():
+            if not hops or "-" not in key:
+                continue
+            dst_ip = key.split("-", 1)[1]
+            hosts = ingress.setdefault(hops[-1], [])
+            if dst_ip not in hosts:
+                hosts.append(dst_ip)
+        return ingress
+
+    def _on_port_change(self, ps):
+        hosts = self._ingress_hosts.get((ps.dpid, ps.port_no))
+        if not hosts:
+            return
+        residual = max(0, ps.capacity_bps - ps.reserved_total_bps)
+        for host_ip in hosts:
+            self.host_channel.update_dst_port(host_ip, ps.reserved_total_bps, residual)
+
+    def _archive_finished_flows(self):
+        """把结束超过 archive_after 秒的 flow 写入归档，并释放它们在内存里的状态"""
+        if not self._finished_queue:
+            return
+        deadline = time.time() - self.archive_after
+        archived = 0
+        while self._finished_queue and self._finished_queue[0][0] <= deadline:
+            _, flow_id = self._finished_queue.popleft()
+            flow = self.flows.pop(flow_id, None)
+            if flow is None:
+                continue
+            self.archive.append(flow)
+            archived += 1
+        if archived:
+            self.archive.flush()
+            self.logger.info("[scheduler] archived %d finished flows (archive=%d, live=%d)",
+                             archived, len(self.archive), len(self.flows))
+
+    def finished_flow_ids(self) -> List[int]:
+        """已经结束、还没归档（最近 archive_after 秒内结束）的 flow id"""
+        return [fid for _, fid in self._finished_queue]
+
+    def get_flow(self, flow_id: int):
+        """先查内存中的 Flow，查不到再走归档索引，返回 Flow 或 dict；都没有返回 None"""
+        flow = self.flows.get(flow_id)
+        if flow is not None:
+            return flow
+        return self.archive.lookup(flow_id)
+
     # def _maybe_release(self):
     #     """
     #     尾部检测 + 逐跳释放：
@@ -375,31 +804,43 @@ class GlobalScheduler(app_manager.RyuApp):
     #             self._log_flow_progress(flow, [msg])
 
     
-    def _alloc_flow_id(self, src_ip: str) -> int:
-        """
-        按源 IP 分段分配 flow_id。
-        例如:
-          172.17.0.101 -> host_no=1 -> 10001,10002...
-          172.17.0.102 -> host_no=2 -> 20001,20002...
-        """
-        try:
-            last_octet = int(src_ip.split(".")[-1])
-        except Exception:
-            # 兜底：用 0 段
-            last_octet = 0
-
-        host_no = last_octet - 100   # 101 -> 1, 102 -> 2, 103 -> 3 ...
-        if host_no <= 0:
-            host_no = 0
-
-        base = host_no * 10000
-
-        cur = self._flow_seq_per_host.get(host_no, 0) + 1
-        self._flow_seq_per_host[host_no] = cur
+def _parse_flow_spec(msg) -> dict:
+    """
+    解析一条 flow 请求，返回 new_flow 需要的参数（外加可选 dst_ip），参数不合法抛 ValueError。
+    """
+    if not isinstance(msg, dict):
+        raise ValueError("flow spec must be an object")
+    try:
+        src_ip = msg.get("src_ip")
+        src_port = int(msg.get("src_port", 0))
+        size_bytes = int(msg.get("size_bytes", 0))
+        req_rate = int(msg.get("request_rate_bps", 0))
+        priority = int(msg.get("priority", 0))
+        max_rate = int(msg.get("max_rate_bps", 0) or 0)
+    except (TypeError, ValueError):
+        raise ValueError("invalid params")
+
+    if not src_ip or size_bytes <= 0:
+        raise ValueError("invalid params")
+    if priority not in (0, 1, 2):
+        raise ValueError(f"invalid priority {priority}")
+
+    if req_rate <= 0:
+        # 可以给一个默认值，或者从 qos_config 里查
+        req_rate = 10_000_000  # 比如 10Mbps，按需改
+    if max_rate and max_rate < req_rate:
+        raise ValueError("max_rate_bps must be >= request_rate_bps")
+
+    return {
+        "src_ip": src_ip,
+        "src_port": src_port,
+        "size_bytes": size_bytes,
+        "request_rate_bps": req_rate,
+        "priority": priority,
+        "max_rate_bps": max_rate,
+        "dst_ip": msg.get("dst_ip") or None,
+    }
 
-        # 这里 +10000 是为了第一个 flow 就是 10001 / 20001 这种形态
-        flow_id = base + 10000 + cur - 1
-        return flow_id
 
 # =============== REST Controller ===============
 
@@ -418,7 +859,9 @@ class SchedulerRestController(ControllerBase):
             "src_port": 11000,          # Host 发流使用的本地端口（方便以后用）
             "size_bytes": 20000000,
             "request_rate_bps": 5000000,  # 可选，也可以用 qos_config 的默认
-            "priority": 1
+            "priority": 1,
+            "dst_ip": "10.0.0.3",       # 可选，不填由 HostChannel 按 dst_select 挑
+            "max_rate_bps": 20000000    # 可选，有空闲容量时允许提速到的上限（RATE_UPDATE）
         }
         """
         try:
@@ -427,42 +870,57 @@ class SchedulerRestController(ControllerBase):
         except Exception:
             return self._json_response({"error": "invalid json"}, status=400)
 
-        src_ip = msg.get("src_ip")
-        src_port = int(msg.get("src_port", 0))
-        size_bytes = int(msg.get("size_bytes", 0))
-        req_rate = int(msg.get("request_rate_bps", 0))
-        priority = int(msg.get("priority", 0))
-
-        if not src_ip or size_bytes <= 0:
-            return self._json_response({"error": "invalid params"}, status=400)
+        result = self.scheduler_app.submit_flows([msg])[0]
+        if result["decision"] != "queued":
+            return self._json_response({"error": result["error"]}, status=result["code"])
 
-        if req_rate <= 0:
-            # 可以给一个默认值，或者从 qos_config 里查
-            req_rate = 10_000_000  # 比如 10Mbps，按需改
+        return self._json_response({
+            "flow_id": result["flow_id"],
+            "status": result["status"],
+            "dst_ip": result["dst_ip"],
+            "dst_port": result["dst_port"],
+        })
 
-        # 让 HostChannel 帮忙挑一个目的 host（随机选一个已注册 host，且 != src_ip）
-        dst_info = self.scheduler_app.host_channel.pick_dst_for_flow(src_ip)
-        if not dst_info:
-            return self._json_response({"error": "no dst host available"}, status=503)
+    MAX_BATCH = 1000
 
-        dst_ip, dst_port = dst_info
+    @route('scheduler', BASE_URL + '/request_batch', methods=['POST'])
+    def request_batch(self, req, **kwargs):
+        """
+        批量发起业务流请求：
+        POST /scheduler/request_batch
+        {
+            "flows": [ {<和 /scheduler/request 相同的字段>}, ... ]
+        }
+        也可以直接 POST 一个数组。返回：
+        {
+            "results": [
+                {"index": 0, "decision": "queued", "flow_id": ..., "status": "pending",
+                 "dst_ip": ..., "dst_port": ...},
+                {"index": 1, "decision": "rejected", "error": "...", "code": 400},
+                ...
+            ],
+            "queued": n, "rejected": m
+        }
+        单条失败不影响其他条；整批在同一轮调度里做 admission。
+        """
+        try:
+            msg = json.loads(req.body) if req.body else {}
+        except Exception:
+            return self._json_response({"error": "invalid json"}, status=400)
 
-        # 创建 Flow（需要在 models.Flow 里支持 src_port/dst_port，如果还没有就加上）
-        flow = self.scheduler_app.new_flow(
-            src_ip=src_ip,
-            dst_ip=dst_ip,
-            request_rate_bps=req_rate,
-            size_bytes=size_bytes,
-            priority=priority,
-            src_port=src_port,
-            dst_port=dst_port,
-        )
+        specs = msg.get("flows") if isinstance(msg, dict) else msg
+        if not isinstance(specs, list):
+            return self._json_response({"error": "flows must be a list"}, status=400)
+        if len(specs) > self.MAX_BATCH:
+            return self._json_response(
+                {"error": f"batch too large ({len(specs)} > {self.MAX_BATCH})"}, status=413)
 
+        results = self.scheduler_app.submit_flows(specs)
+        queued = sum(1 for r in results if r["decision"] == "queued")
         return self._json_response({
-            "flow_id": flow.id,
-            "status": flow.status,
-            "dst_ip": flow.dst_ip,
-            "dst_port": getattr(flow, "dst_port", None),
+            "results": results,
+            "queued": queued,
+            "rejected": len(results) - queued,
         })
 
 
@@ -484,7 +942,81 @@ class SchedulerRestController(ControllerBase):
             status=status
         )
 
-    
+
+    # ---------- 时序查询接口 ----------
+
+    def _telemetry_params(self, req):
+        def _f(name):
+            v = req.GET.get(name)
+            return float(v) if v not in (None, "") else None
+        return _f("start"), _f("end"), _f("step"), req.GET.get("format", "json")
+
+    def _telemetry_binary(self, columns, ts, data):
+        from webob import Response
+        body = TelemetryStore.to_binary(columns, ts, data)
+        resp = Response(content_type='application/octet-stream', body=body)
+        resp.headers['X-Telemetry-Columns'] = ",".join(["ts"] + list(columns))
+        return resp
+
+    @route('scheduler', BASE_URL + '/telemetry/flow/{flow_id}', methods=['GET'],
+           requirements={'flow_id': r'\d+'})
+    def telemetry_flow(self, req, flow_id, **kwargs):
+        """
+        GET /scheduler/telemetry/flow/<flow_id>?dpid=&start=&end=&step=&format=json|bin
+        - json：不带 dpid 时按路径顺序返回所有 hop
+        - bin ：返回单个 hop（默认最后一跳）的紧凑 float64 数组
+        """
+        store = self.scheduler_app.telemetry
+        flow_id = int(flow_id)
+        try:
+            start, end, step, fmt = self._telemetry_params(req)
+        except ValueError:
+            return self._json_response({"error": "invalid params"}, status=400)
+
+        hops = store.flow_hops(flow_id)
+        if req.GET.get("dpid"):
+            dpid = int(req.GET["dpid"])
+            hops = [(idx, d) for idx, d in hops if d == dpid]
+        if not hops:
+            return self._json_response({"error": "no telemetry"}, status=404)
+
+        if fmt == "bin":
+            _idx, dpid = hops[-1]
+            res = store.query(("flow", flow_id, dpid), start, end, step)
+            if res is None:
+                return self._json_response({"error": "no telemetry"}, status=404)
+            return self._telemetry_binary(*res)
+
+        result = []
+        for idx, dpid in hops:
+            res = store.query(("flow", flow_id, dpid), start, end, step)
+            if res is None:
+                continue
+            item = {"hop": idx, "dpid": dpid}
+            item.update(TelemetryStore.to_json(*res))
+            result.append(item)
+        return self._json_response({"flow_id": flow_id, "hops": result})
+
+    @route('scheduler', BASE_URL + '/telemetry/port/{dpid}/{port_no}', methods=['GET'],
+           requirements={'dpid': r'\d+', 'port_no': r'\d+'})
+    def telemetry_port(self, req, dpid, port_no, **kwargs):
+        """
+        GET /scheduler/telemetry/port/<dpid>/<port_no>?start=&end=&step=&format=json|bin
+        """
+        try:
+            start, end, step, fmt = self._telemetry_params(req)
+        except ValueError:
+            return self._json_response({"error": "invalid params"}, status=400)
+        res = self.scheduler_app.telemetry.query(("port", int(dpid), int(port_no)),
+                                                 start, end, step)
+        if res is None:
+            return self._json_response({"error": "no telemetry"}, status=404)
+        if fmt == "bin":
+            return self._telemetry_binary(*res)
+        data = {"dpid": int(dpid), "port_no": int(port_no)}
+        data.update(TelemetryStore.to_json(*res))
+        return self._json_response(data)
+
     @route('scheduler', BASE_URL + '/register_host', methods=['POST'])
     def register_host(self, req, **kwargs):
             """
@@ -493,7 +1025,9 @@ class SchedulerRestController(ControllerBase):
             {
             "host_ip": "10.0.0.1",
             "permit_port": 10000,   # 本机上 PERMIT server 监听的端口
-            "recv_port": 11000      # 本机上接收业务流的端口（比如 iperf3 -s 用的）
+            "recv_port": 11000,     # 本机上接收业务流的端口（比如 iperf3 -s 用的）
+            "backend": "engine",    # 可选：发送后端
+            "rate_update": true     # 可选：发送端能否运行中改速率，缺省 false（不给它的 flow 提速）
             }
             """
             try:
@@ -515,7 +1049,83 @@ class SchedulerRestController(ControllerBase):
                 host_ip=host_ip,
                 permit_port=permit_port,
                 recv_port=recv_port,
+                rate_update=bool(msg.get("rate_update", False)),
             )
 
-            return self._json_response({"ok": True})
+            return self._json_response({
+                "ok": True,
+                "heartbeat_interval": self.scheduler_app.host_channel.heartbeat_interval,
+            })
+
+    @route('scheduler', BASE_URL + '/heartbeat', methods=['POST'])
+    def heartbeat(self, req, **kwargs):
+        """
+        Host 心跳：
+        POST /scheduler/heartbeat
+        {
+            "host_ip": "10.0.0.1",
+            "rtt_ms": 1.8       # 可选，agent 上一次 REST 调用的往返时延
+        }
+        返回 registered=false 时 agent 需要重新 register_host
+        """
+        try:
+            msg = json.loads(req.body) if req.body else {}
+        except Exception:
+            return self._json_response({"error": "invalid json"}, status=400)
+
+        host_ip = msg.get("host_ip")
+        if not host_ip:
+            return self._json_response({"error": "invalid params"}, status=400)
+        rtt_ms = msg.get("rtt_ms")
+        try:
+            rtt_ms = float(rtt_ms) if rtt_ms is not None else None
+        except (TypeError, ValueError):
+            rtt_ms = None
+
+        registered = self.scheduler_app.host_channel.heartbeat(host_ip, rtt_ms)
+        return self._json_response({"ok": True, "registered": registered})
+
+    @route('scheduler', BASE_URL + '/host_report', methods=['POST'])
+    def host_report(self, req, **kwargs):
+        """
+        agent 上报 flow 完成：
+        POST /scheduler/host_report
+        {
+            "flow_id": 123,
+            "status": "finished",
+            "complete": true,
+            "bytes_received": 20000000,
+            "lost": 0, "reordered": 0, "jitter_ms": 0.02,
+            "first_ts": 1733300000.1, "last_ts": 1733300004.2
+        }
+        complete=false（接收端空闲超时、没收满）时 status 为 "failed"
+        批量：{"reports": [ {...}, {...} ]}，返回 {"results": [...], "finished": n}
+        """
+        try:
+            msg = json.loads(req.body) if req.body else {}
+        except Exception:
+            return self._json_response({"error": "invalid json"}, status=400)
+
+        if isinstance(msg, dict) and "reports" in msg:
+            reports = msg["reports"]
+            if not isinstance(reports, list):
+                return self._json_response({"error": "reports must be a list"}, status=400)
+            if len(reports) > self.MAX_BATCH:
+                return self._json_response(
+                    {"error": f"batch too large ({len(reports)} > {self.MAX_BATCH})"}, status=413)
+            results = self.scheduler_app.host_report(reports)
+            return self._json_response({
+                "results": results,
+                "finished": sum(1 for r in results if r["ok"]),
+            })
+
+        result = self.scheduler_app.host_report([msg])[0]
+        if not result["ok"] and result["error"] == "invalid flow_id":
+            return self._json_response({"error": result["error"]}, status=400)
+        return self._json_response(result)
+
+    @route('scheduler', BASE_URL + '/hosts', methods=['GET'])
+    def list_hosts(self, req, **kwargs):
+        """GET /scheduler/hosts：各 host 的存活状态 / last_seen / rtt"""
+        return self._json_response({"hosts": self.scheduler_app.host_channel.liveness_snapshot()})
 
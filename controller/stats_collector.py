@@ -13,6 +13,10 @@ import time
 from typing import Dict, List
 from ryu.ofproto import ofproto_v1_3
 from models import Flow
+from flow_installer import cookie_range, flow_id_from_cookie
+from rate_estimator import HopRateEstimator, predict_completion
+from timer_wheel import HashedTimerWheel
+from exp_logger import get_run_context
 
 
 class StatsCollector:
@@ -23,7 +27,8 @@ class StatsCollector:
       - flows: flow_id -> Flow
     """
 
-    def __init__(self, scheduler, logger ,interval: float = 1.0):
+    def __init__(self, scheduler, logger ,interval: float = 1.0, rate_cfg: dict = None,
+                 poll_cfg: dict = None):
         self.s = scheduler
         self.interval = interval
         self._thread = threading.Thread(target=self._loop, daemon=True)
@@ -32,10 +37,51 @@ class StatsCollector:
         self.last_book_dump = 0
         self.last_queue_dump = 0
 
+        # FlowStats 只请求 Table 1 + 活跃 flow 的 cookie 段；置 False 可回到全表请求做对比
+        self.filter_flow_stats = True
+        # 每个统计周期 FlowStats 回复的字节数/条目数（flow_manager.log 里输出 bytes-per-poll）
+        self.flow_stats_polls = 0
+        self.flow_stats_bytes = 0
+        self.flow_stats_entries = 0
+        self.flow_stats_useful = 0
+
+        # 每跳速率估计：时间轴用交换机 duration，EWMA / 窗口回归平滑
+        self.rate_estimator = HopRateEstimator.from_config(rate_cfg)
+
+        # ---- 按 datapath 的自适应轮询 ----
+        # 交换机上有 flow 的 ETA 临近时加快轮询，空闲交换机 / 长流则退避（controller_config.yml: stats_poll）
+        poll_cfg = poll_cfg or {}
+        self.tick = 0.1             # 调度循环粒度
+        self.min_interval = float(poll_cfg.get("min_interval", 0.2))    # 最快轮询间隔
+        self.max_interval = float(poll_cfg.get("max_interval", 5.0))    # 有流但 ETA 很远时的最慢间隔
+        self.idle_interval = float(poll_cfg.get("idle_interval", 5.0))  # 没有活跃 flow 的交换机
+        self.eta_factor = float(poll_cfg.get("eta_factor", 0.5))        # 下一次轮询间隔 = 最近 ETA * eta_factor
+        self.max_outstanding = int(poll_cfg.get("max_outstanding", 1))  # 每台交换机最多未回复的 FlowStats 请求数
+        self.request_timeout = float(poll_cfg.get("request_timeout", 3.0))  # 超过这个时间没回复就不再计入 outstanding
+        self._next_poll: Dict[int, float] = {}          # dpid -> 下一次轮询时间
+        # 时间轮到期时交换机 outstanding 已满：flow_id 先攒着，并进下一次常规轮询的 cookie 段
+        self._deferred_tail: Dict[int, set] = {}        # dpid -> {flow_id}
+        self._outstanding: Dict[int, List[float]] = {}  # dpid -> 未回复请求的发送时间
+
+        # ---- 逐跳尾部定时 ----
+        # 按速率和剩余字节预测每跳尾部经过的时间，到点对这一台交换机发一次精确的 FlowStats，
+        # 回复里确认尾部经过后本轮就释放前一跳，不用等下一次常规轮询
+        self.tail_eps = 1.02            # 和 _maybe_release 的字节阈值一致
+        self.tail_timer_min = 0.05      # 预测时间太近时至少等这么久，避免连续发请求
+        self.tail_timers = HashedTimerWheel(tick=0.05, n_slots=512)  # key=(flow_id, hop_idx)
+        self.tail_timer_polls = 0
+
+        # TableStats 校准频率：流表计数靠安装/删除维护，这里只做低频对账
+        self.table_stats_interval = 10
+        self.last_table_stats_req = 0.0
+
         import os
         self.log_root = getattr(scheduler, "log_root", "/home/yc/sdn_qos/logs")
         self.fp_root = os.path.join(self.log_root, "FlowProgress")  # /home/yc/sdn_qos/logs/<run_ts>/FlowProgress
         os.makedirs(self.fp_root, exist_ok=True)
+        # log_root = <base>/<run_ts>；progress.log 走 run 级缓存的目录和共享 writer（HostChannel 也用同一个）
+        self.run_ctx = get_run_context(os.path.dirname(self.log_root),
+                                       os.path.basename(self.log_root))
         
         # FlowProgress 打印节流：每隔多少秒记录一次
         self.flow_progress_interval = 5  # 你嫌太频繁就往上调
@@ -49,10 +95,30 @@ class StatsCollector:
         self.last_flow_manager_log = 0.0
         
         
+        # 本轮收到新 FlowStats 的 flow_id，release 检查在调度循环里每轮跑一次
+        self._dirty_flows = set()
+
+        # (dpid, port_no) -> (duration, tx_bytes, rx_bytes)，算端口速率用
+        self._port_last: Dict[tuple, tuple] = {}
+
         # 新增：按空闲时间判断 finished
         self.flow_idle_timeout: float = 3.0  # 比如 3 秒无新字节就认为流结束
         self.flow_idle_since: Dict[int, float] = {}  # flow_id -> idle 起始时间
+
+        # 释放延迟：最后一个字节到达 -> 删规则 / 释放预留，按结束来源分开统计
+        #   host_report : agent 接收端上报（用上报里的 last_ts）
+        #   poll        : 这里的字节 / 空闲判定（只知道 idle 起点，是下界）
+        # source -> [n, sum_s, max_s]，flow_manager.log 里输出后清零
+        self.release_lag: Dict[str, List[float]] = {"host_report": [0, 0.0, 0.0],
+                                                    "poll": [0, 0.0, 0.0]}
         
+    def note_release_lag(self, source: str, lag: float):
+        st = self.release_lag.setdefault(source, [0, 0.0, 0.0])
+        st[0] += 1
+        st[1] += lag
+        if lag > st[2]:
+            st[2] = lag
+
     def _maybe_log_flow_manager(self):
             """
             定期把当前 flows/pending_flows/active_flows 的统计写到
@@ -65,20 +131,50 @@ class StatsCollector:
 
             ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
 
-            total = len(self.s.flows)
+            archived = len(self.s.archive)
+            total = len(self.s.flows) + archived
             pending = len(self.s.pending_flows)
             active = len(self.s.active_flows)
 
-            # 方便排查具体 flow
+            # 方便排查具体 flow；finished_ids 只含还没归档的（最近 archive_after 秒内结束的）
             pending_ids = sorted(self.s.pending_flows.keys())
             active_ids = sorted(self.s.active_flows.keys())
-            finished_ids = sorted(
-                fid for fid in self.s.flows.keys()
-                if fid not in self.s.pending_flows and fid not in self.s.active_flows
-            )
+            finished_ids = sorted(self.s.finished_flow_ids())
+
+            polls = self.flow_stats_polls
+            bytes_per_poll = self.flow_stats_bytes / polls if polls else 0.0
+            entries_per_poll = self.flow_stats_entries / polls if polls else 0.0
+            useful = self.flow_stats_useful
+            entries = self.flow_stats_entries
+            self.flow_stats_polls = 0
+            self.flow_stats_bytes = 0
+            self.flow_stats_entries = 0
+            self.flow_stats_useful = 0
+            tail_polls = self.tail_timer_polls
+            self.tail_timer_polls = 0
+            lag_str = " ".join(
+                f"{src}:n={n} mean={(total / n if n else 0.0) * 1000:.0f}ms max={mx * 1000:.0f}ms"
+                for src, (n, total, mx) in self.release_lag.items())
+            for st in self.release_lag.values():
+                st[:] = [0, 0.0, 0.0]
+            telemetry = getattr(self.s, "telemetry", None)
+            tel_str = ""
+            if telemetry is not None:
+                expired = telemetry.expire(now)
+                tel = telemetry.stats()
+                tel_str = (f"series={tel['series']} mem={tel['mb']:.1f}MB "
+                           f"finishing={tel['finishing']} expired={expired}")
 
             with open(self.flow_manager_log_path, "a", encoding="utf-8") as f:
-                f.write(f"{ts} [FlowManager] total={total} pending={pending} active={active} finished={len(finished_ids)}\n")
+                f.write(f"{ts} [FlowManager] total={total} pending={pending} active={active} "
+                        f"finished={len(finished_ids)} archived={archived}\n")
+                f.write(f"{ts} [FlowStatsPoll] filter={self.filter_flow_stats} polls={polls} "
+                        f"bytes_per_poll={bytes_per_poll:.1f} entries_per_poll={entries_per_poll:.1f} "
+                        f"useful={useful}/{entries} tail_timers={len(self.tail_timers)} "
+                        f"tail_timer_polls={tail_polls}\n")
+                f.write(f"{ts} [ReleaseLag] {lag_str}\n")
+                if tel_str:
+                    f.write(f"{ts} [Telemetry] {tel_str}\n")
                 f.write(f"{ts} [FlowManager] pending_ids={pending_ids}\n")
                 f.write(f"{ts} [FlowManager] active_ids={active_ids}\n")
                 f.write(f"{ts} [FlowManager] finished_ids={finished_ids}\n")
@@ -90,22 +186,164 @@ class StatsCollector:
     def _loop(self):
         while self._running:
             try:
-                self.request_all()
+                self.poll_due()
+                self.fire_tail_timers()
+                self.process_updates()
                  # 新增：周期性记录 FlowManager 状态
                 self._maybe_log_flow_manager()
             except Exception:
-                pass
-            time.sleep(self.interval)
+                self.logger.exception("stats_collector loop error")
+            time.sleep(self.tick)
+
+    def poll_due(self):
+        """只轮询到期且 outstanding 未满的交换机，并按 ETA 算出它的下一次轮询时间"""
+        now = time.time()
+        req_table = now - self.last_table_stats_req >= self.table_stats_interval
+        if req_table:
+            self.last_table_stats_req = now
+        flows_by_dpid = self.s.flows_by_dpid
+        for dpid, dp in list(self.s.datapaths.items()):
+            if req_table:
+                self.request_table_stats(dp)
+            if now < self._next_poll.get(dpid, 0.0):
+                continue
+            if not self._can_request(dpid, now):
+                continue
 
-    def request_all(self):
-        for dp in self.s.datapaths.values():
-            self._req_flow(dp)
+            flow_ids = list(flows_by_dpid.get(dpid, ()))
+            # 常规轮询的 cookie 段本来就覆盖这台交换机上所有活跃 flow，推迟的尾部检查随之完成
+            if self._deferred_tail.pop(dpid, None):
+                self.tail_timer_polls += 1
+            if not self.filter_flow_stats:
+                self._req_flow_all(dp)
+                self._outstanding.setdefault(dpid, []).append(now)
+            elif flow_ids:
+                # 没有活跃 flow 经过的交换机不请求 FlowStats
+                self._req_flow(dp, flow_ids)
+                self._outstanding.setdefault(dpid, []).append(now)
             self._req_port(dp)
             self._req_queue(dp)
 
-    
-    def _req_flow(self, dp):
+            self._next_poll[dpid] = now + self._poll_interval(dpid, flow_ids)
+
+    def expedite(self, dpids):
+        """
+        新 flow 装上规则后调用：路径上的交换机可能因为之前空闲被退避到 idle_interval，
+        这里把它们的下一次轮询提前到下一个 tick，新 flow 尽快拿到第一份 FlowStats
+        """
+        for dpid in dpids:
+            self._next_poll[dpid] = 0.0
+
+    def _arm_tail_timer(self, flow: Flow, hop_idx: int, byte_count: int, rate_bps: int, now: float):
+        """
+        每次拿到某跳的新统计就重新预测尾部经过时间并重置定时器：
+          eta = (size_bytes * eps - byte_count) * 8 / rate
+        第 0 跳尾部经过不触发任何释放，不定时；已经过 / 速率未知的交给常规轮询。
+        """
+        key = (flow.id, hop_idx)
+        if hop_idx <= 0:
+            return
+        remaining = flow.size_bytes * self.tail_eps - byte_count
+        if remaining <= 0 or rate_bps <= 0:
+            self.tail_timers.cancel(key)
+            return
+        eta = remaining * 8 / rate_bps
+        self.tail_timers.schedule(key, now + max(self.tail_timer_min, eta))
+
+    def fire_tail_timers(self):
+        """
+        推进时间轮；到期的 (flow, hop) 按 dpid 合并，每台交换机发一次 cookie 过滤的 FlowStats。
+        回复进 on_flow_stats 后 flow 被标脏，本轮 process_updates 里完成释放；
+        如果尾部还没到，on_flow_stats 会按新的速率重新定时。
+        """
+        now = time.time()
+        fired = self.tail_timers.advance(now)
+        if not fired:
+            return
+        by_dpid: Dict[int, List[int]] = {}
+        for (fid, hop_idx), _ in fired:
+            flow = self.s.active_flows.get(fid)
+            if flow is None or hop_idx >= len(flow.path):
+                continue
+            dpid = flow.path[hop_idx][0]
+            if flow.is_hop_released(dpid):
+                continue
+            by_dpid.setdefault(dpid, []).append(fid)
+
+        for dpid, flow_ids in by_dpid.items():
+            dp = self.s.datapaths.get(dpid)
+            if dp is None:
+                continue
+            if not self._can_request(dpid, now):
+                # 交换机上还有没回复的请求：不额外发，记下来并把常规轮询提前，
+                # 下一次 poll_due 的请求会带上这些 flow
+                self._deferred_tail.setdefault(dpid, set()).update(flow_ids)
+                self._next_poll[dpid] = 0.0
+                continue
+            self._req_flow(dp, flow_ids)
+            self._outstanding.setdefault(dpid, []).append(now)
+            self.tail_timer_polls += 1
+
+    def forget_flow(self, flow: Flow):
+        """flow 结束（不论正常结束还是失败）时清掉 idle 记录 / 速率估计 / 尾部定时器，避免泄露"""
+        self.flow_idle_since.pop(flow.id, None)
+        self._dirty_flows.discard(flow.id)
+        self.rate_estimator.drop_flow(flow.id, [dpid for dpid, _ in flow.path])
+        for k in range(len(flow.path)):
+            self.tail_timers.cancel((flow.id, k))
+        telemetry = getattr(self.s, "telemetry", None)
+        if telemetry is not None:
+            telemetry.drop_flow(flow.id)
+
+    def _can_request(self, dpid: int, now: float) -> bool:
+        pending = self._outstanding.get(dpid)
+        if not pending:
+            return True
+        # 丢掉超时的请求（交换机丢包 / 断连），避免这台交换机永远不再被轮询
+        while pending and now - pending[0] > self.request_timeout:
+            pending.pop(0)
+        return len(pending) < self.max_outstanding
+
+    def _poll_interval(self, dpid: int, flow_ids) -> float:
+        """
+        根据经过该交换机的 flow 的预测完成时间决定轮询间隔：
+          eta = (size_bytes - hop_bytes) * 8 / hop_rate_bps
+        尾部已经过了这一跳的 flow 不参与；速率未知时用基础 interval。
+        """
+        if not flow_ids:
+            return self.idle_interval
+
+        min_eta = None
+        for fid in flow_ids:
+            flow = self.s.active_flows.get(fid)
+            if flow is None:
+                continue
+            hop_bytes = flow.get_hop_bytes(dpid)
+            if hop_bytes >= flow.size_bytes:
+                continue
+            eta = predict_completion(flow.size_bytes, hop_bytes, flow.get_hop_rate(dpid))
+            if eta < 0:
+                return self.interval
+            if min_eta is None or eta < min_eta:
+                min_eta = eta
+
+        if min_eta is None:
+            return self.interval
+        return min(self.max_interval, max(self.min_interval, min_eta * self.eta_factor))
+
+    def _req_flow(self, dp, flow_ids):
+        """只请求 Table 1 中 cookie 落在这些 flow_id 段内的规则"""
+        ofp = dp.ofproto
         parser = dp.ofproto_parser
+        cookie, cookie_mask = cookie_range(flow_ids)
+        self.flow_stats_polls += 1
+        dp.send_msg(parser.OFPFlowStatsRequest(
+            dp, 0, 1, ofp.OFPP_ANY, ofp.OFPG_ANY,
+            cookie, cookie_mask, parser.OFPMatch()))
+
+    def _req_flow_all(self, dp):
+        parser = dp.ofproto_parser
+        self.flow_stats_polls += 1
         dp.send_msg(parser.OFPFlowStatsRequest(dp))
 
     def _req_port(self, dp):
@@ -115,6 +353,10 @@ class StatsCollector:
     def _req_queue(self, dp):
         parser = dp.ofproto_parser
         dp.send_msg(parser.OFPQueueStatsRequest(dp, 0, dp.ofproto.OFPP_ANY, dp.ofproto.OFPQ_ALL))
+
+    def request_table_stats(self, dp):
+        parser = dp.ofproto_parser
+        dp.send_msg(parser.OFPTableStatsRequest(dp, 0))
     
     # def _poll_stats(self):
     #     for dp in list(self.app.datapaths.values()):
@@ -127,8 +369,15 @@ class StatsCollector:
     #         dp.send_msg(req)
             
             
-    def on_flow_stats(self, dpid, stats):
+    def on_flow_stats(self, dpid, stats, msg_len: int = 0, more: bool = False):
         now = time.time()
+        if not more:
+            # multipart 最后一段到达，这次请求结束
+            pending = self._outstanding.get(dpid)
+            if pending:
+                pending.pop(0)
+        self.flow_stats_bytes += msg_len
+        self.flow_stats_entries += len(stats)
         for st in stats:
             self.logger.debug(
             "[FlowStatsRaw] dpid=%s table=%d cookie=%#x pri=%d "
@@ -137,22 +386,28 @@ class StatsCollector:
             st.packet_count, st.byte_count, st.match
             )
             
-            fid = (st.cookie >> 32) & 0xffffffff
+            fid = flow_id_from_cookie(st.cookie)
             if fid==0: 
                 continue
             flow = self.s.active_flows.get(fid)
             if not flow:
                 continue
+            self.flow_stats_useful += 1
+            self._dirty_flows.add(fid)
 
-            prev_bytes = flow.hop_bytes.get(dpid, 0)
-            prev_t = flow.hop_last_time.get(dpid, now)
+            prev_bytes = flow.get_hop_bytes(dpid)
             delta_b = st.byte_count - prev_bytes
-            delta_t = max(1e-3, now - prev_t)
-            rate_bps = int(delta_b * 8 / delta_t)
+            # 速率用交换机侧的规则存活时间算，不受回复排队抖动影响
+            switch_t = st.duration_sec + st.duration_nsec * 1e-9
+            rate_bps = self.rate_estimator.update(fid, dpid, switch_t, st.byte_count)
 
-            flow.hop_bytes[dpid] = st.byte_count
-            flow.hop_last_time[dpid] = now
-            flow.hop_rate_bps[dpid] = rate_bps
+            flow.set_hop_stats(dpid, st.byte_count, now, rate_bps)
+            hop_idx = flow.hop_index(dpid)
+            self._arm_tail_timer(flow, hop_idx, st.byte_count, rate_bps, now)
+
+            telemetry = getattr(self.s, "telemetry", None)
+            if telemetry is not None:
+                telemetry.record_flow(fid, dpid, hop_idx, now, st.byte_count, rate_bps)
             
             # ★ 新增：维护最后一跳的 idle_since
             if flow.path and dpid == flow.path[-1][0]:
@@ -164,23 +419,25 @@ class StatsCollector:
                     # 没有新字节，如果以前没记过，就记录开始 idle 的时间
                     self.flow_idle_since.setdefault(fid, now)
 
+    def process_updates(self):
+        """
+        每轮调度循环跑一次：只对本轮有新统计的 flow（以及在等空闲超时的 flow）
+        做尾部释放检查，而不是每个 FlowStats 回复都扫一遍所有活跃流。
+        """
+        now = time.time()
+        dirty, self._dirty_flows = self._dirty_flows, set()
+        dirty.update(self.flow_idle_since.keys())
+        if dirty:
+            self._maybe_release(dirty)
         self._print_flow_progress()
-        self._maybe_release()
 
         if now - self.last_book_dump > 3:
             self._print_port_book()
             self.last_book_dump = now
 
-    def _log_flow_progress(self, flow: Flow, lines: List[str]):
-        import os
-        flow_dir = os.path.join(self.fp_root, str(flow.id))
-        os.makedirs(flow_dir, exist_ok=True)
-        log_path = os.path.join(flow_dir, "progress.log")
-
-        ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-        with open(log_path, "a", encoding="utf-8") as f:
-            for line in lines:
-                f.write(f"{ts} {line}\n")
+    def log_flow_progress(self, flow: Flow, lines: List[str]):
+        """给 flow 的 FlowProgress 日志追加若干行（调度器等其他模块也走这里）"""
+        self.run_ctx.append_flow_progress(flow.id, lines)
 
 
     def _print_flow_progress(self):
@@ -198,8 +455,7 @@ class StatsCollector:
             sent = flow.hop_bytes.get(last_dpid, 0)
             rate = flow.hop_rate_bps.get(last_dpid, 0)
             total = flow.size_bytes
-            rem = max(0, total - sent)
-            eta = (rem * 8 / rate) if rate > 0 else -1
+            eta = predict_completion(total, sent, rate)
 
             hop_str = " ".join(
                 f"s{dpid}={flow.hop_bytes.get(dpid,0)/1e6:.1f}MB"
@@ -212,11 +468,11 @@ class StatsCollector:
                 f"  rate(last_hop)={rate/1e6:.2f}Mbps eta={eta:.1f}s",
                 f"  hop_bytes: {hop_str} status={flow.status}",
             ]
-            self._log_flow_progress(flow, lines)
+            self.log_flow_progress(flow, lines)
 
             
 
-    def _maybe_release(self):
+    def _maybe_release(self, flow_ids):
         """
         尾部检测 + 逐跳释放 + 空闲超时结束：
 
@@ -228,20 +484,21 @@ class StatsCollector:
           则删除整条流的规则 & 释放整条路径
         """
         # 比 1.05 放宽一点，和你看到的 1.03x 比较接近
-        eps = 1.02
+        eps = self.tail_eps
         now = time.time()
 
-        for flow in list(self.s.active_flows.values()):
+        for fid in flow_ids:
+            flow = self.s.active_flows.get(fid)
             # 有些极端情况 path 可能还没填好，直接跳过避免异常
-            if not flow.path:
+            if flow is None or not flow.path:
                 continue
 
             total = flow.size_bytes * eps
 
             # ------- 逐跳尾部释放：byte_count >= size_bytes*eps 时，释放前一跳 -------
             for k, (dpid, port) in enumerate(flow.path):
-                b = flow.hop_bytes.get(dpid, 0)
-                if b >= total and dpid not in flow.released_hops and k > 0:
+                b = flow.get_hop_bytes(dpid)
+                if b >= total and k > 0 and not flow.is_hop_released(dpid):
                     prev_dpid, prev_port = flow.path[k - 1]
                     # 1) 删除上一跳的 per-flow 规则
                     self.s.flow_installer.delete_prev_hop_flow(flow, prev_dpid)
@@ -249,11 +506,14 @@ class StatsCollector:
                     self.s.admission.release_single_port(prev_dpid, prev_port, flow)
 
                     flow.released_hops.add(dpid)
+                    # 上一跳规则已删，不再需要轮询它
+                    self.s.unindex_flow(flow, [prev_dpid])
 
                     msg = (f"[TailRelease] flow={flow.id} tail passed s{dpid}, "
                            f"release prev hop s{prev_dpid}")
-                    self.logger.info(msg)
-                    self._log_flow_progress(flow, [msg])
+                    self.s.events.emit("release", "tail_release", flow_id=flow.id,
+                                       dpid=dpid, prev_dpid=prev_dpid, prev_port=prev_port)
+                    self.log_flow_progress(flow, [msg])
 
             # ------- 整条流是否结束？字节 + 空闲 两个条件择一 -------
             last_dpid = flow.path[-1][0]
@@ -274,8 +534,7 @@ class StatsCollector:
 
             # 打一条最终 snapshot：status=finished
             last_rate = flow.hop_rate_bps.get(last_dpid, 0)
-            rem = max(0, flow.size_bytes - last_bytes)
-            eta = (rem * 8 / last_rate) if last_rate > 0 else -1
+            eta = predict_completion(flow.size_bytes, last_bytes, last_rate)
             hop_str = " ".join(
                 f"s{dpid}={flow.hop_bytes.get(dpid, 0) / 1e6:.1f}MB"
                 for dpid, _ in flow.path
@@ -286,25 +545,18 @@ class StatsCollector:
                 f"  rate(last_hop)={last_rate/1e6:.2f}Mbps eta={eta:.1f}s",
                 f"  hop_bytes: {hop_str} status={flow.status}",
             ]
-            self._log_flow_progress(flow, final_lines)
+            self.log_flow_progress(flow, final_lines)
 
-            # 清掉 idle 记录，避免泄露
-            if flow.id in self.flow_idle_since:
-                self.flow_idle_since.pop(flow.id, None)
-
-            # 删除全路径规则 & 释放资源
-            self.s.flow_installer.delete_flow(flow)
-            self.s.admission.release(flow)
-            if flow.dscp is not None:
-                self.s.dscp_mgr.free_dscp(flow.dscp)
-
-            self.s.active_flows.pop(flow.id, None)
+            # 删除全路径规则 & 释放资源（finish_flow 里会调 forget_flow 清掉本模块的状态）
+            self.s.finish_flow(flow, "finished")
+            self.note_release_lag("poll", now - idle_since if idle_since is not None else 0.0)
 
             msg = (f"[TailRelease] flow={flow.id} finished, "
                    f"released all hops & freed DSCP {flow.dscp} "
                    f"(cond_bytes={cond_bytes}, cond_idle={cond_idle})")
-            self.logger.info(msg)
-            self._log_flow_progress(flow, [msg])
+            self.s.events.emit("release", "poll_finished", flow_id=flow.id, dscp=flow.dscp,
+                               cond_bytes=cond_bytes, cond_idle=cond_idle)
+            self.log_flow_progress(flow, [msg])
 
 
 
@@ -329,13 +581,45 @@ class StatsCollector:
     
 
     def on_port_stats(self, dpid, stats):
-        # Demo可选：打印端口利用率
-        pass
+        """
+        用交换机侧的 duration 计算端口 tx/rx 速率和利用率，写入 TelemetryStore。
+        利用率 = tx_bps / capacity_bps（只对 topo_config.yml 里配置了带宽的端口）。
+        """
+        telemetry = getattr(self.s, "telemetry", None)
+        if telemetry is None:
+            return
+        now = time.time()
+        for st in stats:
+            key = (dpid, st.port_no)
+            t = st.duration_sec + st.duration_nsec * 1e-9
+            prev = self._port_last.get(key)
+            self._port_last[key] = (t, st.tx_bytes, st.rx_bytes)
+            if prev is None or t <= prev[0]:
+                continue
+            dt = t - prev[0]
+            tx_bps = max(0, st.tx_bytes - prev[1]) * 8 / dt
+            rx_bps = max(0, st.rx_bytes - prev[2]) * 8 / dt
+            ps = self.s.admission.ports.get(key)
+            util = tx_bps / ps.capacity_bps if ps and ps.capacity_bps else 0.0
+            telemetry.record_port(dpid, st.port_no, now, st.tx_bytes, st.rx_bytes,
+                                  tx_bps, rx_bps, util)
 
     def on_queue_stats(self, dpid, stats):
         # Demo可选：打印队列吞吐
         pass    
 
+    def on_table_stats(self, dpid, stats):
+        """用交换机上报的 active_count 校准 AdmissionControl 的流表计数"""
+        for st in stats:
+            # 只对账已经在账本里的表，避免把 OVS 的 254 张空表都建出来
+            if (dpid, st.table_id) not in self.s.admission.tables:
+                continue
+            before = self.s.admission.tables[(dpid, st.table_id)].active_count
+            if self.s.admission.reconcile_table(dpid, st.table_id, st.active_count):
+                self.logger.info(
+                    "[TableStats] s%s table=%d reconciled active %d -> %d",
+                    dpid, st.table_id, before, st.active_count)
+
 ##原来的逻辑
     def handle_flow_stats_reply(self, ev):
         """在 scheduler_app 中调用，用来处理 EventOFPFlowStatsReply"""
@@ -346,7 +630,7 @@ class StatsCollector:
 
         for stat in body:
             cookie = stat.cookie
-            flow_id = (cookie >> 32) & 0xffffffff
+            flow_id = flow_id_from_cookie(cookie)
             if flow_id == 0:
                 # 0 视为系统规则
                 continue
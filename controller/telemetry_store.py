@@ -0,0 +1,284 @@
+'''
+Author: yc && qq747339545@163.com
+Date: 2025-12-02 10:12:40
+LastEditTime: 2025-12-02 10:12:40
+FilePath: /sdn_qos/controller/telemetry_store.py
+Description: 控制器内存时序存储（per-flow per-hop / per-port）
+
+Copyright (c) 2025 by ${git_name_email}, All Rights Reserved.
+'''
+# controller/telemetry_store.py
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+FLOW_COLUMNS = ("bytes", "rate_bps")
+PORT_COLUMNS = ("tx_bytes", "rx_bytes", "tx_bps", "rx_bps", "util")
+
+# 二进制格式头：magic, version, 列数(不含 ts), 行数
+BINARY_MAGIC = b"TSR1"
+BINARY_HEADER = struct.Struct("<4sHHI")
+
+
+class RingSeries:
+    """
+    环形缓冲：一列时间戳 + 若干列 float64。
+    缓冲从 initial 行起按需翻倍，最多 max_rows 行；到顶之后覆盖最旧的样本。
+    大部分 flow 活不到 max_rows 个样本，不用一开始就按上限分配。
+    """
+
+    def __init__(self, max_rows: int, columns: Tuple[str, ...], initial: int = 16):
+        self.max_rows = max_rows
+        self.capacity = min(initial, max_rows)
+        self.columns = columns
+        self.ts = np.zeros(self.capacity, dtype=np.float64)
+        self.data = np.zeros((self.capacity, len(columns)), dtype=np.float64)
+        self.count = 0   # 当前有效样本数（<= capacity）
+        self.head = 0    # 下一次写入的位置
+
+    @property
+    def nbytes(self) -> int:
+        return self.ts.nbytes + self.data.nbytes
+
+    @property
+    def last_ts(self) -> float:
+        return float(self.ts[self.head - 1]) if self.count else 0.0
+
+    def _resize(self, capacity: int):
+        # 只在还没绕回时调用（count <= capacity 且 head == count），前 count 行就是按时间顺序的
+        ts = np.zeros(capacity, dtype=np.float64)
+        data = np.zeros((capacity, len(self.columns)), dtype=np.float64)
+        ts[:self.count] = self.ts[:self.count]
+        data[:self.count] = self.data[:self.count]
+        self.ts, self.data, self.capacity = ts, data, capacity
+        self.head = self.count % capacity
+
+    def compact(self):
+        """序列不再增长时（flow 已结束）把没用上的预留行还掉"""
+        if 0 < self.count < self.capacity:
+            self._resize(self.count)
+
+    def append(self, ts: float, values):
+        if self.count == self.capacity and self.capacity < self.max_rows:
+            self._resize(min(self.max_rows, self.capacity * 2))
+        self.ts[self.head] = ts
+        self.data[self.head] = values
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def _ordered(self) -> Tuple[np.ndarray, np.ndarray]:
+        """按时间顺序返回有效样本（视图拼接，最多拷贝一次）"""
+        if self.count < self.capacity:
+            return self.ts[:self.count], self.data[:self.count]
+        idx = np.r_[self.head:self.capacity, 0:self.head]
+        return self.ts[idx], self.data[idx]
+
+    def range(self, start: Optional[float] = None, end: Optional[float] = None,
+              step: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        取 [start, end] 范围的样本；给了 step 则按 step 秒分桶降采样：
+          - 桶时间戳取桶内最后一个样本的时间
+          - 各列取桶内均值
+        """
+        ts, data = self._ordered()
+        if start is not None or end is not None:
+            lo = 0 if start is None else int(np.searchsorted(ts, start, side="left"))
+            hi = len(ts) if end is None else int(np.searchsorted(ts, end, side="right"))
+            ts, data = ts[lo:hi], data[lo:hi]
+
+        if step and step > 0 and len(ts) > 1:
+            buckets = np.floor(ts / step).astype(np.int64)
+            starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+            ends = np.r_[starts[1:], len(ts)] - 1
+            counts = (ends - starts + 1).astype(np.float64)
+            sums = np.add.reduceat(data, starts, axis=0)
+            ts, data = ts[ends], sums / counts[:, None]
+        return ts, data
+
+
+class TelemetryStore:
+    """
+    控制器内的时序存储：
+      - ("flow", flow_id, dpid)  -> bytes / rate_bps
+      - ("port", dpid, port_no)  -> tx/rx 字节、速率、利用率
+
+    保留策略：
+      - 时间：只保留最近 retention_s 秒的样本（查询按最新样本往前截），
+        retention_s 内没有新样本的序列由 expire() 整条删掉
+      - 结束的 flow：drop_flow() 后再保留 finished_ttl 秒（画图 / 排查用），然后删掉
+      - 内存：所有序列缓冲总字节数超过 memory_budget_mb 时淘汰最久未更新的序列
+    每条序列最多 max_rows 行，缓冲按需增长。
+    """
+
+    def __init__(self, retention_s: float = 600.0, max_rows: int = 600,
+                 memory_budget_mb: float = 64.0, finished_ttl: float = 60.0):
+        self.retention_s = retention_s
+        self.max_rows = max_rows
+        self.memory_budget = int(memory_budget_mb * (1 << 20))
+        self.finished_ttl = finished_ttl
+        self._series: "OrderedDict[tuple, RingSeries]" = OrderedDict()
+        self._bytes = 0
+        # flow_id -> {dpid: hop_idx}，查询时按路径顺序返回各跳
+        self._flow_hops: Dict[int, Dict[int, int]] = {}
+        # 已结束 flow 的删除时间：flow_id -> 到期时间戳
+        self._expire_at: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg: Optional[dict]) -> "TelemetryStore":
+        cfg = cfg or {}
+        return cls(retention_s=float(cfg.get("retention_s", 600.0)),
+                   max_rows=int(cfg.get("max_rows", 600)),
+                   memory_budget_mb=float(cfg.get("memory_budget_mb", 64.0)),
+                   finished_ttl=float(cfg.get("finished_ttl", 60.0)))
+
+    def _get_series(self, key: tuple, columns: Tuple[str, ...]) -> RingSeries:
+        series = self._series.get(key)
+        if series is None:
+            series = RingSeries(self.max_rows, columns)
+            self._series[key] = series
+            self._bytes += series.nbytes
+        else:
+            self._series.move_to_end(key)
+        return series
+
+    def _append(self, series: RingSeries, ts: float, values):
+        before = series.nbytes
+        series.append(ts, values)
+        if series.nbytes != before:
+            self._bytes += series.nbytes - before
+            self._evict_over_budget()
+
+    def _evict_over_budget(self):
+        # 至少留下刚写入的那条（在 OrderedDict 末尾）
+        while self._bytes > self.memory_budget and len(self._series) > 1:
+            old_key, _ = next(iter(self._series.items()))
+            self._remove(old_key)
+
+    def _remove(self, key: tuple):
+        series = self._series.pop(key, None)
+        if series is None:
+            return
+        self._bytes -= series.nbytes
+        if key[0] == "flow":
+            self._drop_flow_hop(key[1], key[2])
+
+    def _drop_flow_hop(self, flow_id: int, dpid: int):
+        hops = self._flow_hops.get(flow_id)
+        if hops is not None:
+            hops.pop(dpid, None)
+            if not hops:
+                del self._flow_hops[flow_id]
+                self._expire_at.pop(flow_id, None)
+
+    # ---------------- 写入 ----------------
+
+    def record_flow(self, flow_id: int, dpid: int, hop_idx: int,
+                    ts: float, byte_count: int, rate_bps: float):
+        with self._lock:
+            self._flow_hops.setdefault(flow_id, {})[dpid] = hop_idx
+            series = self._get_series(("flow", flow_id, dpid), FLOW_COLUMNS)
+            self._append(series, ts, (byte_count, rate_bps))
+
+    def record_port(self, dpid: int, port_no: int, ts: float,
+                    tx_bytes: int, rx_bytes: int,
+                    tx_bps: float, rx_bps: float, util: float):
+        with self._lock:
+            series = self._get_series(("port", dpid, port_no), PORT_COLUMNS)
+            self._append(series, ts, (tx_bytes, rx_bytes, tx_bps, rx_bps, util))
+
+    def drop_flow(self, flow_id: int, now: Optional[float] = None):
+        """
+        flow 结束时调用：序列缓冲收缩到实际样本数，finished_ttl 秒后由 expire() 删除；
+        finished_ttl <= 0 时立即删除
+        """
+        with self._lock:
+            dpids = list(self._flow_hops.get(flow_id, ()))
+            if self.finished_ttl <= 0:
+                for dpid in dpids:
+                    self._remove(("flow", flow_id, dpid))
+                return
+            for dpid in dpids:
+                series = self._series.get(("flow", flow_id, dpid))
+                if series is not None:
+                    before = series.nbytes
+                    series.compact()
+                    self._bytes += series.nbytes - before
+            if dpids:
+                self._expire_at[flow_id] = (time.time() if now is None else now) + self.finished_ttl
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """删除到期的已结束 flow 和 retention_s 内没有新样本的序列，返回删掉的序列数"""
+        now = time.time() if now is None else now
+        with self._lock:
+            n = len(self._series)
+            for flow_id in [f for f, t in self._expire_at.items() if t <= now]:
+                for dpid in list(self._flow_hops.get(flow_id, ())):
+                    self._remove(("flow", flow_id, dpid))
+                self._expire_at.pop(flow_id, None)
+            cutoff = now - self.retention_s
+            for key in [k for k, s in self._series.items() if s.last_ts < cutoff]:
+                self._remove(key)
+            return n - len(self._series)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"series": len(self._series), "mb": self._bytes / (1 << 20),
+                    "finishing": len(self._expire_at)}
+
+    # ---------------- 查询 ----------------
+
+    def flow_hops(self, flow_id: int) -> List[Tuple[int, int]]:
+        """返回 [(hop_idx, dpid), ...]，按路径顺序"""
+        with self._lock:
+            hops = self._flow_hops.get(flow_id, {})
+            return sorted((idx, dpid) for dpid, idx in hops.items())
+
+    def query(self, key: tuple, start: Optional[float] = None,
+              end: Optional[float] = None, step: Optional[float] = None):
+        """返回 (columns, ts, data)，序列不存在时返回 None"""
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                return None
+            # 时间保留：最新样本往前 retention_s 秒
+            oldest = series.last_ts - self.retention_s
+            if start is None or start < oldest:
+                start = oldest
+            ts, data = series.range(start, end, step)
+            # 拷贝出来，避免释放锁后被新样本覆盖
+            return series.columns, ts.copy(), data.copy()
+
+    @staticmethod
+    def to_json(columns, ts: np.ndarray, data: np.ndarray) -> dict:
+        return {
+            "columns": ["ts"] + list(columns),
+            "values": np.column_stack((ts, data)).tolist(),
+        }
+
+    @staticmethod
+    def to_binary(columns, ts: np.ndarray, data: np.ndarray) -> bytes:
+        """
+        紧凑二进制格式：
+          header: <4sHHI  (b"TSR1", version=1, ncols, nrows)
+          body  : nrows x (1 + ncols) 个 little-endian float64，每行 [ts, col...]
+        """
+        table = np.column_stack((ts, data)).astype("<f8", copy=False)
+        header = BINARY_HEADER.pack(BINARY_MAGIC, 1, len(columns), len(ts))
+        return header + table.tobytes()
+
+    @staticmethod
+    def from_binary(buf: bytes) -> Tuple[np.ndarray, np.ndarray]:
+        """to_binary 的逆过程，返回 (ts, data)，给绘图工具用"""
+        magic, _version, ncols, nrows = BINARY_HEADER.unpack_from(buf, 0)
+        if magic != BINARY_MAGIC:
+            raise ValueError("bad telemetry binary header")
+        table = np.frombuffer(buf, dtype="<f8", offset=BINARY_HEADER.size,
+                              count=nrows * (ncols + 1)).reshape(nrows, ncols + 1)
+        return table[:, 0], table[:, 1:]
@@ -0,0 +1,76 @@
+'''
+Author: yc && qq747339545@163.com
+Date: 2025-12-03 16:05:12
+LastEditTime: 2025-12-03 16:05:12
+FilePath: /sdn_qos/controller/timer_wheel.py
+Description: 哈希时间轮（逐跳尾部释放定时用）
+
+Copyright (c) 2025 by ${git_name_email}, All Rights Reserved.
+'''
+# controller/timer_wheel.py
+import math
+import time
+from typing import Dict, Hashable, List, Optional, Tuple
+
+
+class HashedTimerWheel:
+    """
+    单层哈希时间轮：
+      - 时间按 tick 秒离散成刻度，刻度 t 的定时器放在 slots[t % n_slots]
+      - schedule / cancel 都是 O(1)，同一个 key 再次 schedule 会覆盖旧的定时
+      - advance(now) 只扫走过的槽位，超过一圈的定时器留在槽里等下一圈
+
+    不自带线程，调用方在自己的循环里周期性 advance。
+    """
+
+    def __init__(self, tick: float = 0.05, n_slots: int = 512, start: Optional[float] = None):
+        if tick <= 0 or n_slots <= 0:
+            raise ValueError("tick and n_slots must be positive")
+        self.tick = tick
+        self.n_slots = n_slots
+        # 每个槽：key -> (到期刻度, payload)
+        self._slots: List[Dict[Hashable, tuple]] = [{} for _ in range(n_slots)]
+        self._where: Dict[Hashable, int] = {}  # key -> 槽位下标
+        self._cur = int((time.time() if start is None else start) / tick)  # 已处理到的刻度
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, key) -> bool:
+        return key in self._where
+
+    def schedule(self, key: Hashable, deadline: float, payload=None):
+        """在 deadline（绝对时间）触发 key；已过期的 deadline 在下一次 advance 触发"""
+        self.cancel(key)
+        t = max(int(math.ceil(deadline / self.tick)), self._cur + 1)
+        idx = t % self.n_slots
+        self._slots[idx][key] = (t, payload)
+        self._where[key] = idx
+
+    def cancel(self, key: Hashable) -> bool:
+        idx = self._where.pop(key, None)
+        if idx is None:
+            return False
+        self._slots[idx].pop(key, None)
+        return True
+
+    def advance(self, now: float) -> List[Tuple[Hashable, object]]:
+        """推进到 now，返回到期的 [(key, payload), ...]"""
+        # 加一点余量，避免 0.6 / 0.1 = 5.999... 这类浮点误差少走一格
+        target = int(now / self.tick + 1e-9)
+        if target <= self._cur:
+            return []
+        fired = []
+        # 一次走过超过一圈时每个槽只需要扫一遍
+        steps = min(target - self._cur, self.n_slots)
+        for i in range(1, steps + 1):
+            bucket = self._slots[(self._cur + i) % self.n_slots]
+            if not bucket:
+                continue
+            due = [key for key, (t, _) in bucket.items() if t <= target]
+            for key in due:
+                _, payload = bucket.pop(key)
+                del self._where[key]
+                fired.append((key, payload))
+        self._cur = target
+        return fired
@@ -0,0 +1,153 @@
+# host_agent/control_server.py
+"""
+host_agent 控制面 server：单个 asyncio 事件循环处理所有控制器连接，
+PERMIT / FLOW_PREPARE 的处理（起子进程、写文件）丢给有界线程池。
+
+协议：控制器每条消息一行 JSON（一条连接上可以连续发多条），agent 对每一行回一行 ACK：
+    {"type": "ACK", "msg_type": "PERMIT", "flow_id": 123, "busy": false, "queued": 0}
+busy=true 表示线程池已经排队，控制器应暂时别再给这台 host 派活；
+排队数达到 max_queue 时不再提交，ACK 带 rejected=true（消息没有处理），由控制器稍后重发。
+STOP 这类释放资源的消息不受 max_queue 限制。
+RATE_UPDATE 这类很快的消息直接在事件循环里处理（inline），handler 返回的 dict 并进 ACK，
+控制器据此知道这次调速有没有真正生效（applied）。
+"""
+import asyncio
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger("host_agent")
+
+
+class ControlServer:
+    def __init__(self, listen_ip: str, listen_port: int,
+                 handlers: Dict[str, Callable[[dict], None]],
+                 max_workers: int = 4, busy_queue: Optional[int] = None,
+                 max_queue: Optional[int] = None, unbounded=("STOP",),
+                 inline=("RATE_UPDATE",)):
+        self.listen_ip = listen_ip
+        self.listen_port = listen_port
+        self.handlers = {k.upper(): v for k, v in handlers.items()}
+        self.max_workers = max_workers
+        # 排队（还没开始执行）的任务数达到这个值就在 ACK 里报 busy
+        self.busy_queue = max_workers if busy_queue is None else busy_queue
+        # 排队数达到这个值就拒绝新消息（ACK rejected=true），线程池队列不会无限增长
+        self.max_queue = 4 * self.busy_queue if max_queue is None else max_queue
+        self.unbounded = {t.upper() for t in unbounded}
+        # 不进线程池、在事件循环里直接执行的消息类型，handler 不能阻塞
+        self.inline = {t.upper() for t in inline}
+        self.rejected = 0
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="agent-ctrl")
+        self._inflight = 0          # 已提交还没完成的任务数（只在事件循环线程里改）
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    # ---------------- 生命周期 ----------------
+
+    def start(self) -> threading.Thread:
+        self._thread = threading.Thread(target=self._run, name="agent-ctrl-loop", daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout=5.0)
+        return self._thread
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        server = self._loop.run_until_complete(
+            asyncio.start_server(self._on_conn, self.listen_ip, self.listen_port,
+                                 reuse_address=True, backlog=128))
+        logger.info(f"PERMIT server listening on {self.listen_ip}:{self.listen_port} "
+                    f"(asyncio, workers={self.max_workers})")
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            server.close()
+            self._loop.run_until_complete(server.wait_closed())
+            self._loop.close()
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        self._executor.shutdown(wait=False)
+
+    # ---------------- 状态 ----------------
+
+    @property
+    def queued(self) -> int:
+        return max(0, self._inflight - self.max_workers)
+
+    @property
+    def busy(self) -> bool:
+        return self.queued >= self.busy_queue
+
+    # ---------------- 连接处理 ----------------
+
+    async def _on_conn(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        addr = writer.get_extra_info("peername")
+        try:
+            while True:
+                line_bytes = await reader.readline()
+                if not line_bytes:
+                    break
+                line = line_bytes.decode("utf-8", errors="replace").strip()
+                if not line:
+                    continue
+                ack = self._dispatch(line, addr)
+                writer.write((json.dumps(ack) + "\n").encode("utf-8"))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # 老版本控制器发完就断开，不读 ACK
+            pass
+        finally:
+            writer.close()
+
+    def _dispatch(self, line: str, addr) -> dict:
+        logger.info(f"Received from controller {addr}: {line}")
+        try:
+            msg = json.loads(line)
+        except json.JSONDecodeError as e:
+            logger.error(f"Invalid JSON from controller: {e}, raw={line!r}")
+            return {"type": "ACK", "error": "invalid json", "busy": self.busy, "queued": self.queued}
+
+        msg_type = str(msg.get("type", "")).upper()
+        handler = self.handlers.get(msg_type)
+        if handler is None:
+            logger.warning(f"Unknown message type from controller: {msg}")
+            return {"type": "ACK", "msg_type": msg_type, "error": "unknown type",
+                    "busy": self.busy, "queued": self.queued}
+
+        if msg_type in self.inline:
+            ack = {"type": "ACK", "msg_type": msg_type, "flow_id": msg.get("flow_id")}
+            ack.update(self._call(handler, msg) or {})
+            ack.update(busy=self.busy, queued=self.queued)
+            return ack
+
+        if self.queued >= self.max_queue and msg_type not in self.unbounded:
+            self.rejected += 1
+            logger.warning(f"[agent] control queue full (queued={self.queued}), "
+                           f"reject {msg_type} flow_id={msg.get('flow_id')}")
+            return {"type": "ACK", "msg_type": msg_type, "flow_id": msg.get("flow_id"),
+                    "busy": True, "rejected": True, "queued": self.queued}
+
+        self._inflight += 1
+        fut = self._executor.submit(self._call, handler, msg)
+        fut.add_done_callback(lambda _f: self._loop.call_soon_threadsafe(self._task_done))
+        return {"type": "ACK", "msg_type": msg_type, "flow_id": msg.get("flow_id"),
+                "busy": self.busy, "queued": self.queued}
+
+    def _task_done(self):
+        self._inflight -= 1
+
+    @staticmethod
+    def _call(handler, msg: dict):
+        try:
+            return handler(msg)
+        except Exception:
+            logger.exception(f"[agent] handler failed for {msg.get('type')} flow_id={msg.get('flow_id')}")
+            return {"error": "handler failed"}
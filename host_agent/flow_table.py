@@ -0,0 +1,203 @@
+# host_agent/flow_table.py
+"""
+agent 侧的 flow 表：flow_id -> FlowEntry，记录本机上每条 flow 的发送端 / 接收端。
+
+- 每个 entry 持有自己的句柄（iperf3 Popen 或引擎里的 SendFlow）、状态、起止时间、退出码
+- stop_fn / rate_fn 由创建方按后端填，STOP / RATE_UPDATE 按 flow_id 找到 entry 调用
+- reaper 线程定期 poll 子进程回收退出码，结束超过 keep_finished 秒的 entry 移出表，
+  表的大小只跟并发 flow 数有关，不会随历史 flow 数增长
+"""
+import logging
+import signal
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger("host_agent")
+
+RUNNING = "running"
+FINISHED = "finished"
+FAILED = "failed"
+STOPPED = "stopped"
+
+
+class FlowEntry:
+    __slots__ = ("flow_id", "role", "backend", "state", "started_at", "ended_at",
+                 "exit_code", "proc", "handle", "info", "stop_fn", "rate_fn",
+                 "on_done", "stop_requested_at")
+
+    def __init__(self, flow_id: int, role: str, backend: str, info: Optional[dict] = None,
+                 proc=None, handle=None,
+                 stop_fn: Optional[Callable[[], None]] = None,
+                 rate_fn: Optional[Callable[[int], bool]] = None,
+                 on_done: Optional[Callable[["FlowEntry"], None]] = None):
+        self.flow_id = flow_id
+        self.role = role                # sender | receiver
+        self.backend = backend          # engine | iperf3
+        self.state = RUNNING
+        self.started_at = time.time()
+        self.ended_at: Optional[float] = None
+        self.exit_code: Optional[int] = None
+        self.proc = proc
+        self.handle = handle
+        self.info = info or {}
+        self.stop_fn = stop_fn
+        self.rate_fn = rate_fn
+        self.on_done = on_done
+        self.stop_requested_at: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        d = {
+            "flow_id": self.flow_id,
+            "role": self.role,
+            "backend": self.backend,
+            "state": self.state,
+            "started_at": self.started_at,
+            "ended_at": self.ended_at,
+            "exit_code": self.exit_code,
+        }
+        d.update(self.info)
+        if self.handle is not None and hasattr(self.handle, "sent_bytes"):
+            d["sent_bytes"] = self.handle.sent_bytes
+        return d
+
+
+class FlowTable:
+    # iperf3 收到 SIGINT 后这么久还没退出就 kill
+    STOP_GRACE = 3.0
+
+    def __init__(self, keep_finished: float = 60.0, max_finished: int = 1024):
+        self.keep_finished = keep_finished
+        self.max_finished = max_finished
+        self._lock = threading.Lock()
+        self._entries: Dict[int, FlowEntry] = {}
+        self._done = deque()          # (ended_at, flow_id)，按结束先后
+        self._thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, entry: FlowEntry) -> FlowEntry:
+        with self._lock:
+            old = self._entries.get(entry.flow_id)
+            if old is not None and old.state == RUNNING:
+                logger.warning(f"[flows] flow_id={entry.flow_id} already running "
+                               f"({old.role}/{old.backend}), replaced")
+            self._entries[entry.flow_id] = entry
+        return entry
+
+    def get(self, flow_id: int) -> Optional[FlowEntry]:
+        return self._entries.get(flow_id)
+
+    def running(self, role: Optional[str] = None) -> List[FlowEntry]:
+        with self._lock:
+            return [e for e in self._entries.values()
+                    if e.state == RUNNING and (role is None or e.role == role)]
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            return [e.to_dict() for e in self._entries.values()]
+
+    # ---------------- 状态迁移 ----------------
+
+    def mark_done(self, flow_id: int, state: str, exit_code: Optional[int] = None):
+        with self._lock:
+            entry = self._entries.get(flow_id)
+            if entry is None or entry.state != RUNNING:
+                return
+            # 被 STOP 的 flow 不管退出码都记 stopped
+            entry.state = STOPPED if entry.stop_requested_at is not None else state
+            entry.exit_code = exit_code
+            entry.ended_at = time.time()
+            entry.proc = None
+            entry.handle = None
+            self._done.append((entry.ended_at, flow_id))
+        logger.info(f"[flows] flow_id={flow_id} {entry.role} {entry.state} rc={exit_code} "
+                    f"dur={entry.ended_at - entry.started_at:.2f}s")
+        if entry.on_done is not None:
+            try:
+                entry.on_done(entry)
+            except Exception:
+                logger.exception(f"[flows] on_done failed for flow_id={flow_id}")
+
+    def stop(self, flow_id: int) -> bool:
+        entry = self._entries.get(flow_id)
+        if entry is None or entry.state != RUNNING:
+            return False
+        entry.stop_requested_at = time.time()
+        if entry.stop_fn is not None:
+            entry.stop_fn()
+        elif entry.proc is not None:
+            try:
+                entry.proc.send_signal(signal.SIGINT)   # 等价于 Ctrl+C，iperf3 会打印汇总
+            except OSError:
+                pass
+        return True
+
+    def stop_all(self, role: Optional[str] = None) -> int:
+        n = 0
+        for entry in self.running(role):
+            n += self.stop(entry.flow_id)
+        return n
+
+    def set_rate(self, flow_id: int, rate_bps: int) -> bool:
+        entry = self._entries.get(flow_id)
+        if entry is None or entry.state != RUNNING or entry.rate_fn is None:
+            return False
+        if not entry.rate_fn(rate_bps):
+            return False
+        entry.info["rate_bps"] = rate_bps
+        return True
+
+    # ---------------- 回收 ----------------
+
+    def reap(self, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        exited = []
+        with self._lock:
+            for entry in self._entries.values():
+                proc = entry.proc
+                if entry.state != RUNNING or proc is None:
+                    continue
+                rc = proc.poll()
+                if rc is not None:
+                    exited.append((entry.flow_id, rc))
+                elif entry.stop_requested_at is not None and \
+                        now - entry.stop_requested_at >= self.STOP_GRACE:
+                    proc.kill()
+        for flow_id, rc in exited:
+            self.mark_done(flow_id, FINISHED if rc == 0 else FAILED, rc)
+
+        with self._lock:
+            done = self._done
+            while done and (now - done[0][0] >= self.keep_finished or len(done) > self.max_finished):
+                ended_at, flow_id = done.popleft()
+                entry = self._entries.get(flow_id)
+                # 同一个 flow_id 可能又被重新 add 过，只删结束时间对得上的
+                if entry is not None and entry.state != RUNNING and entry.ended_at == ended_at:
+                    del self._entries[flow_id]
+
+    def start_reaper(self, interval: float = 1.0,
+                     hooks: Optional[List[Callable[[], None]]] = None) -> threading.Thread:
+        """hooks：每轮顺带执行的其他回收（比如清理退出的 iperf3 server）"""
+        hooks = hooks or []
+
+        def _loop():
+            while True:
+                try:
+                    self.reap()
+                    for hook in hooks:
+                        hook()
+                except Exception:
+                    logger.exception("[flows] reaper error")
+                time.sleep(interval)
+
+        self._thread = threading.Thread(target=_loop, name="flow-reaper", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def procs(self) -> list:
+        """还在跑的子进程（cleanup 用）"""
+        with self._lock:
+            return [e.proc for e in self._entries.values() if e.proc is not None]
@@ -7,14 +7,11 @@ import subprocess
 import time
 import threading
 import logging
-import urllib.request
-import subprocess
-
-import signal
+import queue
 import sys
 import os
 import random
-import numpy as np
+from typing import Optional
 
 
 # 保存原始路径
@@ -25,17 +22,23 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(project_root)
 
 try:
-    from controller.exp_logger import ExperimentLogger
+    from controller.exp_logger import get_run_context
     
 finally:
     # 恢复原始路径
     sys.path = original_path
 
+from control_server import ControlServer
+from traffic_engine import SenderEngine
+from traffic_receiver import TrafficReceiver
+from flow_table import FlowEntry, FlowTable, FINISHED, FAILED
+from workload import EmpiricalCDF, OpenLoopDriver
+from http_client import default_client
+
 
 # 可选：记录当前 server 进程，方便 cleanup
 IPERF_SERVER_PROC = None
-CURRENT_CLIENT_PROC = None  # 下面第二部分会用
-# BASE_LOG_DIR = "/home/yc/sdn_qos/logs"
+BASE_LOG_DIR = "/home/yc/sdn_qos/logs"
 
 logger = logging.getLogger("host_agent")
 logging.basicConfig(
@@ -44,9 +47,8 @@ logging.basicConfig(
 )
 
 
-# 记录当前 host_agent 启动的所有子进程（iperf3 server / client）
-CHILD_PROCS = []
-CURRENT_CLIENT_PROC = None  # 文件顶部已经定义过
+# 本机上每条 flow 的发送端 / 接收端（句柄、状态、起止时间、退出码），reaper 定期回收
+FLOWS = FlowTable()
 # 记录 server 端“即将到来”的 flow，key 用 4-tuple
 # (dst_ip, dst_port, src_ip, src_port) -> (flow_id, run_ts)
 PENDING_SERVER_FLOWS = {}
@@ -58,27 +60,68 @@ MY_IP = None
 IPERF_SERVERS = {}
 IPERF_SERVERS_LOCK = threading.Lock()
 
-def stop_current_client():
-    """
-    停止当前正在发流的 iperf3 client（如果有的话）。
-    """
-    global CURRENT_CLIENT_PROC
-    proc = CURRENT_CLIENT_PROC
-    if proc is None:
+# 流量后端：engine（进程内 SenderEngine / TrafficReceiver）| iperf3（每条 flow 一个 iperf3 进程）
+# 收发两端必须用同一种后端
+TRAFFIC_BACKEND = os.environ.get("TRAFFIC_BACKEND", "engine").lower()
+SENDER_ENGINE = None
+SENDER_ENGINE_LOCK = threading.Lock()
+RECEIVER = None
+# 接收端完成上报队列（start_host_reporter 里创建）
+REPORT_QUEUE = None
+
+
+def get_sender_engine() -> SenderEngine:
+    """第一次用到时才起 worker 线程"""
+    global SENDER_ENGINE
+    with SENDER_ENGINE_LOCK:
+        if SENDER_ENGINE is None:
+            SENDER_ENGINE = SenderEngine()
+        return SENDER_ENGINE
+
+
+def get_receiver() -> TrafficReceiver:
+    """本机唯一的接收线程，第一次 FLOW_PREPARE 时启动"""
+    global RECEIVER
+    with SENDER_ENGINE_LOCK:
+        if RECEIVER is None:
+            RECEIVER = TrafficReceiver(MY_IP, on_complete=on_flow_received,
+                                       on_expire=lambda st: FLOWS.mark_done(st["flow_id"], FAILED))
+            RECEIVER.start()
+        return RECEIVER
+
+
+def on_flow_received(stats: dict):
+    """接收端判定一条 flow 收完：马上排队上报控制器，再写 server.log"""
+    flow_id = stats["flow_id"]
+    complete = stats["complete"]
+    FLOWS.mark_done(flow_id, FINISHED if complete else FAILED)
+    if REPORT_QUEUE is not None:
+        # 空闲超时判定的部分完成按 failed 上报，控制器据此记状态
+        REPORT_QUEUE.put({
+            "flow_id": flow_id,
+            "status": "finished" if complete else "failed",
+            "complete": complete,
+            "bytes_received": stats["bytes_received"],
+            "pkts": stats["pkts"],
+            "lost": stats["lost"],
+            "reordered": stats["reordered"],
+            "jitter_ms": round(stats["jitter_ms"], 4),
+            "first_ts": stats["first_ts"],
+            "last_ts": stats["last_ts"],
+        })
+    logger.info(f"[agent] RECV {'DONE' if complete else 'PARTIAL'} flow_id={flow_id} bytes={stats['bytes_received']}/"
+                f"{stats['size_bytes']} lost={stats['lost']} reordered={stats['reordered']} "
+                f"jitter={stats['jitter_ms']:.3f}ms goodput={stats['goodput_bps']:.0f}bps")
+    if stats.get("run_ts") is None:
         return
+    server_log_path = get_run_context(BASE_LOG_DIR, stats["run_ts"]).iperf_server_log_path(
+        flow_id=flow_id,
+        src_ip=stats["src_ip"],
+        dst_ip=stats["dst_ip"],
+    )
+    with open(server_log_path, "w") as f:
+        f.write(f"STATS: {json.dumps(stats)}\n")
 
-    if proc.poll() is None:  # 还在跑
-        logging.info("[agent] stop_current_client: terminating iperf3 client pid=%s", proc.pid)
-        try:
-            # 先尝试优雅终止
-            proc.send_signal(signal.SIGINT)  # 等价于 Ctrl+C
-        except Exception:
-            proc.terminate()
-        try:
-            proc.wait(timeout=3)
-        except Exception:
-            proc.kill()
-    CURRENT_CLIENT_PROC = None
 
 def kill_old_iperf3_server(port: int):
     """
@@ -102,12 +145,12 @@ def kill_old_iperf3_server(port: int):
 
 def handle_permit(msg: dict):
     """
-    收到 PERMIT 后，启动 iperf3 发送流（只起一个 client），
-    并把输出重定向到 client.log，同时在前后写时间戳。
+    收到 PERMIT 后开始发流：
+      - TRAFFIC_BACKEND=engine（默认）：交给进程内 SenderEngine，client.log 只记起止和计数器
+      - TRAFFIC_BACKEND=iperf3：起一个 iperf3 -u client，输出重定向到 client.log
+    两种后端都登记到 FLOWS，STOP / RATE_UPDATE 按 flow_id 找到它。
     """
-    global CURRENT_CLIENT_PROC
-
-    flow_id = msg.get("flow_id")
+    flow_id = int(msg.get("flow_id", 0) or 0)
     src_ip = msg.get("src_ip")
     dst_ip = msg.get("dst_ip")
     dst_port = int(msg.get("dst_port", 0)) or None
@@ -121,6 +164,12 @@ def handle_permit(msg: dict):
         logger.error(f"Invalid PERMIT: {msg}")
         return
 
+    client_log_path = _client_log_path(run_ts, flow_id, src_ip, dst_ip)
+    if TRAFFIC_BACKEND == "engine":
+        _start_engine_flow(flow_id, src_ip, src_port, dst_ip, dst_port,
+                           rate_bps, size_bytes, dscp, client_log_path)
+        return
+
     # DSCP -> TOS
     tos = dscp << 2
     duration = int(size_bytes * 8 / rate_bps) + 1
@@ -141,22 +190,6 @@ def handle_permit(msg: dict):
         cmd += ["-p", str(dst_port)]
     if src_port is not None:
         cmd += ["--cport", str(src_port)]   # 关键：让 iperf3 用指定 src_port
-        
-    # ===== 统一 client 日志命名 =====
-    # /home/yc/sdn_qos/logs/<run_id>/iperf/<flow_id>:<src_ip>_to_<dst_ip>/client.log
-    exp_logger = ExperimentLogger(
-        base_dir="/home/yc/sdn_qos/logs",
-        run_id=run_ts,
-    )
-    iperf_dir = exp_logger.run_dir / "iperf"
-    iperf_dir.mkdir(parents=True, exist_ok=True)
-
-    # 新增：为每个 flow 建一个子目录
-    flow_dir = iperf_dir / f"{flow_id}:{src_ip}_to_{dst_ip}"
-    flow_dir.mkdir(parents=True, exist_ok=True)
-
-    # 日志文件改成固定叫 client.log
-    client_log_path = flow_dir / "client.log"
 
     logger.info(f"[agent] START flow_id={flow_id} cmd: {' '.join(cmd)} "
                 f"log={client_log_path}")
@@ -173,26 +206,78 @@ def handle_permit(msg: dict):
             stderr=subprocess.STDOUT,
         )
 
-    CHILD_PROCS.append(proc)
-    CURRENT_CLIENT_PROC = proc
+    def _mark_end(entry):
+        # reaper 回收到退出码后调用，不再每个 client 开一个 wait 线程
+        end_ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        with open(client_log_path, "a") as ff:
+            ff.write(f"\n=== iperf3 client END {end_ts}, rc={entry.exit_code} ===\n")
+
+    # iperf3 跑起来之后改不了速率，不给 rate_fn
+    FLOWS.add(FlowEntry(flow_id, "sender", "iperf3", proc=proc, on_done=_mark_end,
+                        info={"peer": f"{dst_ip}:{dst_port}", "rate_bps": rate_bps,
+                              "size_bytes": size_bytes}))
+
+
+def _client_log_path(run_ts, flow_id, src_ip, dst_ip):
+    """
+    统一 client 日志命名：
+    /home/yc/sdn_qos/logs/<run_id>/iperf/<flow_id>:<src_ip>_to_<dst_ip>/client.log
+    """
+    # 每个 flow 一个子目录；run 目录解析和 mkdir 走进程级缓存
+    return get_run_context(BASE_LOG_DIR, run_ts).iperf_client_log_path(flow_id, src_ip, dst_ip)
+
 
-    def _wait_and_mark(p, log_path):
-        rc = p.wait()
+def _start_engine_flow(flow_id, src_ip, src_port, dst_ip, dst_port,
+                       rate_bps, size_bytes, dscp, client_log_path):
+    """
+    TRAFFIC_BACKEND=engine：交给进程内 SenderEngine 发，
+    client.log 格式和 iperf3 后端一样有 START / END 行，END 行后附每流计数器。
+    """
+    start_ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    with open(client_log_path, "w") as f:
+        f.write(f"=== engine client START {start_ts} ===\n")
+        f.write(f"FLOW: {src_ip}:{src_port} -> {dst_ip}:{dst_port} "
+                f"rate={rate_bps} size={size_bytes} dscp={dscp}\n\n")
+
+    engine = get_sender_engine()
+    # 先登记再 submit：很小的 flow 可能在 submit 返回前就发完了
+    entry = FLOWS.add(FlowEntry(
+        flow_id, "sender", "engine",
+        stop_fn=lambda: engine.stop_flow(flow_id),
+        rate_fn=lambda bps: engine.set_rate(flow_id, bps),
+        info={"peer": f"{dst_ip}:{dst_port}", "rate_bps": rate_bps, "size_bytes": size_bytes},
+    ))
+
+    def _on_done(sf):
+        st = sf.stats()
+        rc = 0 if st["error"] is None else 1
         end_ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-        with open(log_path, "a") as ff:
-            ff.write(f"\n=== iperf3 client END {end_ts}, rc={rc} ===\n")
+        with open(client_log_path, "a") as ff:
+            ff.write(f"STATS: {json.dumps(st)}\n")
+            ff.write(f"\n=== engine client END {end_ts}, rc={rc} ===\n")
+        entry.info["sent_bytes"] = sf.sent_bytes
+        FLOWS.mark_done(flow_id, FINISHED if rc == 0 else FAILED, rc)
+        logger.info(f"[agent] engine flow_id={sf.flow_id} done: sent={sf.sent_bytes}B "
+                    f"pkts={sf.sent_pkts} achieved={st['achieved_bps']:.0f}bps")
+
+    try:
+        entry.handle = engine.submit(flow_id, src_ip, src_port or 0, dst_ip, dst_port or 0,
+                                     rate_bps, size_bytes, dscp=dscp, on_done=_on_done)
+    except OSError as e:
+        logger.error(f"[agent] engine failed to open socket for flow_id={flow_id}: {e}")
+        FLOWS.mark_done(flow_id, FAILED, 1)
+        return
+    logger.info(f"[agent] START flow_id={flow_id} backend=engine "
+                f"{src_ip}:{src_port} -> {dst_ip}:{dst_port} rate={rate_bps} "
+                f"log={client_log_path}")
+
 
-    threading.Thread(
-        target=_wait_and_mark,
-        args=(proc, client_log_path),
-        daemon=True,
-    ).start()
-    
 def handle_flow_prepare(msg: dict):
     """
     目的 host 收到 FLOW_PREPARE：
-    记录 (dst_ip, dst_port, src_ip, src_port) -> (flow_id, run_ts)，
-    供后面 iperf3 server 日志拆分、以及从端口反查 flow_id 使用。
+    记录 (dst_ip, dst_port, src_ip, src_port) -> (flow_id, run_ts)。
+      - engine 后端：登记到 TrafficReceiver，按 4-tuple 记账
+      - iperf3 后端：供 iperf3 server 日志拆分、以及从端口反查 flow_id 使用
     """
     global MY_IP
     flow_id = int(msg.get("flow_id", 0) or 0)
@@ -208,6 +293,25 @@ def handle_flow_prepare(msg: dict):
 
     key = (dst_ip, dst_port, src_ip, src_port)
 
+    if TRAFFIC_BACKEND == "engine":
+        if MY_IP is None:
+            logger.warning("[agent] MY_IP is None, cannot receive for FLOW_PREPARE")
+            return
+        receiver = get_receiver()
+        receiver.expect(key, flow_id, run_ts=run_ts,
+                        size_bytes=int(msg.get("size_bytes", 0) or 0))
+
+        def _stop_recv():
+            receiver.drop(key)
+            FLOWS.mark_done(flow_id, FINISHED)
+
+        FLOWS.add(FlowEntry(flow_id, "receiver", "engine", stop_fn=_stop_recv,
+                            info={"peer": f"{src_ip}:{src_port}",
+                                  "size_bytes": int(msg.get("size_bytes", 0) or 0)}))
+        logger.info("[agent] FLOW_PREPARE: key=%s -> flow_id=%s run_ts=%s (engine)",
+                    key, flow_id, run_ts)
+        return
+
     with PENDING_SERVER_LOCK:
         PENDING_SERVER_FLOWS[key] = (flow_id, run_ts)
 
@@ -221,59 +325,67 @@ def handle_flow_prepare(msg: dict):
         logger.warning("[agent] MY_IP is None, cannot start iperf3 server for FLOW_PREPARE")
 
 
-def start_permit_server(listen_ip: str, listen_port: int):
-    """
-    起一个 TCP Server，监听 listen_ip:listen_port
-    RYU 每次推 PERMIT 都会主动连过来，发一行 JSON 后断开
-    """
-
-    def _handle_conn(conn: socket.socket, addr):
-        try:
-            f = conn.makefile("rb")
-            for line_bytes in f:
-                line = line_bytes.decode("utf-8").strip()
-                if not line:
-                    continue
-                logger.info(f"Received from controller {addr}: {line}")
-                try:
-                    msg = json.loads(line)
-                except json.JSONDecodeError as e:
-                    logger.error(f"Invalid JSON from controller: {e}, raw={line!r}")
-                    continue
-
-                msg_type = str(msg.get("type", "")).upper()
-                if msg_type == "PERMIT":
-                    handle_permit(msg)
-                    
-                elif msg_type == "FLOW_PREPARE":
-                    handle_flow_prepare(msg)
-                else:
-                    logger.warning(f"Unknown message type from controller: {msg}")
-        finally:
-            conn.close()
-
-    def _server_loop():
-        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        server.bind((listen_ip, listen_port))
-        server.listen(5)
-        logger.info(f"PERMIT server listening on {listen_ip}:{listen_port}")
+def handle_stop(msg: dict):
+    """控制器要求停掉某条 flow（本机是它的发送端或接收端）"""
+    flow_id = int(msg.get("flow_id", 0) or 0)
+    if FLOWS.stop(flow_id):
+        logger.info(f"[agent] STOP flow_id={flow_id}")
+    else:
+        logger.warning(f"[agent] STOP flow_id={flow_id}: not running here")
 
-        while True:
-            conn, addr = server.accept()
-            t = threading.Thread(target=_handle_conn, args=(conn, addr), daemon=True)
-            t.start()
 
-    t = threading.Thread(target=_server_loop, daemon=True)
-    t.start()
-    return t
+def handle_rate_update(msg: dict) -> dict:
+    """
+    控制器调整某条正在发的 flow 的速率；只有 engine 后端支持不重启改速率。
+    在控制面事件循环里直接执行（见 ControlServer.inline），返回值并进 ACK：
+    applied 表示是否生效，rate_bps 是发送端现在实际用的速率（flow 没在本机发送时为 None），
+    控制器据此把预留退回实际速率。
+    """
+    flow_id = int(msg.get("flow_id", 0) or 0)
+    rate_bps = int(msg.get("send_rate_bps", 0) or 0)
+    entry = FLOWS.get(flow_id)
+    running = entry is not None and entry.state == "running"
+    current = entry.info.get("rate_bps") if running else None
+    if rate_bps <= 0:
+        logger.error(f"[agent] Invalid RATE_UPDATE: {msg}")
+        return {"applied": False, "rate_bps": current, "error": "invalid rate"}
+    if FLOWS.set_rate(flow_id, rate_bps):
+        logger.info(f"[agent] RATE_UPDATE flow_id={flow_id} rate={rate_bps}")
+        return {"applied": True, "rate_bps": rate_bps}
+    why = f"backend {entry.backend} cannot change rate" if running else "not running here"
+    logger.warning(f"[agent] RATE_UPDATE flow_id={flow_id} ignored: {why}")
+    return {"applied": False, "rate_bps": current, "error": why}
+
+
+def start_permit_server(listen_ip: str, listen_port: int,
+                        max_workers: int = 4, busy_queue: int = 4, max_queue: int = 16):
+    """
+    起控制面 server，监听 listen_ip:listen_port（见 control_server.py）：
+    所有连接都在一个 asyncio 事件循环里读，PERMIT / FLOW_PREPARE / STOP 的处理
+    丢给 max_workers 个线程的线程池，RATE_UPDATE 直接在事件循环里改速率；每条消息回一行 ACK，
+    线程池排队达到 busy_queue 时 ACK 带 busy=true，控制器据此暂停给本机派流；
+    排队达到 max_queue 时直接拒绝（rejected=true），由控制器重发。
+    """
+    server = ControlServer(
+        listen_ip, listen_port,
+        handlers={
+            "PERMIT": handle_permit,
+            "FLOW_PREPARE": handle_flow_prepare,
+            "STOP": handle_stop,
+            "RATE_UPDATE": handle_rate_update,
+        },
+        max_workers=max_workers,
+        busy_queue=busy_queue,
+        max_queue=max_queue,
+    )
+    return server.start()
 
 
 def report_flow_finished(controller_ip: str, flow_id: int,
-                         bytes_received: int, rest_port: int = 8080):
+                         bytes_received: int, rest_port: int = 8080, **extra):
     """
-    调用 RYU REST 告诉调度器：某个 flow 已完成。
-    （scheduler_app 里如果暂时没实现 /scheduler/host_report，这个可以先不用）
+    调用 RYU REST 告诉调度器：某个 flow 已完成（单条）。
+    extra 可带 lost / reordered / jitter_ms / first_ts / last_ts 等接收端统计。
     """
     url = f"http://{controller_ip}:{rest_port}/scheduler/host_report"
     payload = {
@@ -281,21 +393,44 @@ def report_flow_finished(controller_ip: str, flow_id: int,
         "status": "finished",
         "bytes_received": bytes_received,
     }
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        url,
-        data=data,
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
+    payload.update(extra)
     try:
-        with urllib.request.urlopen(req, timeout=3.0) as resp:
-            body = resp.read().decode("utf-8")
-            logger.info(f"report_flow_finished resp: {resp.status} {body}")
+        resp = post_json(url, payload)
+        logger.info(f"report_flow_finished resp: {resp}")
     except Exception as e:
         logger.error(f"report_flow_finished error: {e}")
 
 
+def start_host_reporter(ctrl_ip: str, ctrl_rest_port: int, max_batch: int = 100):
+    """
+    完成上报线程：接收端收完最后一个字节就把统计放进队列，
+    这里立刻取出，连同队列里已经攒下的一起 POST /scheduler/host_report {"reports": [...]}。
+    """
+    global REPORT_QUEUE
+    url = f"http://{ctrl_ip}:{ctrl_rest_port}/scheduler/host_report"
+    q = queue.Queue()
+
+    def _loop():
+        while True:
+            reports = [q.get()]
+            while len(reports) < max_batch:
+                try:
+                    reports.append(q.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                resp = post_json(url, {"reports": reports}, idempotent=True)
+                logger.info(f"[agent] host_report: sent={len(reports)} "
+                            f"finished={resp.get('finished')}")
+            except Exception as e:
+                logger.error(f"[agent] host_report failed ({len(reports)} reports): {e}")
+
+    REPORT_QUEUE = q
+    t = threading.Thread(target=_loop, name="host-reporter", daemon=True)
+    t.start()
+    return t
+
+
 def start_iperf3_server(my_ip, listen_port: int):
     """
     在本机启动 iperf3 server：
@@ -304,7 +439,7 @@ def start_iperf3_server(my_ip, listen_port: int):
       - 解析 stdout 中的每条 connection/test；
       - 根据 (dst_ip, dst_port, src_ip, src_port) 到 PENDING_SERVER_FLOWS 里
         查出 flow_id、run_ts；
-      - 用 ExperimentLogger 把每次 test 写到：
+      - 用 get_run_context 把每次 test 写到：
           <run_id>/iperf/<flow_id>:server_<src_ip>_to_<my_ip>.log
     """
     global IPERF_SERVER_PROC, IPERF_SERVERS
@@ -331,7 +466,6 @@ def start_iperf3_server(my_ip, listen_port: int):
         )
         IPERF_SERVER_PROC = proc
         IPERF_SERVERS[listen_port] = proc
-        CHILD_PROCS.append(proc)
 
     def _pump_server_output(p: subprocess.Popen, my_ip: str, listen_port: int):
         current_seg_f = None
@@ -390,11 +524,7 @@ def start_iperf3_server(my_ip, listen_port: int):
                         flow_id, run_ts = flow_info
 
                 if flow_id is not None and run_ts is not None:
-                    exp_logger = ExperimentLogger(
-                        base_dir="/home/yc/sdn_qos/logs",
-                        run_id=run_ts,
-                    )
-                    server_log_path = exp_logger.iperf_server_log_path(
+                    server_log_path = get_run_context(BASE_LOG_DIR, run_ts).iperf_server_log_path(
                         flow_id=flow_id,
                         src_ip=src_ip,
                         dst_ip=dst_ip,
@@ -507,22 +637,9 @@ def start_flow_receiver(listen_ip: str, data_port: int,
 
 # --------- REST 辅助函数 ----------
 
-def post_json(url: str, payload: dict, timeout: float = 3.0) -> dict:
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        url,
-        data=data,
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
-    with urllib.request.urlopen(req, timeout=timeout) as resp:
-        body = resp.read().decode("utf-8")
-        if not body:
-            return {}
-        try:
-            return json.loads(body)
-        except Exception:
-            return {}
+def post_json(url: str, payload: dict, timeout: float = 3.0, **kw) -> dict:
+    """走进程内共享的 keep-alive 连接池（http_client），kw 透传 retries / idempotent"""
+    return default_client().post_json(url, payload, timeout=timeout, **kw)
 
 
 def register_host_rest(ctrl_ip: str, ctrl_rest_port: int,
@@ -532,10 +649,46 @@ def register_host_rest(ctrl_ip: str, ctrl_rest_port: int,
         "host_ip": my_ip,
         "permit_port": permit_port,
         "recv_port": recv_port,
+        # 发送端能否运行中改速率：控制器只给能改的 host 上的 flow 提速
+        "backend": TRAFFIC_BACKEND,
+        "rate_update": TRAFFIC_BACKEND == "engine",
     }
     logging.info(f"[agent] register_host_rest: {payload}")
     resp = post_json(url, payload)
     logging.info(f"[agent] register_host_rest resp: {resp}")
+    return resp
+
+
+def start_heartbeat(ctrl_ip: str, ctrl_rest_port: int,
+                    my_ip: str, permit_port: int, recv_port: int,
+                    interval: float = 2.0):
+    """
+    后台心跳线程：每 interval 秒 POST /scheduler/heartbeat，带上上一次心跳的 RTT。
+    控制器返回 registered=false（被判 dead 摘掉 / 控制器重启）时重新注册。
+    """
+    url = f"http://{ctrl_ip}:{ctrl_rest_port}/scheduler/heartbeat"
+
+    def _loop():
+        rtt_ms = None
+        while True:
+            payload = {"host_ip": my_ip}
+            if rtt_ms is not None:
+                payload["rtt_ms"] = round(rtt_ms, 3)
+            t0 = time.time()
+            try:
+                resp = post_json(url, payload, timeout=max(1.0, interval), retries=0)
+                rtt_ms = (time.time() - t0) * 1000.0
+                if resp.get("registered") is False:
+                    logger.warning("[agent] heartbeat: controller lost registration, re-register")
+                    register_host_rest(ctrl_ip, ctrl_rest_port, my_ip, permit_port, recv_port)
+            except Exception as e:
+                rtt_ms = None
+                logger.warning(f"[agent] heartbeat failed: {e}")
+            time.sleep(interval)
+
+    t = threading.Thread(target=_loop, daemon=True)
+    t.start()
+    return t
 
 
 def request_flow_rest(ctrl_ip: str, ctrl_rest_port: int,
@@ -559,43 +712,84 @@ def request_flow_rest(ctrl_ip: str, ctrl_rest_port: int,
     return resp
 
 
-def experiment_loop(ctrl_ip: str, ctrl_rest_port: int, my_ip: str, default_src_port: int, max_flows: int, max_interval: float, lambda_val: float):
+def request_flows_batch_rest(ctrl_ip: str, ctrl_rest_port: int, flows: list,
+                             timeout: float = 10.0) -> dict:
     """
-    启动一个随机实验，生成指数时间间隔的流量。
-    
+    一次请求多条业务流：flows 里每项字段同 request_flow_rest 的 payload。
+    返回 {"results": [...], "queued": n, "rejected": m}，results 和 flows 一一对应。
+    """
+    url = f"http://{ctrl_ip}:{ctrl_rest_port}/scheduler/request_batch"
+    resp = post_json(url, {"flows": flows}, timeout=timeout)
+    logging.info(f"[agent] request_flows_batch_rest: n={len(flows)} "
+                 f"queued={resp.get('queued')} rejected={resp.get('rejected')}")
+    return resp
+
+
+def experiment_loop(ctrl_ip: str, ctrl_rest_port: int, my_ip: str, default_src_port: int,
+                    max_flows: int, max_interval: float, lambda_val: float,
+                    cdf: str = "websearch", out_csv: Optional[str] = None) -> dict:
+    """
+    本机单 host 的随机实验：泊松到达（强度 lambda_val 个/秒，间隔不超过 max_interval），
+    流大小按经验分布 cdf 采样，开环发 /scheduler/request。多 host / 目标负载 / trace 回放用 workload.py。
+
     参数：
-    - max_flows: 最大生成的随机流量数目。
-    - max_interval: 流量之间的最大间隔。
-    - lambda_val: 指数分布的λ值。
+    - max_flows: 最多生成的流数目。
+    - max_interval: 两条流之间的最大间隔。
+    - lambda_val: 泊松到达强度。
     """
-    print("\n=== 开始实验 ===")
-    print(f"将生成最多 {max_flows} 个随机流量，并使用指数间隔。")
-    
+    rng = random.Random()
+    size_cdf = EmpiricalCDF.builtin(cdf)
+    schedule = []
+    t = 0.0
     for _ in range(max_flows):
-        # 随机生成流量参数
-        size_bytes = random.randint(1_000_000, 10_000_000)  # 随机流量大小（1MB 到 10MB）
-        rate_bps = random.randint(1_000_000, 10_000_000)  # 随机速率（1Mbps 到 10Mbps）
-        priority = random.choice([0, 1, 2])  # 随机优先级（0、1或2）
-        
-        # 使用指数分布生成流量间隔
-        interval = np.random.exponential(1 / lambda_val)
-        
-        # 发起流量请求
-        request_flow(ctrl_ip, ctrl_rest_port, my_ip, default_src_port, size_bytes, rate_bps, priority)
-        
-        # 记录实验详情
-        print(f"生成的流量：大小={size_bytes}字节，速率={rate_bps} bps，优先级={priority}，间隔={interval:.2f}秒")
-        
-        # 根据生成的间隔休眠
-        time.sleep(min(interval, max_interval))  # 不超过最大间隔
+        t += min(rng.expovariate(lambda_val), max_interval)
+        prio = rng.choice([0, 1, 2])
+        schedule.append((t, {
+            "size_bytes": size_cdf.sample(rng),
+            "request_rate_bps": rng.randint(1_000_000, 10_000_000),
+            "priority": prio,
+        }))
+
+    print("\n=== 开始实验 ===")
+    print(f"将生成 {max_flows} 条流，cdf={cdf} lambda={lambda_val}/s，预计 {t:.1f}s")
+
+    def _submit(spec: dict) -> dict:
+        return request_flow_rest(ctrl_ip, ctrl_rest_port, src_ip=my_ip,
+                                 src_port=default_src_port, **spec)
+
+    driver = OpenLoopDriver(_submit, workers=16)
+    driver.run(schedule)
+    if out_csv:
+        driver.write_csv(out_csv)
+    summary = driver.summary()
+    print(f"实验结束: {summary}")
+    print(f"REST 延迟: {default_client().stats()}")
+    return summary
+
+
+def prune_iperf3_servers():
+    """reaper 钩子：把已经退出的 iperf3 server 移出 IPERF_SERVERS"""
+    with IPERF_SERVERS_LOCK:
+        for port, p in list(IPERF_SERVERS.items()):
+            rc = p.poll()
+            if rc is not None:
+                logger.info(f"[agent] iperf3 server on {port} exited rc={rc}, pruned")
+                del IPERF_SERVERS[port]
+
 
 def cleanup():
     """
     杀掉当前 host_agent 启动的所有子进程（iperf3 server / client），
-    不影响别的 xterm / host，因为只操作 CHILD_PROCS 列表里的 Popen 对象。
+    不影响别的 xterm / host，因为只操作 FLOWS / IPERF_SERVERS 里的 Popen 对象。
     """
     logger.info("[agent] cleanup: terminating child processes...")
-    for p in CHILD_PROCS:
+    if SENDER_ENGINE is not None:
+        SENDER_ENGINE.shutdown()
+    if RECEIVER is not None:
+        RECEIVER.stop()
+    with IPERF_SERVERS_LOCK:
+        procs = FLOWS.procs() + list(IPERF_SERVERS.values())
+    for p in procs:
         if p.poll() is None:  # 还在跑
             try:
                 logger.info(f"[agent] terminate pid={p.pid}")
@@ -607,7 +801,7 @@ def cleanup():
     time.sleep(0.5)
 
     # 如果还有没退出的，强制 kill
-    for p in CHILD_PROCS:
+    for p in procs:
         if p.poll() is None:
             try:
                 logger.info(f"[agent] kill pid={p.pid}")
@@ -622,12 +816,18 @@ def cli_loop(ctrl_ip: str, ctrl_rest_port: int,
     """
     简单 CLI：
       flow <size_MB> <rate_Mbps> [priority]
+      flows
+      stop <flow_id>
+      exp <n_flows> <lambda> [cdf]
       quit / exit
     """
     print("\n=== host_agent CLI 已启动 ===")
     print("命令示例：")
     print("  flow 20 5 1    # 20MB, 5Mbps, priority=1")
     print("  flow 10 1      # 10MB, 1Mbps, priority 默认=1")
+    print("  flows          # 列出本机的 flow")
+    print("  stop 123       # 停掉本机上的 flow 123")
+    print("  exp 100 5      # 100 条流，泊松到达 5 条/秒，websearch 流大小分布")
     print("  quit           # 退出 CLI\n")
     
     while True:
@@ -677,12 +877,35 @@ def cli_loop(ctrl_ip: str, ctrl_rest_port: int,
 
             except KeyboardInterrupt:
                 # 用户在“发流过程中”按了 Ctrl+C
-                print("\n检测到 Ctrl+C，停止当前 iperf3 client，但保留 CLI")
-                stop_current_client()
+                n = FLOWS.stop_all(role="sender")
+                print(f"\n检测到 Ctrl+C，停止本机 {n} 条正在发的 flow，但保留 CLI")
                 # 不 raise，让 CLI 继续
                 continue
+        elif cmd == "flows":
+            rows = FLOWS.snapshot()
+            if not rows:
+                print("(没有 flow)")
+            for r in sorted(rows, key=lambda r: r["flow_id"]):
+                print(f"  {r['flow_id']:>8} {r['role']:8s} {r['backend']:6s} {r['state']:8s} "
+                      f"peer={r.get('peer')} rate={r.get('rate_bps')} rc={r['exit_code']}")
+        elif cmd == "stop":
+            if len(parts) != 2 or not parts[1].isdigit():
+                print("用法: stop <flow_id>")
+                continue
+            ok = FLOWS.stop(int(parts[1]))
+            print("已停止" if ok else "本机没有这条正在跑的 flow")
+        elif cmd == "exp":
+            try:
+                n_flows = int(parts[1])
+                lambda_val = float(parts[2])
+                cdf = parts[3] if len(parts) >= 4 else "websearch"
+                experiment_loop(ctrl_ip, ctrl_rest_port, my_ip, default_src_port,
+                                n_flows, max_interval=10.0, lambda_val=lambda_val, cdf=cdf,
+                                out_csv=f"exp_latency_{int(time.time())}.csv")
+            except (IndexError, ValueError) as e:
+                print(f"用法: exp <n_flows> <lambda> [websearch|datamining] ({e})")
         else:
-            print("未知命令，支持: flow / quit / exit")
+            print("未知命令，支持: flow / flows / stop / exp / quit / exit")
 
 
 # --------- 主程序入口 ----------
@@ -719,14 +942,20 @@ def main():
         f"my_ip={my_ip}, permit_port={permit_port}, recv_port={recv_port}"
     )
 
-    # 1. 起 PERMIT server（后台线程）
+    # 1. 起 PERMIT server（后台线程）+ flow 表回收线程
     start_permit_server(my_ip, permit_port)
+    FLOWS.start_reaper(hooks=[prune_iperf3_servers])
 
     # 2. （建议在另一个终端里自己起 iperf3 -s -u -p recv_port）
     #    例如： iperf3 -s -u -p 9000
     # start_iperf3_server(my_ip,recv_port)
     # 3. 向 Ryu 注册自己（登记 host_ip / permit_port / recv_port）
-    register_host_rest(ctrl_ip, ctrl_rest_port, my_ip, permit_port, recv_port)
+    resp = register_host_rest(ctrl_ip, ctrl_rest_port, my_ip, permit_port, recv_port)
+    # 心跳间隔以控制器下发的为准
+    start_heartbeat(ctrl_ip, ctrl_rest_port, my_ip, permit_port, recv_port,
+                    interval=float(resp.get("heartbeat_interval", 2.0)))
+    # 接收端收完一条 flow 就上报，控制器立刻释放规则和预留
+    start_host_reporter(ctrl_ip, ctrl_rest_port)
 
     # 4. 进入 CLI，由你手动触发业务流请求
     # cli_loop(ctrl_ip, ctrl_rest_port, my_ip, recv_port)
@@ -0,0 +1,276 @@
+# host_agent/http_client.py
+"""
+agent 到控制器 REST 的 HTTP 客户端：替代每次 urllib.urlopen 都新建一条 TCP 连接。
+
+- 每个 (host, port) 一个 keep-alive 连接池（http.client），并发数受 max_conns 限制，
+  超出的调用阻塞等连接，不会无限开连接打爆 wsgi server
+- 瞬时失败（连不上 / 复用的空闲连接被对端关了 / 502 503 504）按指数退避 + full jitter 重试；
+  请求可能已经到达控制器的失败（读响应超时等）只有 idempotent=True 时才重试，避免重复建流
+- 每个 path 一个对数分桶的延迟直方图，stats() 给出 count / mean / p50 / p99 / max，
+  负载生成模式（workload.py）用它看控制器各接口的延迟
+"""
+import http.client
+import json
+import logging
+import math
+import random
+import socket
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+logger = logging.getLogger("host_agent")
+
+
+class HttpError(Exception):
+    """控制器返回了非 2xx"""
+
+    def __init__(self, status: int, reason: str, body: str):
+        super().__init__(f"HTTP {status} {reason}: {body[:200]}")
+        self.status = status
+        self.reason = reason
+        self.body = body
+
+
+class LatencyHistogram:
+    """
+    对数分桶直方图：每个 2 的幂区间再分 SUB 个桶，相对误差约 1/SUB，
+    记录 O(1)、内存固定，适合高频调用。单位秒，桶从 1µs 起。
+    """
+
+    SUB = 8
+    BASE = 1e-6
+    N_BUCKETS = 30 * SUB          # 1µs .. ~1000s
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = [0] * self.N_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _index(self, v: float) -> int:
+        if v <= self.BASE:
+            return 0
+        i = int(math.log2(v / self.BASE) * self.SUB)
+        return min(i, self.N_BUCKETS - 1)
+
+    def _upper(self, i: int) -> float:
+        return self.BASE * 2 ** ((i + 1) / self.SUB)
+
+    def record(self, v: float):
+        i = self._index(v)
+        with self._lock:
+            self._counts[i] += 1
+            self.count += 1
+            self.total += v
+            if v > self.max:
+                self.max = v
+
+    def percentile(self, q: float) -> float:
+        """返回第 q 分位所在桶的上界"""
+        with self._lock:
+            if self.count == 0:
+                return 0.0
+            rank = max(1, int(math.ceil(q * self.count)))
+            acc = 0
+            for i, c in enumerate(self._counts):
+                acc += c
+                if acc >= rank:
+                    return min(self._upper(i), self.max)
+        return self.max
+
+    def snapshot(self) -> dict:
+        n = self.count
+        return {
+            "count": n,
+            "mean_ms": self.total / n * 1000.0 if n else 0.0,
+            "p50_ms": self.percentile(0.50) * 1000.0,
+            "p90_ms": self.percentile(0.90) * 1000.0,
+            "p99_ms": self.percentile(0.99) * 1000.0,
+            "max_ms": self.max * 1000.0,
+        }
+
+
+class _Pool:
+    """一个 (host, port) 的空闲连接栈 + 并发信号量"""
+
+    def __init__(self, host: str, port: int, max_conns: int):
+        self.host = host
+        self.port = port
+        self.sem = threading.BoundedSemaphore(max_conns)
+        self.lock = threading.Lock()
+        self.idle: List[http.client.HTTPConnection] = []
+
+    def get(self, timeout: float) -> Tuple[http.client.HTTPConnection, bool]:
+        """返回 (conn, reused)"""
+        with self.lock:
+            conn = self.idle.pop() if self.idle else None
+        if conn is not None:
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            return conn, True
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout), False
+
+    def put(self, conn: http.client.HTTPConnection):
+        with self.lock:
+            self.idle.append(conn)
+
+    def close(self):
+        with self.lock:
+            conns, self.idle = self.idle, []
+        for c in conns:
+            c.close()
+
+
+class HttpClient:
+    RETRY_STATUS = (502, 503, 504)
+
+    def __init__(self, max_conns: int = 8, timeout: float = 3.0,
+                 retries: int = 2, backoff: float = 0.05, backoff_max: float = 1.0):
+        self.max_conns = max_conns
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self._pools: Dict[Tuple[str, int], _Pool] = {}
+        self._hists: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+        self.retried = 0
+        self.failed = 0
+
+    def _pool(self, host: str, port: int) -> _Pool:
+        key = (host, port)
+        pool = self._pools.get(key)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.setdefault(key, _Pool(host, port, self.max_conns))
+        return pool
+
+    def histogram(self, path: str) -> LatencyHistogram:
+        h = self._hists.get(path)
+        if h is None:
+            with self._lock:
+                h = self._hists.setdefault(path, LatencyHistogram())
+        return h
+
+    def _sleep_backoff(self, attempt: int):
+        # full jitter：[0, min(max, base * 2^attempt)]
+        time.sleep(random.uniform(0, min(self.backoff_max, self.backoff * (2 ** attempt))))
+
+    def _once(self, pool: _Pool, method: str, path: str, body: Optional[bytes],
+              headers: dict, timeout: float) -> Tuple[int, str, bytes]:
+        """
+        在池里的一条连接上发一次请求。
+        连接级异常原样抛出，调用方按 (异常, 是否复用连接, 是否已发出) 决定能不能重试。
+        """
+        conn, reused = pool.get(timeout)
+        sent = False
+        try:
+            if conn.sock is None:
+                conn.connect()
+                # 小请求一来一回，关掉 Nagle 免得撞上对端 delayed ACK
+                conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn.request(method, path, body=body, headers=headers)
+            sent = True
+            resp = conn.getresponse()
+            data = resp.read()
+        except Exception as e:
+            conn.close()
+            e._reused, e._sent = reused, sent
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            pool.put(conn)
+        return resp.status, resp.reason, data
+
+    def request(self, method: str, url: str, body: Optional[bytes] = None,
+                headers: Optional[dict] = None, timeout: Optional[float] = None,
+                retries: Optional[int] = None, idempotent: bool = False) -> Tuple[int, bytes]:
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port or 80
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+        headers = dict(headers or {})
+        headers.setdefault("Connection", "keep-alive")
+
+        pool = self._pool(host, port)
+        hist = self.histogram(parts.path or "/")
+        attempt = 0
+        while True:
+            # 直方图只计拿到连接之后的时间，等连接的排队由调用方自己算
+            with pool.sem:
+                t0 = time.perf_counter()
+                try:
+                    status, reason, data = self._once(pool, method, path, body, headers, timeout)
+                    err = None
+                except (OSError, http.client.HTTPException) as e:
+                    err = e
+                hist.record(time.perf_counter() - t0)
+
+            if err is None:
+                if 200 <= status < 300:
+                    return status, data
+                retryable = status in self.RETRY_STATUS
+                err = HttpError(status, reason, data.decode("utf-8", "replace"))
+            else:
+                # 没发出去 / 复用的空闲连接被对端关掉：控制器肯定没处理过，可以放心重发
+                not_delivered = not getattr(err, "_sent", False) or (
+                    getattr(err, "_reused", False) and isinstance(
+                        err, (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)))
+                retryable = not_delivered or idempotent
+
+            if not retryable or attempt >= retries:
+                self.failed += 1
+                raise err
+            self.retried += 1
+            logger.debug(f"[http] {method} {url} retry {attempt + 1}/{retries}: {err}")
+            self._sleep_backoff(attempt)
+            attempt += 1
+
+    def post_json(self, url: str, payload: dict, timeout: Optional[float] = None,
+                  retries: Optional[int] = None, idempotent: bool = False) -> dict:
+        body = json.dumps(payload).encode("utf-8")
+        _status, data = self.request("POST", url, body=body,
+                                     headers={"Content-Type": "application/json"},
+                                     timeout=timeout, retries=retries, idempotent=idempotent)
+        if not data:
+            return {}
+        try:
+            return json.loads(data.decode("utf-8"))
+        except Exception:
+            return {}
+
+    def stats(self) -> dict:
+        """{path: {count, mean_ms, p50_ms, p90_ms, p99_ms, max_ms}}，外加 retried / failed"""
+        with self._lock:
+            hists = dict(self._hists)
+        out = {path: h.snapshot() for path, h in sorted(hists.items())}
+        out["_retried"] = self.retried
+        out["_failed"] = self.failed
+        return out
+
+    def close(self):
+        with self._lock:
+            pools = list(self._pools.values())
+        for p in pools:
+            p.close()
+
+
+_DEFAULT: Optional[HttpClient] = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def default_client() -> HttpClient:
+    """进程内共享的客户端（注册 / 心跳 / 请求 / 上报共用一组连接）"""
+    global _DEFAULT
+    if _DEFAULT is None:
+        with _DEFAULT_LOCK:
+            if _DEFAULT is None:
+                _DEFAULT = HttpClient()
+    return _DEFAULT
@@ -0,0 +1,308 @@
+# host_agent/traffic_engine.py
+"""
+进程内 UDP 发流引擎：替代每条 flow fork 一个 iperf3 -u client。
+
+- 每个 worker 线程用一个按 due 时间排序的小根堆复用多条 flow
+- 每条 flow 一个令牌桶，按 send_rate_bps 限速；一次唤醒最多连发 batch 个包
+- DSCP 通过 setsockopt(IP_TOS) 设置；发满 size_bytes 精确停止（最后一两个包截短）
+- 每个包开头是 24 字节头 !QQd = (flow_id, seq, send_ts)，接收端据此统计丢包 / 乱序 / 抖动
+"""
+import heapq
+import itertools
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger("host_agent")
+
+HEADER = struct.Struct("!QQd")
+HEADER_LEN = HEADER.size          # 24
+DEFAULT_PKT_SIZE = 1400           # UDP payload，留够 IP/UDP 头不超过 1500 MTU
+# 连续这么多次 send 报硬错误（每次间隔 1ms，约 1s）就判 flow 失败，不管之前有没有发出去过
+MAX_CONSEC_ERRORS = 1000
+
+
+class SendFlow:
+    """一条正在发的 flow：socket + 令牌桶 + 计数器"""
+
+    def __init__(self, flow_id: int, src_ip: str, src_port: int,
+                 dst_ip: str, dst_port: int, rate_bps: int, size_bytes: int,
+                 dscp: int = 0, pkt_size: int = DEFAULT_PKT_SIZE, batch: int = 16,
+                 on_done: Optional[Callable[["SendFlow"], None]] = None):
+        self.flow_id = flow_id
+        self.src_ip = src_ip
+        self.src_port = src_port
+        self.dst_ip = dst_ip
+        self.dst_port = dst_port
+        self.rate_bps = rate_bps
+        # 至少能放下一个包头
+        self.size_bytes = max(int(size_bytes), HEADER_LEN)
+        self.dscp = dscp
+        self.pkt_size = max(int(pkt_size), HEADER_LEN)
+        self.on_done = on_done
+
+        # 计数器
+        self.sent_bytes = 0
+        self.sent_pkts = 0
+        self.send_errors = 0
+        self._consec_errors = 0   # 连续硬错误次数，成功发出一个包清零
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.stopped = False      # 外部要求提前停
+        self.error: Optional[str] = None
+
+        # 令牌桶（单位：字节）；初始给一个包，第一包立即发出
+        self._Bps = rate_bps / 8.0
+        self._burst = float(max(batch, 1) * self.pkt_size)
+        self._tokens = float(self.pkt_size)
+        self._last = 0.0
+        self._seq = 0
+        self._gen = 0             # worker 堆里只认 gen 相同的条目，改速率 / stop 时重新排队
+        self._buf = bytearray(self.pkt_size)
+        self._view = memoryview(self._buf)
+        self.sock: Optional[socket.socket] = None
+
+    def set_rate(self, rate_bps: int):
+        """RATE_UPDATE：改令牌桶速率，已攒的令牌保留，不重建 socket"""
+        self.rate_bps = rate_bps
+        self._Bps = rate_bps / 8.0
+
+    # ---------------- socket ----------------
+
+    def open(self):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, (self.dscp & 0x3F) << 2)
+            # 绑定控制器分配的 src_port，流表按五元组匹配
+            s.bind((self.src_ip or "", self.src_port or 0))
+            s.connect((self.dst_ip, self.dst_port))
+            s.setblocking(False)
+        except OSError:
+            s.close()
+            raise
+        self.sock = s
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    # ---------------- 发送 ----------------
+
+    def _next_size(self) -> int:
+        """下一个包的大小：保证最后一个包也能放下包头，且总字节数正好是 size_bytes"""
+        remaining = self.size_bytes - self.sent_bytes
+        if remaining <= self.pkt_size:
+            return remaining
+        if remaining - self.pkt_size < HEADER_LEN:
+            return remaining - HEADER_LEN
+        return self.pkt_size
+
+    def pump(self, now: float, batch: int) -> Optional[float]:
+        """
+        补令牌后最多发 batch 个包，返回下次该唤醒的 monotonic 时间；
+        发完 / 被 stop 返回 None。
+        """
+        if self.stopped or self.sock is None:
+            return None
+        if self.started_at is None:
+            self.started_at = time.time()
+            self._last = now
+        self._tokens = min(self._burst, self._tokens + (now - self._last) * self._Bps)
+        self._last = now
+
+        sock_send = self.sock.send
+        view = self._view
+        pack_into = HEADER.pack_into
+        for _ in range(batch):
+            if self.sent_bytes >= self.size_bytes:
+                break
+            size = self._next_size()
+            if self._tokens < size:
+                break
+            pack_into(self._buf, 0, self.flow_id, self._seq, time.time())
+            try:
+                sock_send(view[:size])
+            except (BlockingIOError, InterruptedError):
+                # 发送缓冲满，稍后再试
+                self.send_errors += 1
+                return now + 0.001
+            except OSError as e:
+                # ENOBUFS / ECONNREFUSED(对端 ICMP 不可达) 之类：偶发的计数后继续，
+                # 接收端消失后这类错误会一直出现，连续超过上限就判失败，不再每 1ms 重试同一个包
+                self.send_errors += 1
+                self._consec_errors += 1
+                if self._consec_errors >= MAX_CONSEC_ERRORS:
+                    self.error = f"{e} ({self._consec_errors} consecutive send errors)"
+                    return None
+                return now + 0.001
+            self._consec_errors = 0
+            self._tokens -= size
+            self.sent_bytes += size
+            self.sent_pkts += 1
+            self._seq += 1
+
+        if self.sent_bytes >= self.size_bytes:
+            return None
+        deficit = self._next_size() - self._tokens
+        return now + (deficit / self._Bps if deficit > 0 else 0.0)
+
+    def stats(self) -> dict:
+        end = self.finished_at or time.time()
+        dur = (end - self.started_at) if self.started_at else 0.0
+        return {
+            "flow_id": self.flow_id,
+            "src_ip": self.src_ip, "src_port": self.src_port,
+            "dst_ip": self.dst_ip, "dst_port": self.dst_port,
+            "rate_bps": self.rate_bps,
+            "size_bytes": self.size_bytes,
+            "sent_bytes": self.sent_bytes,
+            "sent_pkts": self.sent_pkts,
+            "send_errors": self.send_errors,
+            "duration_s": dur,
+            "achieved_bps": self.sent_bytes * 8 / dur if dur > 0 else 0.0,
+            "stopped": self.stopped,
+            "error": self.error,
+        }
+
+
+class _Worker(threading.Thread):
+    """一个 worker 复用多条 flow：堆里放 (due, seq, gen, flow)，到点就 pump；gen 过期的条目直接丢"""
+
+    def __init__(self, engine: "SenderEngine", idx: int):
+        super().__init__(name=f"sender-{idx}", daemon=True)
+        self.engine = engine
+        self._heap = []
+        self._cv = threading.Condition()
+        self._seq = itertools.count()
+
+    def add(self, flow: SendFlow):
+        with self._cv:
+            heapq.heappush(self._heap, (time.monotonic(), next(self._seq), flow._gen, flow))
+            self._cv.notify()
+
+    def reschedule(self, flow: SendFlow):
+        """速率变了 / 要停：旧条目作废，立刻 pump 一次重新算 due"""
+        with self._cv:
+            flow._gen += 1
+            heapq.heappush(self._heap, (time.monotonic(), next(self._seq), flow._gen, flow))
+            self._cv.notify()
+
+    def wake(self):
+        with self._cv:
+            self._cv.notify()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def run(self):
+        heap = self._heap
+        cv = self._cv
+        batch = self.engine.batch
+        while not self.engine._stopped:
+            with cv:
+                if not heap:
+                    cv.wait(0.5)
+                    continue
+                due, _, gen, flow = heap[0]
+                if gen != flow._gen:
+                    heapq.heappop(heap)
+                    continue
+                delay = due - time.monotonic()
+                if delay > 0:
+                    cv.wait(delay)
+                    continue
+                heapq.heappop(heap)
+
+            nxt = flow.pump(time.monotonic(), batch)
+            if nxt is None:
+                self.engine._finish(flow)
+            else:
+                with cv:
+                    if gen == flow._gen:
+                        heapq.heappush(heap, (nxt, next(self._seq), gen, flow))
+
+
+class SenderEngine:
+    """
+    发流引擎：n_workers 个 worker（默认每核一个），flow 按 flow_id 取模分到 worker。
+    submit() 开一个 UDP socket 交给 worker，发完后调用 on_done(flow) 并关闭 socket。
+    """
+
+    def __init__(self, n_workers: Optional[int] = None,
+                 pkt_size: int = DEFAULT_PKT_SIZE, batch: int = 16):
+        self.n_workers = max(1, n_workers or os.cpu_count() or 1)
+        self.pkt_size = pkt_size
+        self.batch = batch
+        self._stopped = False
+        self._lock = threading.Lock()
+        self._flows: Dict[int, SendFlow] = {}
+        self._workers = [_Worker(self, i) for i in range(self.n_workers)]
+        for w in self._workers:
+            w.start()
+        logger.info(f"[engine] sender started: workers={self.n_workers} "
+                    f"pkt_size={pkt_size} batch={batch}")
+
+    def submit(self, flow_id: int, src_ip: str, src_port: int,
+               dst_ip: str, dst_port: int, rate_bps: int, size_bytes: int,
+               dscp: int = 0, on_done: Optional[Callable[[SendFlow], None]] = None) -> SendFlow:
+        flow = SendFlow(flow_id, src_ip, src_port, dst_ip, dst_port, rate_bps, size_bytes,
+                        dscp=dscp, pkt_size=self.pkt_size, batch=self.batch, on_done=on_done)
+        flow.open()
+        with self._lock:
+            self._flows[flow_id] = flow
+        self._workers[flow_id % self.n_workers].add(flow)
+        return flow
+
+    def stop_flow(self, flow_id: int) -> bool:
+        with self._lock:
+            flow = self._flows.get(flow_id)
+        if flow is None:
+            return False
+        flow.stopped = True
+        self._workers[flow_id % self.n_workers].reschedule(flow)
+        return True
+
+    def set_rate(self, flow_id: int, rate_bps: int) -> bool:
+        with self._lock:
+            flow = self._flows.get(flow_id)
+        if flow is None or rate_bps <= 0:
+            return False
+        flow.set_rate(rate_bps)
+        self._workers[flow_id % self.n_workers].reschedule(flow)
+        return True
+
+    def get(self, flow_id: int) -> Optional[SendFlow]:
+        return self._flows.get(flow_id)
+
+    def active(self) -> int:
+        return len(self._flows)
+
+    def _finish(self, flow: SendFlow):
+        # 重新排队留下的旧条目可能让同一条 flow 收尾两次
+        if flow.finished_at is not None:
+            return
+        flow.finished_at = time.time()
+        flow.close()
+        with self._lock:
+            self._flows.pop(flow.flow_id, None)
+        if flow.on_done is not None:
+            try:
+                flow.on_done(flow)
+            except Exception:
+                logger.exception(f"[engine] on_done failed for flow_id={flow.flow_id}")
+
+    def shutdown(self):
+        self._stopped = True
+        for w in self._workers:
+            w.wake()
+        with self._lock:
+            flows = list(self._flows.values())
+            self._flows.clear()
+        for flow in flows:
+            flow.close()
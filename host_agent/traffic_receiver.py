@@ -0,0 +1,305 @@
+# host_agent/traffic_receiver.py
+"""
+进程内多流 UDP 接收端：替代每个目的端口一个 iperf3 server + 解析 stdout。
+
+- 一个线程 + selectors 监听本机所有数据端口，可读时用 recvfrom_into
+  读进预分配的缓冲区，每次最多连读 batch 个包
+- FLOW_PREPARE 登记 4-tuple (dst_ip, dst_port, src_ip, src_port) -> flow_id，
+  收到的包按 4-tuple 记账：字节 / 包数 / 丢包 / 乱序 / 抖动（RFC 3550）
+- 收满 size_bytes，或收到过包后 idle_timeout 秒没新包，判定完成并回调 on_complete(stats)
+- 每个数据端口按登记的 flow 数引用计数，最后一条 flow 完成 / 超时 / 被 STOP 时关掉 socket
+"""
+import logging
+import selectors
+import socket
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from traffic_engine import HEADER, HEADER_LEN
+
+logger = logging.getLogger("host_agent")
+
+FlowKey = Tuple[str, int, str, int]   # (dst_ip, dst_port, src_ip, src_port)
+
+
+class RecvFlow:
+    """一条 flow 在接收端的统计"""
+
+    __slots__ = ("key", "flow_id", "run_ts", "size_bytes", "prepared_at",
+                 "first_ts", "last_ts", "bytes", "pkts", "max_seq",
+                 "reordered", "duplicates", "jitter", "_transit", "_seen")
+
+    def __init__(self, key: FlowKey, flow_id: int, run_ts, size_bytes: int):
+        self.key = key
+        self.flow_id = flow_id
+        self.run_ts = run_ts
+        self.size_bytes = size_bytes
+        self.prepared_at = time.time()
+        self.first_ts: Optional[float] = None
+        self.last_ts: Optional[float] = None
+        self.bytes = 0
+        self.pkts = 0
+        self.max_seq = -1
+        self.reordered = 0
+        self.duplicates = 0
+        self.jitter = 0.0           # 秒
+        self._transit: Optional[float] = None
+        # 已收到的 seq 位图（按需扩展），用于去重和算丢包
+        self._seen = bytearray()
+
+    def on_packet(self, nbytes: int, seq: int, send_ts: float, now: float):
+        seen = self._seen
+        byte_i = seq >> 3
+        if byte_i >= len(seen):
+            seen.extend(bytes(max(byte_i + 1 - len(seen), len(seen))))
+        bit = 1 << (seq & 7)
+        if seen[byte_i] & bit:
+            self.duplicates += 1
+            return
+        seen[byte_i] |= bit
+
+        if self.first_ts is None:
+            self.first_ts = now
+        self.last_ts = now
+        self.bytes += nbytes
+        self.pkts += 1
+        if seq < self.max_seq:
+            self.reordered += 1
+        else:
+            self.max_seq = seq
+
+        # RFC 3550 到达间隔抖动：J += (|D| - J) / 16，收发时钟偏差在差分里抵消
+        transit = now - send_ts
+        if self._transit is not None:
+            d = abs(transit - self._transit)
+            self.jitter += (d - self.jitter) / 16.0
+        self._transit = transit
+
+    @property
+    def lost(self) -> int:
+        return max(0, self.max_seq + 1 - self.pkts)
+
+    def stats(self) -> dict:
+        dst_ip, dst_port, src_ip, src_port = self.key
+        dur = (self.last_ts - self.first_ts) if self.first_ts is not None else 0.0
+        expected = self.max_seq + 1
+        return {
+            "flow_id": self.flow_id,
+            "run_ts": self.run_ts,
+            "src_ip": src_ip, "src_port": src_port,
+            "dst_ip": dst_ip, "dst_port": dst_port,
+            "size_bytes": self.size_bytes,
+            "bytes_received": self.bytes,
+            "pkts": self.pkts,
+            "lost": self.lost,
+            "loss_rate": self.lost / expected if expected > 0 else 0.0,
+            "reordered": self.reordered,
+            "duplicates": self.duplicates,
+            "jitter_ms": self.jitter * 1000.0,
+            "first_ts": self.first_ts,
+            "last_ts": self.last_ts,
+            "duration_s": dur,
+            "goodput_bps": self.bytes * 8 / dur if dur > 0 else 0.0,
+            "complete": self.bytes >= self.size_bytes > 0,
+        }
+
+
+class TrafficReceiver(threading.Thread):
+    """
+    单线程接收所有数据端口。expect() / drop() 可在任意线程调用，
+    真正的 socket 注册 / 注销在接收线程里做（通过 socketpair 唤醒 select）。
+    """
+
+    def __init__(self, listen_ip: str, on_complete: Callable[[dict], None],
+                 idle_timeout: float = 2.0, prepare_timeout: float = 120.0,
+                 batch: int = 64, buf_size: int = 65536,
+                 on_expire: Optional[Callable[[dict], None]] = None):
+        super().__init__(name="traffic-receiver", daemon=True)
+        self.listen_ip = listen_ip
+        self.on_complete = on_complete
+        self.on_expire = on_expire
+        self.idle_timeout = idle_timeout
+        self.prepare_timeout = prepare_timeout
+        self.batch = batch
+
+        self._buf = bytearray(buf_size)
+        self._view = memoryview(self._buf)
+        self._sel = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._flows: Dict[FlowKey, RecvFlow] = {}
+        self._socks: Dict[int, socket.socket] = {}      # port -> socket
+        self._port_refs: Dict[int, int] = {}            # port -> 登记在这个端口上的 flow 数
+        self._pending_ports = []
+        self._closing_ports = []
+        self.unknown_pkts = 0
+        self._stopped = False
+
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._sel.register(self._wake_r, selectors.EVENT_READ, None)
+
+    # ---------------- 外部接口 ----------------
+
+    def expect(self, key: FlowKey, flow_id: int, run_ts=None, size_bytes: int = 0):
+        """FLOW_PREPARE：登记 4-tuple，并确保 dst_port 在监听"""
+        port = key[1]
+        with self._lock:
+            if key not in self._flows:
+                refs = self._port_refs.get(port, 0) + 1
+                self._port_refs[port] = refs
+                need_open = (refs == 1 and port not in self._socks
+                             and port not in self._pending_ports)
+                if need_open:
+                    self._pending_ports.append(port)
+            else:
+                need_open = False
+            self._flows[key] = RecvFlow(key, flow_id, run_ts, size_bytes)
+        if need_open:
+            self._wake()
+
+    def drop(self, key: FlowKey) -> Optional[dict]:
+        """STOP：不再统计这条 flow，返回截至目前的统计"""
+        with self._lock:
+            flow = self._flows.pop(key, None)
+            closing = flow is not None and self._unref_port(key[1])
+        if closing:
+            self._wake()
+        return flow.stats() if flow is not None else None
+
+    @property
+    def open_ports(self) -> int:
+        return len(self._socks)
+
+    def _unref_port(self, port: int) -> bool:
+        """持锁调用：端口上少了一条 flow，降到 0 时排进待关闭列表，返回是否需要唤醒接收线程"""
+        refs = self._port_refs.get(port, 0) - 1
+        if refs > 0:
+            self._port_refs[port] = refs
+            return False
+        self._port_refs.pop(port, None)
+        self._closing_ports.append(port)
+        return True
+
+    def stop(self):
+        self._stopped = True
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b"\0")
+        except OSError:
+            pass
+
+    # ---------------- 接收线程 ----------------
+
+    def _open_pending(self):
+        with self._lock:
+            ports, self._pending_ports = self._pending_ports, []
+            closing, self._closing_ports = self._closing_ports, []
+            # 关闭前又有新 flow 登记的端口继续用；打开前就没 flow 了的端口不用开
+            closing = [p for p in closing if p not in self._port_refs]
+            ports = [p for p in ports if p in self._port_refs]
+        for port in closing:
+            s = self._socks.pop(port, None)
+            if s is None:
+                continue
+            self._sel.unregister(s)
+            s.close()
+            logger.info(f"[receiver] closed {self.listen_ip}:{port}")
+        for port in ports:
+            if port in self._socks:
+                continue
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+                s.bind((self.listen_ip, port))
+                s.setblocking(False)
+            except OSError as e:
+                s.close()
+                logger.error(f"[receiver] bind {self.listen_ip}:{port} failed: {e}")
+                continue
+            self._socks[port] = s
+            self._sel.register(s, selectors.EVENT_READ, port)
+            logger.info(f"[receiver] listening on {self.listen_ip}:{port}")
+
+    def _drain(self, sock: socket.socket, port: int):
+        buf = self._buf
+        view = self._view
+        flows = self._flows
+        unpack_from = HEADER.unpack_from
+        now = time.time()
+        for _ in range(self.batch):
+            try:
+                n, (src_ip, src_port) = sock.recvfrom_into(view)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            flow = flows.get((self.listen_ip, port, src_ip, src_port))
+            if flow is None or n < HEADER_LEN:
+                self.unknown_pkts += 1
+                continue
+            _fid, seq, send_ts = unpack_from(buf, 0)
+            flow.on_packet(n, seq, send_ts, now)
+            if flow.bytes >= flow.size_bytes > 0:
+                self._complete(flow)
+
+    def _complete(self, flow: RecvFlow):
+        with self._lock:
+            if self._flows.get(flow.key) is not flow:
+                return
+            del self._flows[flow.key]
+            self._unref_port(flow.key[1])
+        try:
+            self.on_complete(flow.stats())
+        except Exception:
+            logger.exception(f"[receiver] on_complete failed for flow_id={flow.flow_id}")
+
+    def _sweep(self, now: float):
+        """收过包但 idle_timeout 没新包 -> 按部分完成上报；一直没包的超过 prepare_timeout 丢掉"""
+        done = []
+        expired = []
+        with self._lock:
+            for flow in self._flows.values():
+                if flow.last_ts is not None:
+                    if now - flow.last_ts >= self.idle_timeout:
+                        done.append(flow)
+                elif now - flow.prepared_at >= self.prepare_timeout:
+                    expired.append(flow)
+            for flow in expired:
+                del self._flows[flow.key]
+                self._unref_port(flow.key[1])
+        for flow in expired:
+            logger.warning(f"[receiver] flow_id={flow.flow_id} key={flow.key} "
+                           f"no packets in {self.prepare_timeout:.0f}s, dropped")
+            if self.on_expire is not None:
+                self.on_expire(flow.stats())
+        for flow in done:
+            self._complete(flow)
+        if self._closing_ports:
+            self._open_pending()
+
+    def run(self):
+        next_sweep = time.time() + 0.5
+        while not self._stopped:
+            for key, _mask in self._sel.select(timeout=0.5):
+                if key.data is None:
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except (BlockingIOError, InterruptedError):
+                        pass
+                    self._open_pending()
+                else:
+                    self._drain(key.fileobj, key.data)
+            now = time.time()
+            if now >= next_sweep:
+                self._sweep(now)
+                next_sweep = now + 0.5
+
+        for s in self._socks.values():
+            self._sel.unregister(s)
+            s.close()
+        self._socks.clear()
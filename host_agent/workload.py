@@ -0,0 +1,365 @@
+# host_agent/workload.py
+"""
+负载生成器：按经验流大小分布 / 到达过程 / 目标负载生成 flow 请求，开环地打到控制器。
+
+- EmpiricalCDF   : 经验流大小分布（内置 web search / data mining，也可从文件读）
+- PoissonArrivals / BurstyArrivals : 到达过程（每个 host 独立一条）
+- build_schedule : 按目标 offered load 和 class mix 给多个 host 生成 (t, spec) 时间表
+- load_trace     : 回放记录下来的 trace（csv / jsonl）
+- OpenLoopDriver : 一个调度线程按绝对时间点派发，线程池并发发 REST，
+                   每个请求记录计划时间 / 实际发出时间 / 服务时间 / 总延迟，写 CSV
+
+延迟从计划发出时间算起（包括线程池排队），控制器变慢时不会因为少发请求而低估延迟。
+
+用法：
+    python workload.py --ctrl 172.17.0.1:8080 --hosts 10.0.0.1,10.0.0.2,10.0.0.3 \\
+        --cdf websearch --load 0.5 --link-bps 100e6 --duration 60 --out latency.csv
+    python workload.py --ctrl 172.17.0.1:8080 --trace trace.csv --out latency.csv
+"""
+import argparse
+import bisect
+import csv
+import heapq
+import json
+import logging
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from http_client import HttpClient, default_client
+
+logger = logging.getLogger("host_agent")
+
+MSS = 1460
+
+# pFabric / DCTCP 论文公开的 CDF，大小单位是 MSS 个数
+WEB_SEARCH_CDF = [
+    (6, 0.0), (6, 0.15), (13, 0.2), (19, 0.3), (33, 0.4), (53, 0.53),
+    (133, 0.6), (667, 0.7), (1333, 0.8), (3333, 0.9), (6667, 0.97), (20000, 1.0),
+]
+DATA_MINING_CDF = [
+    (1, 0.0), (1, 0.5), (2, 0.6), (3, 0.7), (7, 0.8), (267, 0.9),
+    (2107, 0.95), (66667, 0.99), (666667, 1.0),
+]
+
+
+class EmpiricalCDF:
+    """分段线性的经验分布，逆变换采样；points 为 [(size_bytes, cdf), ...]，cdf 单调到 1"""
+
+    BUILTIN = {"websearch": WEB_SEARCH_CDF, "datamining": DATA_MINING_CDF}
+
+    def __init__(self, points: Sequence[Tuple[float, float]], min_bytes: int = 1):
+        # 按 (cdf, size) 排序，同一 cdf 值的多个点（阶跃）保持 size 递增
+        pts = sorted((float(c), float(s)) for s, c in points)
+        if not pts or abs(pts[-1][0] - 1.0) > 1e-6:
+            raise ValueError("cdf must end at 1.0")
+        self._cdf = [c for c, _ in pts]
+        self._size = [s for _, s in pts]
+        self.min_bytes = min_bytes
+
+    @classmethod
+    def builtin(cls, name: str, unit: int = MSS) -> "EmpiricalCDF":
+        try:
+            pts = cls.BUILTIN[name]
+        except KeyError:
+            raise ValueError(f"unknown cdf {name}, choose from {sorted(cls.BUILTIN)}")
+        return cls([(s * unit, c) for s, c in pts])
+
+    @classmethod
+    def from_file(cls, path: str, unit: int = 1) -> "EmpiricalCDF":
+        """每行 '<size> <cdf>'，# 开头为注释；size 乘以 unit 换算成字节"""
+        pts = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                s, c = line.split()[:2]
+                pts.append((float(s) * unit, float(c)))
+        return cls(pts)
+
+    def sample(self, rng: random.Random) -> int:
+        u = rng.random()
+        i = bisect.bisect_left(self._cdf, u)
+        if i <= 0:
+            return max(self.min_bytes, int(self._size[0]))
+        c0, c1 = self._cdf[i - 1], self._cdf[i]
+        s0, s1 = self._size[i - 1], self._size[i]
+        size = s1 if c1 == c0 else s0 + (s1 - s0) * (u - c0) / (c1 - c0)
+        return max(self.min_bytes, int(size))
+
+    def mean(self) -> float:
+        """分段线性下的期望"""
+        m = self._cdf[0] * self._size[0]
+        for i in range(1, len(self._cdf)):
+            m += (self._cdf[i] - self._cdf[i - 1]) * (self._size[i] + self._size[i - 1]) / 2.0
+        return m
+
+
+# ---------------- 到达过程 ----------------
+
+class PoissonArrivals:
+    """强度 rate（个/秒）的泊松过程"""
+
+    def __init__(self, rate: float, rng: random.Random):
+        self.rate = rate
+        self.rng = rng
+
+    def __iter__(self) -> Iterator[float]:
+        t = 0.0
+        while True:
+            t += self.rng.expovariate(self.rate)
+            yield t
+
+
+class BurstyArrivals:
+    """
+    批量泊松：突发按泊松到达，每个突发含几何分布个请求（均值 burst_mean），
+    突发内部间隔 intra_gap 秒；长期平均强度仍是 rate。
+    """
+
+    def __init__(self, rate: float, rng: random.Random,
+                 burst_mean: float = 8.0, intra_gap: float = 0.0005):
+        self.rate = rate
+        self.rng = rng
+        self.burst_mean = max(1.0, burst_mean)
+        self.intra_gap = intra_gap
+
+    def __iter__(self) -> Iterator[float]:
+        t = 0.0
+        p = 1.0 / self.burst_mean
+        burst_rate = self.rate / self.burst_mean
+        while True:
+            t += self.rng.expovariate(burst_rate)
+            n = 1
+            while self.rng.random() > p:
+                n += 1
+            for k in range(n):
+                yield t + k * self.intra_gap
+
+
+ARRIVALS = {"poisson": PoissonArrivals, "bursty": BurstyArrivals}
+
+
+# ---------------- 时间表 ----------------
+
+def parse_mix_raw(text: str) -> Dict[int, float]:
+    """'0:5e6,1:10e6' -> {0: 5e6, 1: 10e6}，不归一化"""
+    return {int(k): float(v) for k, v in (part.split(":") for part in text.split(","))}
+
+
+def parse_mix(text: str) -> Dict[int, float]:
+    """'0:0.5,1:0.3,2:0.2' -> {0: 0.5, 1: 0.3, 2: 0.2}，权重归一化"""
+    mix = parse_mix_raw(text)
+    total = sum(mix.values())
+    return {k: v / total for k, v in mix.items()}
+
+
+def build_schedule(hosts: Sequence[str], cdf: EmpiricalCDF, load: float, link_bps: float,
+                   duration: float, class_mix: Dict[int, float],
+                   class_rate_bps: Dict[int, int], arrival: str = "poisson",
+                   seed: int = 1, **arrival_kw) -> List[Tuple[float, dict]]:
+    """
+    每个 host 的请求强度 λ = load * link_bps / (8 * E[size])，
+    即每个 host 的 offered load 是其接入链路容量的 load 倍。
+    返回按时间排序的 [(t, spec)]，spec 是 /scheduler/request 的 payload。
+    """
+    rng = random.Random(seed)
+    lam = load * link_bps / (8.0 * cdf.mean())
+    classes = sorted(class_mix)
+    weights = [class_mix[c] for c in classes]
+
+    def _host_stream(src_ip: str, host_rng: random.Random):
+        for t in ARRIVALS[arrival](lam, host_rng, **arrival_kw):
+            if t >= duration:
+                return
+            prio = host_rng.choices(classes, weights)[0]
+            yield t, {
+                "src_ip": src_ip,
+                "size_bytes": cdf.sample(host_rng),
+                "request_rate_bps": class_rate_bps.get(prio, 10_000_000),
+                "priority": prio,
+            }
+
+    streams = [_host_stream(h, random.Random(rng.random())) for h in hosts]
+    return list(heapq.merge(*streams, key=lambda x: x[0]))
+
+
+def load_trace(path: str) -> List[Tuple[float, dict]]:
+    """
+    回放 trace：csv（表头含 t,src_ip,size_bytes,priority[,request_rate_bps,dst_ip]）
+    或 jsonl（每行 {"t": ..., 其余字段同 /scheduler/request}）。t 是相对开始的秒数。
+    """
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    rec = json.loads(line)
+                    items.append((float(rec.pop("t")), rec))
+        else:
+            for row in csv.DictReader(f):
+                spec = {
+                    "src_ip": row["src_ip"],
+                    "size_bytes": int(float(row["size_bytes"])),
+                    "priority": int(row.get("priority") or 0),
+                }
+                if row.get("request_rate_bps"):
+                    spec["request_rate_bps"] = int(float(row["request_rate_bps"]))
+                if row.get("dst_ip"):
+                    spec["dst_ip"] = row["dst_ip"]
+                items.append((float(row["t"]), spec))
+    items.sort(key=lambda x: x[0])
+    return items
+
+
+# ---------------- 开环派发 ----------------
+
+class OpenLoopDriver:
+    """
+    按时间表开环派发：调度线程 sleep 到离计划时间 spin_s 秒内再忙等，准点把请求交给线程池；
+    submit(spec) -> dict 由调用方提供（一般是 POST /scheduler/request）。
+    """
+
+    CSV_FIELDS = ["seq", "sched_t", "sent_t", "done_t", "lateness_ms", "service_ms",
+                  "latency_ms", "src_ip", "size_bytes", "priority", "flow_id", "status", "error"]
+
+    def __init__(self, submit: Callable[[dict], dict], workers: int = 64, spin_s: float = 0.002):
+        self.submit = submit
+        self.workers = workers
+        self.spin_s = spin_s
+        self.records: List[dict] = []
+        self._lock = threading.Lock()
+
+    def _one(self, seq: int, sched_abs: float, t0: float, spec: dict):
+        sent = time.perf_counter()
+        rec = {"seq": seq, "sched_t": sched_abs - t0, "sent_t": sent - t0,
+               "src_ip": spec.get("src_ip"), "size_bytes": spec.get("size_bytes"),
+               "priority": spec.get("priority"), "flow_id": None, "status": None, "error": None}
+        try:
+            resp = self.submit(spec)
+            rec["flow_id"] = resp.get("flow_id")
+            rec["status"] = resp.get("status")
+            rec["error"] = resp.get("error")
+        except Exception as e:
+            rec["error"] = str(e)
+        done = time.perf_counter()
+        rec["done_t"] = done - t0
+        rec["lateness_ms"] = (sent - sched_abs) * 1000.0
+        rec["service_ms"] = (done - sent) * 1000.0
+        rec["latency_ms"] = (done - sched_abs) * 1000.0
+        with self._lock:
+            self.records.append(rec)
+
+    def run(self, schedule: Sequence[Tuple[float, dict]]) -> List[dict]:
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="workload")
+        t0 = time.perf_counter() + 0.1
+        for seq, (t, spec) in enumerate(schedule):
+            target = t0 + t
+            while True:
+                remaining = target - time.perf_counter()
+                if remaining <= 0:
+                    break
+                if remaining > self.spin_s:
+                    time.sleep(remaining - self.spin_s)
+            pool.submit(self._one, seq, target, t0, spec)
+        pool.shutdown(wait=True)
+        self.records.sort(key=lambda r: r["seq"])
+        return self.records
+
+    def write_csv(self, path: str):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=self.CSV_FIELDS)
+            w.writeheader()
+            w.writerows(self.records)
+
+    def summary(self) -> dict:
+        recs = self.records
+        if not recs:
+            return {"n": 0}
+        lat = sorted(r["latency_ms"] for r in recs)
+        late = sorted(r["lateness_ms"] for r in recs)
+
+        def pct(xs, q):
+            return xs[min(len(xs) - 1, int(math.ceil(q * len(xs))) - 1)]
+
+        span = max(r["sched_t"] for r in recs) or 1.0
+        return {
+            "n": len(recs),
+            "errors": sum(1 for r in recs if r["error"]),
+            "offered_rps": len(recs) / span,
+            "offered_bps": sum(r["size_bytes"] or 0 for r in recs) * 8 / span,
+            "latency_p50_ms": pct(lat, 0.50),
+            "latency_p99_ms": pct(lat, 0.99),
+            "latency_max_ms": lat[-1],
+            "lateness_p99_ms": pct(late, 0.99),
+        }
+
+
+def rest_submitter(ctrl_ip: str, ctrl_rest_port: int,
+                   client: Optional[HttpClient] = None) -> Callable[[dict], dict]:
+    """POST /scheduler/request；建流请求不幂等，只重试确定没送达的失败"""
+    client = client or default_client()
+    url = f"http://{ctrl_ip}:{ctrl_rest_port}/scheduler/request"
+    return lambda spec: client.post_json(url, spec)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="flow 请求负载生成器")
+    parser.add_argument("--ctrl", required=True, help="控制器 REST 地址 ip:port")
+    parser.add_argument("--hosts", default="", help="发起请求的 src host，逗号分隔")
+    parser.add_argument("--trace", default=None, help="回放 trace（csv / jsonl），给了就忽略分布参数")
+    parser.add_argument("--cdf", default="websearch",
+                        help="websearch | datamining | 文件路径（每行 '<bytes> <cdf>'）")
+    parser.add_argument("--load", type=float, default=0.5, help="每个 host 接入链路的目标负载")
+    parser.add_argument("--link-bps", type=float, default=100e6)
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--arrival", choices=sorted(ARRIVALS), default="poisson")
+    parser.add_argument("--burst-mean", type=float, default=8.0)
+    parser.add_argument("--mix", default="0:0.5,1:0.3,2:0.2", help="class mix，priority:weight")
+    parser.add_argument("--class-rate", default="0:5e6,1:10e6,2:20e6",
+                        help="每个 class 的 request_rate_bps，priority:bps")
+    parser.add_argument("--workers", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="workload_latency.csv")
+    parser.add_argument("--dry-run", action="store_true", help="只生成时间表并打印统计")
+    args = parser.parse_args()
+
+    if args.trace:
+        schedule = load_trace(args.trace)
+    else:
+        hosts = [h for h in args.hosts.split(",") if h]
+        if not hosts:
+            parser.error("--hosts or --trace required")
+        if args.cdf in EmpiricalCDF.BUILTIN:
+            cdf = EmpiricalCDF.builtin(args.cdf)
+        else:
+            cdf = EmpiricalCDF.from_file(args.cdf)
+        class_rate = {k: int(v) for k, v in parse_mix_raw(args.class_rate).items()}
+        kw = {"burst_mean": args.burst_mean} if args.arrival == "bursty" else {}
+        schedule = build_schedule(hosts, cdf, args.load, args.link_bps, args.duration,
+                                  parse_mix(args.mix), class_rate, args.arrival, args.seed, **kw)
+
+    total_bytes = sum(spec["size_bytes"] for _, spec in schedule)
+    span = schedule[-1][0] if schedule else 0.0
+    print(f"[workload] requests={len(schedule)} span={span:.1f}s "
+          f"offered={total_bytes * 8 / max(span, 1e-9) / 1e6:.1f}Mbps")
+    if args.dry_run or not schedule:
+        return
+
+    ctrl_ip, ctrl_port = args.ctrl.rsplit(":", 1)
+    # 连接池大小跟派发线程数一致，开环派发不会被连接数卡住
+    client = HttpClient(max_conns=args.workers)
+    driver = OpenLoopDriver(rest_submitter(ctrl_ip, int(ctrl_port), client), workers=args.workers)
+    driver.run(schedule)
+    driver.write_csv(args.out)
+    print(f"[workload] {json.dumps(driver.summary())} -> {args.out}")
+    print(f"[workload] http {json.dumps(client.stats())}")
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目的 host 选择基准：N 个已注册 host
+  - legacy       : 原 pick_dst_for_flow，每次拷贝候选列表 + random.choice
+  - random/p2c/least_loaded : DstSelector
+
+稳态模拟：保持 active 条流在跑，每挑一个新目的就随机结束一条旧流；
+输出每次选择耗时，以及结束时各 host 入向负载的 max / mean（越接近 1 越均衡）。
+
+用法：
+    python tools/bench_dst_select.py --hosts 10000 --picks 200000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "controller"))
+
+from dst_selector import DstSelector  # noqa: E402
+
+
+class LegacyPicker:
+    """原实现：遍历 host 表拷出候选列表再 random.choice"""
+
+    def __init__(self, rng):
+        self.hosts = {}
+        self.rng = rng
+        self.load = {}
+
+    def add(self, ip):
+        self.hosts[ip] = (9000, 5201)
+        self.load[ip] = 0
+
+    def pick(self, src_ip, need_bps=0):
+        candidates = [(ip, info[1]) for ip, info in self.hosts.items() if ip != src_ip]
+        return self.rng.choice(candidates)[0] if candidates else None
+
+    def add_load(self, ip, bps):
+        self.load[ip] += bps
+
+    def release_load(self, ip, bps):
+        self.load[ip] -= bps
+
+
+def run(name, picker, hosts, picks, active, rng):
+    for ip in hosts:
+        picker.add(ip)
+    running = []
+    t0 = time.perf_counter()
+    for _ in range(picks):
+        src = hosts[rng.randrange(len(hosts))]
+        need = rng.choice((1_000_000, 5_000_000, 10_000_000))
+        dst = picker.pick(src, need)
+        picker.add_load(dst, need)
+        running.append((dst, need))
+        if len(running) > active:
+            i = rng.randrange(len(running))
+            running[i], running[-1] = running[-1], running[i]
+            old_dst, old_need = running.pop()
+            picker.release_load(old_dst, old_need)
+    elapsed = time.perf_counter() - t0
+
+    loads = [picker.load[ip] if isinstance(picker, LegacyPicker) else picker.load(ip) for ip in hosts]
+    mean = sum(loads) / len(loads)
+    # legacy 缩短了模拟规模，负载分布和 random 相同，不看均衡度
+    balance = "n/a" if isinstance(picker, LegacyPicker) else f"{max(loads) / mean:.2f}"
+    print(f"[{name:12s}] pick={elapsed / picks * 1e6:8.2f}us max/mean in_load={balance}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="目的 host 选择基准")
+    parser.add_argument("--hosts", type=int, default=10_000)
+    parser.add_argument("--picks", type=int, default=200_000)
+    parser.add_argument("--active", type=int, default=50_000, help="稳态同时在跑的流数")
+    args = parser.parse_args()
+
+    hosts = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(1, args.hosts + 1)]
+    # legacy 每次 O(N)，少跑一点
+    run("legacy", LegacyPicker(random.Random(1)), hosts,
+        max(1, args.picks // 20), args.active // 20, random.Random(2))
+    for mode in DstSelector.MODES:
+        run(mode, DstSelector(mode, rng=random.Random(1)), hosts,
+            args.picks, args.active, random.Random(2))
+
+
+if __name__ == "__main__":
+    main()
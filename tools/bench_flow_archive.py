@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+控制器内存增长基准：N 条已结束 flow
+  - keep   : 全部留在 flows dict 里（旧行为）
+  - archive: 结束后写入 FlowArchive，只保留索引
+
+用法：
+    python tools/bench_flow_archive.py --flows 1000000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "controller"))
+
+from models import Flow  # noqa: E402
+from flow_archive import FlowArchive  # noqa: E402
+
+
+PATHS = [
+    [(1, 2), (2, 3)],
+    [(2, 1), (1, 1)],
+    [(1, 2), (2, 2), (3, 2)],
+    [(3, 1), (2, 1), (1, 1)],
+]
+
+
+def make_finished_flow(i: int) -> Flow:
+    path = PATHS[i % len(PATHS)]
+    flow = Flow(
+        id=i + 1,
+        src_ip=f"172.17.0.{101 + i % 3}",
+        dst_ip=f"172.17.0.{101 + (i + 1) % 3}",
+        src_port=20000 + i % 10000,
+        dst_port=30000 + i % 10000,
+        request_rate_bps=5_000_000,
+        size_bytes=10_000_000,
+        priority=i % 3,
+        reason="",
+    )
+    now = time.time()
+    flow.path = list(path)
+    flow.send_rate_bps = flow.request_rate_bps
+    flow.allowed_at = now
+    flow.finished_at = now
+    flow.status = "finished"
+    for dpid, _ in path:
+        flow.hop_bytes[dpid] = flow.size_bytes
+        flow.hop_last_time[dpid] = now
+        flow.hop_rate_bps[dpid] = flow.request_rate_bps
+    return flow
+
+
+def bench_keep(n: int):
+    tracemalloc.start()
+    flows = {}
+    t0 = time.time()
+    for i in range(n):
+        flow = make_finished_flow(i)
+        flows[flow.id] = flow
+    elapsed = time.time() - t0
+    cur, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cur, elapsed, len(flows)
+
+
+def bench_archive(n: int, log_root: str):
+    tracemalloc.start()
+    archive = FlowArchive(log_root)
+    t0 = time.time()
+    for i in range(n):
+        archive.append(make_finished_flow(i))
+    archive.flush()
+    elapsed = time.time() - t0
+    cur, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    t1 = time.time()
+    lookups = min(n, 10000)
+    step = max(1, n // lookups)
+    for fid in range(1, n + 1, step):
+        assert archive.lookup(fid) is not None
+    lookup_us = (time.time() - t1) / lookups * 1e6
+    size = archive.disk_bytes()
+    archive.close()
+    return cur, elapsed, lookup_us, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="finished-flow 内存增长基准")
+    parser.add_argument("--flows", "-n", type=int, default=1_000_000)
+    args = parser.parse_args()
+    n = args.flows
+
+    keep_mem, keep_t, _ = bench_keep(n)
+    print(f"[keep]    flows={n} mem={keep_mem / 1e6:.1f}MB "
+          f"({keep_mem / n:.0f} B/flow) build={keep_t:.1f}s")
+
+    with tempfile.TemporaryDirectory() as d:
+        arc_mem, arc_t, lookup_us, size = bench_archive(n, d)
+    print(f"[archive] flows={n} mem={arc_mem / 1e6:.1f}MB "
+          f"({arc_mem / n:.0f} B/flow) file={size / 1e6:.1f}MB "
+          f"append={arc_t:.1f}s lookup={lookup_us:.1f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+models.Flow 每条流内存 & 属性访问基准：
+  - dataclass: 原来的 dataclass + 3 个 per-hop dict + released_hops set + list path
+  - slots    : 现在的 __slots__ + array 实现（dict/set 兼容视图 + 直接访问接口）
+
+用法：
+    python tools/bench_flow_model.py --flows 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+import timeit
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "controller"))
+
+from models import Flow  # noqa: E402
+
+
+@dataclass
+class DataclassFlow:
+    """原 models.Flow 的布局，作为对照"""
+    id: int
+    src_ip: str
+    dst_ip: str
+    src_port: int
+    dst_port: int
+    request_rate_bps: int
+    size_bytes: int
+    priority: int
+    reason: str
+    send_rate_bps: int = 0
+    dscp: Optional[int] = None
+    queue_id: Optional[int] = None
+    path: List[Tuple[int, int]] = field(default_factory=list)
+    status: str = "pending"
+    created_at: float = field(default_factory=time.time)
+    allowed_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    hop_bytes: Dict[int, int] = field(default_factory=dict)
+    hop_last_time: Dict[int, float] = field(default_factory=dict)
+    hop_rate_bps: Dict[int, int] = field(default_factory=dict)
+    released_hops: set = field(default_factory=set)
+
+
+PATH = [(1, 2), (2, 2), (3, 2)]
+
+
+def build(cls, n: int):
+    flows = []
+    now = time.time()
+    for i in range(n):
+        flow = cls(id=i + 1, src_ip="172.17.0.101", dst_ip="172.17.0.103",
+                   src_port=20000, dst_port=30000, request_rate_bps=5_000_000,
+                   size_bytes=10_000_000, priority=i % 3, reason="")
+        # path_manager.get_path 每次返回新 list
+        flow.path = list(PATH)
+        for dpid, _ in PATH:
+            flow.hop_bytes[dpid] = 1_000_000 + i
+            flow.hop_last_time[dpid] = now
+            flow.hop_rate_bps[dpid] = 5_000_000
+        flow.released_hops.add(PATH[1][0])
+        flows.append(flow)
+    return flows
+
+
+def measure_memory(cls, n: int) -> float:
+    tracemalloc.start()
+    flows = build(cls, n)
+    cur, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del flows
+    return cur / n
+
+
+def measure_access(cls):
+    flow = build(cls, 1)[0]
+    tests = {
+        "size_bytes": lambda: flow.size_bytes,
+        "hop_bytes.get": lambda: flow.hop_bytes.get(3, 0),
+        "hop_bytes[]=": lambda: flow.hop_bytes.__setitem__(3, 123),
+        "dpid in released": lambda: 2 in flow.released_hops,
+        "path[-1][0]": lambda: flow.path[-1][0],
+    }
+    if hasattr(flow, "set_hop_stats"):
+        # stats_collector 热路径用的直接访问接口
+        tests["get_hop_bytes"] = lambda: flow.get_hop_bytes(3)
+        tests["set_hop_stats"] = lambda: flow.set_hop_stats(3, 123, 1.0, 456)
+        tests["is_hop_released"] = lambda: flow.is_hop_released(2)
+    number = 200_000
+    return {name: min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e9
+            for name, fn in tests.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flow 模型内存/访问基准")
+    parser.add_argument("--flows", "-n", type=int, default=100_000)
+    args = parser.parse_args()
+
+    for name, cls in (("dataclass", DataclassFlow), ("slots", Flow)):
+        per_flow = measure_memory(cls, args.flows)
+        access = measure_access(cls)
+        access_str = " ".join(f"{k}={v:.0f}ns" for k, v in access.items())
+        print(f"[{name:9s}] {per_flow:.0f} B/flow  {access_str}")
+
+
+if __name__ == "__main__":
+    main()
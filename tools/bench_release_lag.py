@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+预留复用基准：flow 发完到控制器释放预留之间的延迟（release lag）对吞吐的影响。
+
+用真实的 AdmissionControl 账本模拟一条 2 跳瓶颈路径，flow 按泊松到达、FIFO 排队，
+能预留就放行，按请求速率发完 size_bytes 后再过 release lag 才释放：
+  - poll        : 只靠 FlowStats 轮询判定结束。字节数到齐的 flow 在下一次轮询释放
+                  （U(0, poll_interval)），有丢包的 flow 要再等 flow_idle_timeout
+  - host_report : 接收端收完最后一个字节立刻 POST /host_report（U(0, report_delay)）
+
+输出每种模式的完成数、平均排队时间，以及预留着但已经不发数据的带宽占比（idle_reserved）。
+
+用法：
+    python tools/bench_release_lag.py --seconds 600 --load 0.95
+"""
+
+import argparse
+import heapq
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "controller"))
+
+from admission_control import AdmissionControl  # noqa: E402
+from models import Flow  # noqa: E402
+
+
+PATH = [(1, 2), (2, 3)]
+
+
+def make_lag(mode: str, args, rng: random.Random):
+    if mode == "host_report":
+        return lambda: rng.uniform(0.0, args.report_delay)
+
+    def poll_lag():
+        lag = rng.uniform(0.0, args.poll_interval)
+        if rng.random() < args.loss_frac:
+            lag += args.idle_timeout
+        return lag
+    return poll_lag
+
+
+def run(mode: str, args, log_root: str):
+    rng = random.Random(args.seed)
+    arr_rng = random.Random(args.seed + 1)
+    lag_of = make_lag(mode, args, rng)
+    cap = args.capacity_mbps * 1_000_000
+    rate = args.rate_mbps * 1_000_000
+    size = args.size_mb * 1_000_000
+    tx_s = size * 8 / rate
+    # 到达率：offered load = λ * tx_s * rate / cap
+    lam = args.load * cap / (rate * tx_s)
+
+    ac = AdmissionControl({hop: cap for hop in PATH}, log_root)
+    events = []          # (t, seq, kind, flow)
+    seq = 0
+    queue = []
+    waits = []
+    done = 0
+    reserved_s = 0.0     # 预留带宽 * 时间
+    idle_s = 0.0         # 其中 flow 已经发完、还没释放的部分
+
+    t = arr_rng.expovariate(lam)
+    fid = 0
+    while t < args.seconds:
+        fid += 1
+        flow = Flow(id=fid, src_ip="10.0.0.1", dst_ip="10.0.0.2", src_port=20000,
+                    dst_port=30000 + fid % 10000, request_rate_bps=rate,
+                    size_bytes=size, priority=0, reason="")
+        flow.created_at = t
+        heapq.heappush(events, (t, seq, "arrive", flow))
+        seq += 1
+        t += arr_rng.expovariate(lam)
+
+    def try_admit(now):
+        nonlocal seq
+        while queue:
+            flow = queue[0]
+            ok, send_rate, _ = ac.can_admit(flow, PATH)
+            if not ok:
+                return
+            queue.pop(0)
+            flow.path = PATH
+            flow.send_rate_bps = send_rate
+            ac.reserve(flow, PATH)
+            waits.append(now - flow.created_at)
+            lag = lag_of()
+            heapq.heappush(events, (now + tx_s + lag, seq, "release", flow))
+            seq += 1
+            flow.allowed_at = now
+            flow.finished_at = now + tx_s
+
+    while events:
+        now, _, kind, flow = heapq.heappop(events)
+        if now > args.seconds:
+            break
+        if kind == "arrive":
+            queue.append(flow)
+        else:
+            ac.release(flow)
+            done += 1
+            reserved_s += (now - flow.allowed_at) * flow.send_rate_bps
+            idle_s += (now - flow.finished_at) * flow.send_rate_bps
+        try_admit(now)
+
+    mean_wait = sum(waits) / len(waits) if waits else 0.0
+    return done, fid, mean_wait, len(queue), idle_s / reserved_s if reserved_s else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="release lag 对预留复用的影响")
+    parser.add_argument("--seconds", type=float, default=600.0)
+    parser.add_argument("--load", type=float, default=0.95, help="offered load / capacity")
+    parser.add_argument("--capacity-mbps", type=int, default=100)
+    parser.add_argument("--rate-mbps", type=int, default=10)
+    parser.add_argument("--size-mb", type=float, default=5.0)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--idle-timeout", type=float, default=3.0)
+    parser.add_argument("--loss-frac", type=float, default=0.2,
+                        help="poll 模式下字节数到不齐、只能靠空闲判定的 flow 比例")
+    parser.add_argument("--report-delay", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    base = None
+    with tempfile.TemporaryDirectory() as d:
+        for mode in ("poll", "host_report"):
+            done, arrived, wait, backlog, idle = run(mode, args, os.path.join(d, mode))
+            if base is None:
+                base = done
+            print(f"[{mode:11s}] arrived={arrived} finished={done} "
+                  f"({(done / base - 1) * 100:+.1f}%) mean_wait={wait:.2f}s "
+                  f"backlog={backlog} idle_reserved={idle * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+逐跳尾部定时器基准：N 条活跃 flow，每条 hops 个定时器
+  - arm   : 首次 schedule
+  - rearm : 每轮 FlowStats 回复后重新 schedule（覆盖旧定时）
+  - tick  : 按 0.1s 推进时间轮直到全部触发
+
+用法：
+    python tools/bench_timer_wheel.py --flows 100000 --hops 2
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "controller"))
+
+from timer_wheel import HashedTimerWheel  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HashedTimerWheel 基准")
+    parser.add_argument("--flows", "-n", type=int, default=100_000)
+    parser.add_argument("--hops", type=int, default=2)
+    parser.add_argument("--horizon", type=float, default=60.0, help="ETA 均匀分布在 [0, horizon] 秒")
+    args = parser.parse_args()
+
+    rnd = random.Random(1)
+    start = 1_000_000.0
+    wheel = HashedTimerWheel(tick=0.05, n_slots=512, start=start)
+    keys = [(fid, k) for fid in range(1, args.flows + 1) for k in range(1, args.hops + 1)]
+    n = len(keys)
+
+    t0 = time.perf_counter()
+    for key in keys:
+        wheel.schedule(key, start + rnd.uniform(0, args.horizon))
+    arm_us = (time.perf_counter() - t0) / n * 1e6
+
+    t0 = time.perf_counter()
+    for key in keys:
+        wheel.schedule(key, start + rnd.uniform(0, args.horizon))
+    rearm_us = (time.perf_counter() - t0) / n * 1e6
+
+    fired = 0
+    ticks = 0
+    worst = 0.0
+    now = start
+    t0 = time.perf_counter()
+    while len(wheel):
+        now += 0.1
+        t1 = time.perf_counter()
+        fired += len(wheel.advance(now))
+        worst = max(worst, time.perf_counter() - t1)
+        ticks += 1
+    total = time.perf_counter() - t0
+
+    print(f"timers={n} arm={arm_us:.2f}us rearm={rearm_us:.2f}us "
+          f"advance: ticks={ticks} avg={total / ticks * 1e3:.2f}ms worst={worst * 1e3:.2f}ms "
+          f"fired={fired}")
+
+
+if __name__ == "__main__":
+    main()
@@ -19,23 +19,45 @@
 4. 画两张图：
    - 图1：rate(Mbps) vs time，标出各种事件的竖线
    - 图2：sent(MB) vs time，同样标出事件
+
+也可以加 --controller http://<ryu>:8080，直接从控制器的
+/scheduler/telemetry/flow/<flow_id> 读最后一跳的时序数据（二进制格式），
+不再用正则解析 progress.log。
+
+run_log_format=segmented 的 run（有 <run_dir>/RunLog/）自动改用 RunLogReader
+按 flow_id 查索引、seek 读记录，不再找 per-flow 的目录和文件。
 """
 
 import argparse
 import os
 import re
+import struct
+import sys
+import urllib.request
 from datetime import datetime
 
 import matplotlib.pyplot as plt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "controller"))
+
+from run_log import RunLogReader  # noqa: E402
+
 
 # FlowProgress 日志的时间戳格式：2025-11-28 21:33:41 ...
 TS_FMT = "%Y-%m-%d %H:%M:%S"
 
 
-def parse_flow_progress(progress_log_path: str, flow_id: int):
+def _read_lines(source):
+    """source 是日志文件路径，或者已经读好的行列表（RunLogReader.lines）"""
+    if isinstance(source, str):
+        with open(source, "r", encoding="utf-8") as f:
+            return f.read().splitlines()
+    return source
+
+
+def parse_flow_progress(progress_log_path, flow_id: int):
     """
-    解析 FlowProgress/<flow_id>/progress.log
+    解析 FlowProgress/<flow_id>/progress.log（也可以直接传行列表）
 
     返回：
         times:      [datetime, ...]
@@ -78,86 +100,85 @@ def parse_flow_progress(progress_log_path: str, flow_id: int):
     cur_rate = None
     cur_status = None
 
-    with open(progress_log_path, "r", encoding="utf-8") as f:
-        for raw in f:
-            line = raw.rstrip("\n")
-
-            # 1) TailRelease 单独记录
-            m_tail = tail_re.match(line)
-            if m_tail:
-                ts_str, fid_str = m_tail.groups()
-                fid = int(fid_str)
-                if fid == flow_id:
-                    tail_events.append(datetime.strptime(ts_str, TS_FMT))
-                # TailRelease 行不参与 sent/rate 提取，继续下一行
-                continue
-
-            # 2) FlowProgress 头：更新当前时间戳 & flow_id 检查
-            m_header = header_re.match(line)
-            if m_header:
-                ts_str, fid_str = m_header.groups()
-                fid = int(fid_str)
-                if fid != flow_id:
-                    # 其他 flow 的日志，直接跳过
-                    cur_ts = None
-                    continue
-                cur_ts = datetime.strptime(ts_str, TS_FMT)
-                cur_sent = None
-                cur_rate = None
-                cur_status = None
-                continue
-
-            if cur_ts is None:
-                # 当前不在指定 flow 的 block 里
-                continue
-
-            # 3) sent 行
-            m_sent = sent_re.match(line)
-            if m_sent:
-                sent_val_str, _total_str = m_sent.groups()
-                try:
-                    cur_sent = float(sent_val_str)
-                except ValueError:
-                    cur_sent = None
-                continue
-
-            # 4) rate 行
-            m_rate = rate_re.match(line)
-            if m_rate:
-                rate_val_str = m_rate.group(1)
-                try:
-                    cur_rate = float(rate_val_str)
-                except ValueError:
-                    cur_rate = None
-                # 注意：不要在这里 return，后面还有 status 行
-                # 我们选择在看到 status 行之后才 append 一次数据点
-                continue
-
-            # 5) hop_bytes + status 行
-            m_status = status_re.match(line)
-            if m_status:
-                cur_status = m_status.group(1)
-
-                # 到了 block 的最后一行（包含 status），再统一 append：
-                if (cur_sent is not None) and (cur_rate is not None):
-                    times.append(cur_ts)
-                    sent_mb.append(cur_sent)
-                    rate_mbps.append(cur_rate)
-                    status_list.append(cur_status)
-
-                # 当前 block 结束，等待下一个 FlowProgress
+    for raw in _read_lines(progress_log_path):
+        line = raw.rstrip("\n")
+
+        # 1) TailRelease 单独记录
+        m_tail = tail_re.match(line)
+        if m_tail:
+            ts_str, fid_str = m_tail.groups()
+            fid = int(fid_str)
+            if fid == flow_id:
+                tail_events.append(datetime.strptime(ts_str, TS_FMT))
+            # TailRelease 行不参与 sent/rate 提取，继续下一行
+            continue
+
+        # 2) FlowProgress 头：更新当前时间戳 & flow_id 检查
+        m_header = header_re.match(line)
+        if m_header:
+            ts_str, fid_str = m_header.groups()
+            fid = int(fid_str)
+            if fid != flow_id:
+                # 其他 flow 的日志，直接跳过
                 cur_ts = None
+                continue
+            cur_ts = datetime.strptime(ts_str, TS_FMT)
+            cur_sent = None
+            cur_rate = None
+            cur_status = None
+            continue
+
+        if cur_ts is None:
+            # 当前不在指定 flow 的 block 里
+            continue
+
+        # 3) sent 行
+        m_sent = sent_re.match(line)
+        if m_sent:
+            sent_val_str, _total_str = m_sent.groups()
+            try:
+                cur_sent = float(sent_val_str)
+            except ValueError:
                 cur_sent = None
+            continue
+
+        # 4) rate 行
+        m_rate = rate_re.match(line)
+        if m_rate:
+            rate_val_str = m_rate.group(1)
+            try:
+                cur_rate = float(rate_val_str)
+            except ValueError:
                 cur_rate = None
-                cur_status = None
-                continue
+            # 注意：不要在这里 return，后面还有 status 行
+            # 我们选择在看到 status 行之后才 append 一次数据点
+            continue
+
+        # 5) hop_bytes + status 行
+        m_status = status_re.match(line)
+        if m_status:
+            cur_status = m_status.group(1)
+
+            # 到了 block 的最后一行（包含 status），再统一 append：
+            if (cur_sent is not None) and (cur_rate is not None):
+                times.append(cur_ts)
+                sent_mb.append(cur_sent)
+                rate_mbps.append(cur_rate)
+                status_list.append(cur_status)
+
+            # 当前 block 结束，等待下一个 FlowProgress
+            cur_ts = None
+            cur_sent = None
+            cur_rate = None
+            cur_status = None
+            continue
 
     return times, sent_mb, rate_mbps, status_list, tail_events
 
 
-def parse_flow_portstate(flow_portstate_log_path: str, flow_id: int):
+def parse_flow_portstate(flow_portstate_log_path, flow_id: int):
     """
-    解析 Flow_PortState/<flow_id>.log
+    解析 Flow_PortState/<flow_id>.log（也可以直接传行列表）
 
     返回一个 dict:
         {
@@ -176,30 +197,63 @@ def parse_flow_portstate(flow_portstate_log_path: str, flow_id: int):
         "PortReleaseSingle": [],
     }
 
-    if not os.path.isfile(flow_portstate_log_path):
+    if isinstance(flow_portstate_log_path, str) and not os.path.isfile(flow_portstate_log_path):
         # 没开 Flow_PortState 功能也没关系，仅返回空事件
         return events
 
     # 通用：时间戳在最前面
     ts_header_re = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) \[(\w+)\]")
 
-    with open(flow_portstate_log_path, "r", encoding="utf-8") as f:
-        for raw in f:
-            line = raw.rstrip("\n")
-            m = ts_header_re.match(line)
-            if not m:
-                continue
+    for raw in _read_lines(flow_portstate_log_path):
+        line = raw.rstrip("\n")
+        m = ts_header_re.match(line)
+        if not m:
+            continue
 
-            ts_str, tag = m.groups()
-            if tag not in events:
-                continue
+        ts_str, tag = m.groups()
+        if tag not in events:
+            continue
 
-            ts = datetime.strptime(ts_str, TS_FMT)
-            events[tag].append(ts)
+        ts = datetime.strptime(ts_str, TS_FMT)
+        events[tag].append(ts)
 
     return events
 
 
+# 与 controller/telemetry_store.py 的 to_binary 保持一致
+TELEMETRY_HEADER = struct.Struct("<4sHHI")
+
+
+def fetch_flow_telemetry(controller_url: str, flow_id: int):
+    """
+    从控制器 REST 读取该 flow 最后一跳的时序数据。
+
+    返回：
+        times:     [datetime, ...]
+        sent_mb:   [float, ...]
+        rate_mbps: [float, ...]
+    """
+    url = f"{controller_url.rstrip('/')}/scheduler/telemetry/flow/{flow_id}?format=bin"
+    with urllib.request.urlopen(url, timeout=5.0) as resp:
+        buf = resp.read()
+
+    magic, _version, ncols, nrows = TELEMETRY_HEADER.unpack_from(buf, 0)
+    if magic != b"TSR1":
+        raise ValueError(f"unexpected telemetry payload: {buf[:64]!r}")
+    row_fmt = "<" + "d" * (ncols + 1)
+    row = struct.Struct(row_fmt)
+
+    times, sent_mb, rate_mbps = [], [], []
+    offset = TELEMETRY_HEADER.size
+    for _ in range(nrows):
+        ts, byte_count, rate_bps = row.unpack_from(buf, offset)[:3]
+        offset += row.size
+        times.append(datetime.fromtimestamp(ts))
+        sent_mb.append(byte_count / 1e6)
+        rate_mbps.append(rate_bps / 1e6)
+    return times, sent_mb, rate_mbps
+
+
 def plot_flow(times, sent_mb, rate_mbps,
               status_list,
               tail_events,
@@ -326,42 +380,70 @@ def main():
         "--flow-id", "-f", type=int, required=True,
         help="要分析的 flow_id，例如 20000",
     )
+    parser.add_argument(
+        "--controller", "-c", default=None,
+        help="控制器 REST 地址，例如 http://172.17.0.1:8080；给了就从 telemetry 接口读数据",
+    )
     args = parser.parse_args()
 
     run_dir = args.run_dir
     flow_id = args.flow_id
 
-    # 构造日志路径
-    progress_log_path = os.path.join(
-        run_dir, "FlowProgress", str(flow_id), "progress.log"
-    )
-    portstate_log_path = os.path.join(
-        run_dir, "Flow_PortState", f"{flow_id}.log"
-    )
+    # 构造日志路径；segmented 格式的 run 从 RunLog 里按 flow_id 取行
+    runlog_root = os.path.join(run_dir, "RunLog")
+    if RunLogReader.exists(os.path.join(runlog_root, "progress")):
+        print(f"[INFO] 使用 RunLog: {runlog_root}")
+        progress_src = RunLogReader(os.path.join(runlog_root, "progress")).lines(flow_id)
+        portstate_root = os.path.join(runlog_root, "portstate")
+        portstate_src = (RunLogReader(portstate_root).lines(flow_id)
+                         if RunLogReader.exists(portstate_root) else [])
+        have_progress = bool(progress_src)
+        have_portstate = bool(portstate_src)
+        progress_desc = portstate_desc = runlog_root
+    else:
+        progress_src = os.path.join(
+            run_dir, "FlowProgress", str(flow_id), "progress.log"
+        )
+        portstate_src = os.path.join(
+            run_dir, "Flow_PortState", f"{flow_id}.log"
+        )
+        have_progress = os.path.isfile(progress_src)
+        have_portstate = os.path.isfile(portstate_src)
+        progress_desc, portstate_desc = progress_src, portstate_src
+
+    if args.controller:
+        print(f"[INFO] 使用控制器 telemetry: {args.controller}")
+        times, sent_mb, rate_mbps = fetch_flow_telemetry(args.controller, flow_id)
+        status_list = []
+        # TailRelease 事件仍然只在 progress.log 里
+        tail_events = []
+        if have_progress:
+            tail_events = parse_flow_progress(progress_src, flow_id)[4]
+    else:
+        if not have_progress:
+            print(f"找不到 flow {flow_id} 的 progress 日志: {progress_desc}")
+            return
 
-    if not os.path.isfile(progress_log_path):
-        print(f"找不到 progress.log: {progress_log_path}")
-        return
+        print(f"[INFO] 使用 FlowProgress 日志: {progress_desc}")
 
-    print(f"[INFO] 使用 FlowProgress 日志: {progress_log_path}")
-    if os.path.isfile(portstate_log_path):
-        print(f"[INFO] 使用 Flow_PortState 日志: {portstate_log_path}")
-    else:
-        print(f"[WARN] 没找到 Flow_PortState 日志: {portstate_log_path}")
+        # 解析 FlowProgress
+        (times,
+         sent_mb,
+         rate_mbps,
+         status_list,
+         tail_events) = parse_flow_progress(progress_src, flow_id)
 
-    # 解析 FlowProgress
-    (times,
-     sent_mb,
-     rate_mbps,
-     status_list,
-     tail_events) = parse_flow_progress(progress_log_path, flow_id)
+    if have_portstate:
+        print(f"[INFO] 使用 Flow_PortState 日志: {portstate_desc}")
+    else:
+        print(f"[WARN] 没找到 Flow_PortState 日志: {portstate_desc}")
 
     if not times:
-        print("没有从 progress.log 解析到任何数据，确认 flow_id 是否正确。")
+        print("没有解析到任何数据，确认 flow_id 是否正确。")
         return
 
     # 解析 Flow_PortState
-    port_events = parse_flow_portstate(portstate_log_path, flow_id)
+    port_events = parse_flow_portstate(portstate_src, flow_id)
 
     # 画图
     plot_flow(times, sent_mb, rate_mbps,